@@ -1,5 +1,6 @@
 import os
 import logging
+import click
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import urlparse
@@ -15,10 +16,59 @@ from .structured_log import get_request_ip
 from .db import (
     get_db,
     init_connection_pool,
+    init_request_db,
     ensure_default_user,
     ensure_default_admin,
     ensure_post_thread_controls_schema,
+    ensure_post_stats_schema,
+    ensure_reaction_schema,
+    ensure_reply_stats_schema,
+    ensure_user_stats_schema,
+    ensure_feed_schema,
+    ensure_media_schema,
+    ensure_search_schema,
+    ensure_timeline_schema,
 )
+from .feed import (
+    DEFAULT_AVATAR_URL,
+    load_comments_page,
+    load_feed,
+    parse_comments_cursor,
+    parse_feed_cursor,
+    serialize_post_card,
+)
+from .events import TooManyStreams, init_event_broker, publish_event, stream_events
+from .fragments import init_fragment_cache, prefetch_post_fragments
+from .groups import (
+    add_group_members,
+    can_view_thread,
+    eligible_participants,
+    group_member_ids,
+    viewer_group_ids,
+)
+from .hashing import PasswordHashingBusy, calibrate_argon2, init_password_hashing
+from .images import avatar_srcset, collect_unreferenced_media, init_image_pipeline
+from .search import parse_search_cursor, search_posts, search_users
+from .stats import (
+    adjust_post_stats,
+    adjust_user_stats,
+    create_post_stats,
+    delete_post_stats,
+    rebuild_post_stats,
+    rebuild_reply_stats,
+    rebuild_user_stats,
+)
+from .notifications import parse_mentions, record_reply_notifications, resolve_mentions
+from .reactions import (
+    LIKE,
+    init_reaction_types,
+    post_like_count,
+    reaction_types,
+    reply_like_count,
+    set_post_like,
+    set_reply_like,
+)
+from .timeline import fan_out_post, fanout_enabled, rebuild_timelines, remove_post_from_timelines
 
 login_failures = Counter(
     "echo_login_failures_total",
@@ -66,7 +116,13 @@ def create_app(test_config: dict | None = None) -> Flask:
 
     limiter.init_app(app)
 
-    metrics = PrometheusMetrics(app, group_by="endpoint")
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Pre-fork server: the master process serves /metrics aggregated
+        # across workers (see app/server.py).
+        from prometheus_flask_exporter.multiprocess import GunicornPrometheusMetrics
+        metrics = GunicornPrometheusMetrics(app, group_by="endpoint")
+    else:
+        metrics = PrometheusMetrics(app, group_by="endpoint")
     metrics.info("echo_app_info", "Echo application info", version="1.0")
     
     log_level = getattr(logging, app.config.get("LOG_LEVEL", "INFO"))
@@ -82,10 +138,25 @@ def create_app(test_config: dict | None = None) -> Flask:
         if env == "development":
             ensure_default_admin(app)
         ensure_post_thread_controls_schema(app)
+        ensure_post_stats_schema(app)
+        ensure_reply_stats_schema(app)
+        ensure_reaction_schema(app)
+        ensure_user_stats_schema(app)
+        ensure_feed_schema(app)
+        ensure_timeline_schema(app)
+        ensure_search_schema(app)
+        ensure_media_schema(app)
+        init_reaction_types(app)
     except Exception as e:
         logger.error(f"Failed to initialize database connection: {e}")
         if app.config.get("ENV") == "production":
             raise
+    init_request_db(app)
+    init_fragment_cache(app)
+    init_password_hashing(app)
+    init_image_pipeline(app)
+    init_event_broker(app)
+
     @app.template_filter("fmt_dt")
     def fmt_dt(value) -> str:
         """
@@ -110,13 +181,20 @@ def create_app(test_config: dict | None = None) -> Flask:
     login_manager.session_protection = "strong"
     login_manager.init_app(app)
 
-    from .auth import load_user_by_id
+    from .auth import configure_user_cache, load_cached_user
     from .auth_routes import auth_bp
+    from .notification_routes import notification_bp
+    from .notifications import configure_notification_cache
+    from .profile import configure_profile_page_cache
     from .profile_routes import profile_bp
 
+    configure_user_cache(app)
+    configure_profile_page_cache(app)
+    configure_notification_cache(app)
+
     @login_manager.user_loader
     def load_user(user_id: str):
-        return load_user_by_id(user_id)
+        return load_cached_user(user_id)
 
     @login_manager.unauthorized_handler
     def handle_unauthorized():
@@ -128,6 +206,7 @@ def create_app(test_config: dict | None = None) -> Flask:
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(profile_bp)
+    app.register_blueprint(notification_bp)
 
     auth_rate_limits = {
         "auth.login": app.config["RATELIMIT_LOGIN"],
@@ -138,6 +217,88 @@ def create_app(test_config: dict | None = None) -> Flask:
         if view_func is not None:
             app.view_functions[endpoint] = limiter.limit(limit_value, methods=["POST"])(view_func)
 
+    @app.cli.command("rebuild-post-stats")
+    def rebuild_post_stats_command():
+        """Recompute PostStats and ReplyStats counters from the source tables."""
+        rebuilt = rebuild_post_stats(app)
+        click.echo(f"Rebuilt stats for {rebuilt} posts")
+        rebuilt = rebuild_reply_stats(app)
+        click.echo(f"Rebuilt stats for {rebuilt} replies")
+
+    @app.cli.command("rebuild-user-stats")
+    def rebuild_user_stats_command():
+        """Recompute UserStats counters from Posts, Followers and Notifications (drift repair)."""
+        drifted = rebuild_user_stats(app)
+        click.echo(f"Rebuilt user stats; {drifted} users had drifted counters")
+
+    @app.cli.command("rebuild-timelines")
+    def rebuild_timelines_command():
+        """Recompute fan-out Timelines rows from Followers and Posts."""
+        rebuilt = rebuild_timelines(app)
+        click.echo(f"Rebuilt {rebuilt} timeline entries")
+
+    @app.cli.command("add-reaction-type")
+    @click.argument("name")
+    def add_reaction_type_command(name):
+        """Register a reaction type (e.g. an emoji) by name."""
+        name = name.strip()
+        if not name or len(name) > 255:
+            raise click.BadParameter("must be 1-255 characters", param_hint="NAME")
+        with get_db(app) as conn:
+            reaction_type_id = reaction_types.ensure(conn, name)
+        click.echo(f"Reaction type {name!r}: {reaction_type_id}")
+
+    @app.cli.command("gc-media")
+    @click.option("--min-age-minutes", default=60, show_default=True, help="Keep files younger than this.")
+    @click.option("--dry-run", is_flag=True, help="Only report what would be removed.")
+    def gc_media_command(min_age_minutes, dry_run):
+        """Remove uploaded media files that no Media row references."""
+        removed, kept = collect_unreferenced_media(app, min_age_seconds=min_age_minutes * 60, dry_run=dry_run)
+        action = "Would remove" if dry_run else "Removed"
+        click.echo(f"{action} {removed} unreferenced files, kept {kept}")
+
+    @app.cli.command("calibrate-argon2")
+    @click.option("--target-ms", default=250.0, show_default=True, help="Target verify latency per password.")
+    @click.option("--max-memory-mib", default=64, show_default=True, help="Upper bound for Argon2 memory per hash.")
+    @click.option("--parallelism", type=int, default=None, help="Lanes per hash (default: CPU cores per hashing worker, max 4).")
+    @click.option("--env-file", type=click.Path(dir_okay=False), default=None, help="Write the chosen values into this .env file.")
+    def calibrate_argon2_command(target_ms, max_memory_mib, parallelism, env_file):
+        """Benchmark this host and pick Argon2 parameters for a target verify time."""
+        if parallelism is None:
+            workers = max(1, app.config.get("PASSWORD_HASH_WORKERS", 2))
+            parallelism = max(1, min(4, (os.cpu_count() or 1) // workers))
+        params, elapsed_ms = calibrate_argon2(target_ms, max_memory_mib * 1024, parallelism)
+        settings = {
+            "ARGON2_TIME_COST": params["time_cost"],
+            "ARGON2_MEMORY_COST": params["memory_cost"],
+            "ARGON2_PARALLELISM": params["parallelism"],
+        }
+        click.echo(f"Measured verify time: {elapsed_ms:.0f} ms (target {target_ms:.0f} ms)")
+        for key, value in settings.items():
+            click.echo(f"{key}={value}")
+
+        if env_file:
+            env_path = Path(env_file)
+            lines = env_path.read_text().splitlines() if env_path.exists() else []
+            lines = [line for line in lines if line.split("=", 1)[0].strip() not in settings]
+            lines.extend(f"{key}={value}" for key, value in settings.items())
+            env_path.write_text("\n".join(lines) + "\n")
+            click.echo(f"Wrote settings to {env_path}")
+
+    @app.errorhandler(PasswordHashingBusy)
+    def handle_password_hashing_busy(e):
+        logger.warning(f"Password hashing unavailable: {e}")
+        headers = {"Retry-After": "5"}
+        if request.path.startswith("/api/"):
+            return {"error": "Service busy, try again shortly"}, 503, headers
+        return render_template("error.html", message="Tjänsten är hårt belastad just nu. Försök igen om en stund."), 503, headers
+
+    @app.errorhandler(413)
+    def handle_request_too_large(e):
+        if request.path.startswith("/api/"):
+            return {"error": "Request body too large"}, 413
+        return render_template("error.html", message="Förfrågan är för stor."), 413
+
     @app.errorhandler(429)
     def handle_rate_limit(e):
         from .structured_log import log_rate_limit
@@ -174,30 +335,6 @@ def create_app(test_config: dict | None = None) -> Flask:
         except Exception:
             return False
 
-    def _ensure_like_reaction_type(conn) -> str:
-        """Ensure a 'like' reaction type exists and return its ID."""
-        from uuid import uuid4
-
-        cursor = conn.cursor(cursors.DictCursor)
-        now = datetime.now().isoformat(timespec="seconds")
-        cursor.execute("SELECT reaction_type_id FROM ReactionTypes WHERE name = %s LIMIT 1", ("like",))
-        row = cursor.fetchone()
-        if row and row.get("reaction_type_id"):
-            reaction_type_id = row["reaction_type_id"]
-            cursor.close()
-            return reaction_type_id
-
-        reaction_type_id = str(uuid4())
-        cursor.execute(
-            """
-            INSERT INTO ReactionTypes (reaction_type_id, name, created_at, updated_at)
-            VALUES (%s, %s, %s, %s);
-            """,
-            (reaction_type_id, "like", now, now),
-        )
-        cursor.close()
-        return reaction_type_id
-
     # =================================================
     # Routes
     # =================================================
@@ -205,380 +342,118 @@ def create_app(test_config: dict | None = None) -> Flask:
     @app.route("/")
     def index():
         try:
-            default_avatar_url = "https://images.unsplash.com/photo-1494790108377-be9c29b29330?w=100&h=100&fit=crop"
+            default_avatar_url = DEFAULT_AVATAR_URL
             viewer_id = current_user.get_id() if current_user.is_authenticated else None
             search_query = (request.args.get("q") or "").strip()
-            search_terms = [term for term in search_query.split() if term][:5]
-            search_users = []
-            search_posts = []
+            user_results = []
+            post_results = []
 
             with get_db(app) as conn:
-                cursor = conn.cursor(cursors.DictCursor)
-                cursor.execute(
-                    """
-                    SELECT p.post_id, p.content, p.created_at, p.updated_at,
-                           u.user_id, u.username, u.display_name,
-                           m.url AS profile_image_url,
-                           pm.url AS post_image_url,
-                           COALESCE(rc.reply_count, 0) AS reply_count,
-                           COALESCE(plc.like_count, 0) AS like_count,
-                           COALESCE(p.replies_closed, FALSE) AS replies_closed,
-                           p.replies_closed_at,
-                           p.restricted_group_id,
-                           p.restricted_at,
-                           CASE
-                               WHEN %s IS NULL THEN FALSE
-                               WHEN EXISTS (
-                                   SELECT 1
-                                   FROM Followers f
-                                   WHERE f.follower_id = %s
-                                     AND f.followed_id = p.user_id
-                               ) THEN TRUE
-                               ELSE FALSE
-                           END AS is_followed_author,
-                           CASE
-                               WHEN p.restricted_group_id IS NULL THEN TRUE
-                               WHEN %s IS NULL THEN FALSE
-                               WHEN p.user_id = %s THEN TRUE
-                               WHEN EXISTS (
-                                   SELECT 1
-                                   FROM GroupMembers gm
-                                   WHERE gm.group_id = p.restricted_group_id
-                                     AND gm.user_id = %s
-                               ) THEN TRUE
-                               ELSE FALSE
-                           END AS can_view_replies,
-                           CASE
-                               WHEN p.restricted_group_id IS NOT NULL AND %s IS NOT NULL THEN
-                                   CASE
-                                       WHEN p.user_id = %s THEN TRUE
-                                       WHEN EXISTS (
-                                           SELECT 1
-                                           FROM GroupMembers gm2
-                                           WHERE gm2.group_id = p.restricted_group_id
-                                             AND gm2.user_id = %s
-                                       ) THEN TRUE
-                                       ELSE FALSE
-                                   END
-                               WHEN p.restricted_group_id IS NULL AND COALESCE(p.replies_closed, FALSE) = FALSE THEN TRUE
-                               ELSE FALSE
-                           END AS can_comment_replies,
-                           CASE
-                               WHEN %s IS NULL THEN FALSE
-                               WHEN EXISTS (
-                                   SELECT 1
-                                   FROM Reactions lr
-                                   JOIN ReactionTypes lrt ON lrt.reaction_type_id = lr.reaction_type_id
-                                   WHERE lr.post_id = p.post_id
-                                     AND lr.reply_id IS NULL
-                                     AND lr.user_id = %s
-                                     AND lrt.name = 'like'
-                               ) THEN TRUE
-                               ELSE FALSE
-                           END AS is_liked
-                    FROM Posts p
-                    LEFT JOIN Users u ON p.user_id = u.user_id
-                    LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
-                    LEFT JOIN (
-                        SELECT m1.post_id, m1.url
-                        FROM Media m1
-                        JOIN (
-                            SELECT post_id, MIN(created_at) AS min_created_at
-                            FROM Media
-                            WHERE post_id IS NOT NULL
-                              AND media_type = 'image'
-                              AND is_deleted = FALSE
-                            GROUP BY post_id
-                        ) first_media
-                          ON first_media.post_id = m1.post_id
-                         AND first_media.min_created_at = m1.created_at
-                        WHERE m1.media_type = 'image'
-                          AND m1.is_deleted = FALSE
-                    ) pm ON pm.post_id = p.post_id
-                    LEFT JOIN (
-                        SELECT parent_post_id, COUNT(*) AS reply_count
-                        FROM Replies
-                        WHERE is_deleted = FALSE
-                        GROUP BY parent_post_id
-                    ) rc ON rc.parent_post_id = p.post_id
-                    LEFT JOIN (
-                        SELECT r.post_id, COUNT(DISTINCT r.user_id) AS like_count
-                        FROM Reactions r
-                        JOIN ReactionTypes rt ON rt.reaction_type_id = r.reaction_type_id
-                        WHERE r.post_id IS NOT NULL
-                          AND r.reply_id IS NULL
-                          AND rt.name = 'like'
-                        GROUP BY r.post_id
-                    ) plc ON plc.post_id = p.post_id
-                    WHERE p.is_deleted = FALSE
-                    ORDER BY is_followed_author DESC, p.created_at DESC
-                    LIMIT 50;
-                    """,
-                    (
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                        viewer_id,
-                    ),
+                posts, next_cursor = load_feed(
+                    conn, viewer_id, None, int(app.config.get("FEED_PAGE_SIZE", 50)),
+                    use_timeline=fanout_enabled(app),
+                    reply_preview_limit=int(app.config.get("REPLY_PREVIEW_LIMIT", 5)),
                 )
-                db_posts = cursor.fetchall()
-                post_ids = [
-                    row.get("post_id")
-                    for row in db_posts
-                    if row.get("post_id")
-                ]
-                replies_by_post = {}
-                participants_by_post = {}
-                if post_ids:
-                    placeholders = ", ".join(["%s"] * len(post_ids))
-                    cursor.execute(
-                        f"""
-                        SELECT r.reply_id, r.parent_post_id, r.content, r.created_at,
-                               COALESCE(r.is_private_after_split, FALSE) AS is_private_after_split,
-                               COALESCE(rlc.like_count, 0) AS like_count,
-                               u.user_id, u.username, u.display_name,
-                               m.url AS profile_image_url,
-                               rm.url AS reply_image_url,
-                               CASE
-                                   WHEN %s IS NULL THEN FALSE
-                                   WHEN EXISTS (
-                                       SELECT 1
-                                       FROM Reactions rr
-                                       JOIN ReactionTypes rrt ON rrt.reaction_type_id = rr.reaction_type_id
-                                       WHERE rr.reply_id = r.reply_id
-                                         AND rr.post_id IS NULL
-                                         AND rr.user_id = %s
-                                         AND rrt.name = 'like'
-                                   ) THEN TRUE
-                                   ELSE FALSE
-                               END AS is_liked
-                        FROM Replies r
-                        LEFT JOIN Users u ON r.user_id = u.user_id
-                        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
-                        LEFT JOIN (
-                            SELECT m2.reply_id, m2.url
-                            FROM Media m2
-                            JOIN (
-                                SELECT reply_id, MIN(created_at) AS min_created_at
-                                FROM Media
-                                WHERE reply_id IS NOT NULL
-                                  AND media_type = 'image'
-                                  AND is_deleted = FALSE
-                                GROUP BY reply_id
-                            ) first_reply_media
-                              ON first_reply_media.reply_id = m2.reply_id
-                             AND first_reply_media.min_created_at = m2.created_at
-                            WHERE m2.media_type = 'image'
-                              AND m2.is_deleted = FALSE
-                        ) rm ON rm.reply_id = r.reply_id
-                        LEFT JOIN (
-                            SELECT rx.reply_id, COUNT(DISTINCT rx.user_id) AS like_count
-                            FROM Reactions rx
-                            JOIN ReactionTypes rtx ON rtx.reaction_type_id = rx.reaction_type_id
-                            WHERE rx.reply_id IS NOT NULL
-                              AND rx.post_id IS NULL
-                              AND rtx.name = 'like'
-                            GROUP BY rx.reply_id
-                        ) rlc ON rlc.reply_id = r.reply_id
-                        WHERE r.is_deleted = FALSE AND r.parent_post_id IN ({placeholders})
-                        ORDER BY r.created_at ASC;
-                        """,
-                        (viewer_id, viewer_id, *post_ids),
-                    )
-                    db_replies = cursor.fetchall()
-                    for reply in db_replies:
-                        parent_post_id = reply.get("parent_post_id")
-                        if not parent_post_id:
-                            continue
-                        participant = {
-                            "id": reply.get("user_id"),
-                            "name": reply.get("display_name")
-                            or reply.get("username")
-                            or "Unknown",
-                        }
-                        if participant["id"]:
-                            participants_by_post.setdefault(parent_post_id, {})
-                            participants_by_post[parent_post_id][participant["id"]] = participant
-                        replies_by_post.setdefault(parent_post_id, []).append(
-                            {
-                                "id": reply.get("reply_id"),
-                                "content": reply.get("content"),
-                                "timestamp": reply.get("created_at"),
-                                "imageUrl": reply.get("reply_image_url"),
-                                "isPrivateAfterSplit": bool(reply.get("is_private_after_split")),
-                                "likes": int(reply.get("like_count") or 0),
-                                "isLiked": bool(reply.get("is_liked")),
-                                "author": {
-                                    "id": reply.get("user_id"),
-                                    "name": reply.get("display_name")
-                                    or reply.get("username")
-                                    or "Unknown",
-                                    "avatar": reply.get("profile_image_url") or default_avatar_url,
-                                },
-                            }
-                        )
-
-                if search_terms:
-                    user_conditions = []
-                    user_params = []
-                    for term in search_terms:
-                        like_term = f"%{term}%"
-                        user_conditions.append("(u.username LIKE %s OR COALESCE(u.display_name, '') LIKE %s)")
-                        user_params.extend([like_term, like_term])
-
-                    user_filter_sql = " AND ".join(user_conditions)
-                    exclude_viewer_sql = ""
-                    if viewer_id:
-                        exclude_viewer_sql = "AND u.user_id <> %s"
-                        user_params.append(viewer_id)
 
-                    cursor.execute(
-                        f"""
-                        SELECT u.user_id, u.username, u.display_name, m.url AS profile_image_url
-                        FROM Users u
-                        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
-                        WHERE u.is_deleted = FALSE
-                          {exclude_viewer_sql}
-                          AND {user_filter_sql}
-                        ORDER BY u.created_at DESC
-                        LIMIT 15;
-                        """,
-                        tuple(user_params),
-                    )
-                    search_users = cursor.fetchall()
-
-                    post_conditions = []
-                    post_params = []
-                    for term in search_terms:
-                        like_term = f"%{term}%"
-                        post_conditions.append(
-                            "(p.content LIKE %s OR u.username LIKE %s OR COALESCE(u.display_name, '') LIKE %s)"
-                        )
-                        post_params.extend([like_term, like_term, like_term])
-
-                    post_filter_sql = " AND ".join(post_conditions)
-                    cursor.execute(
-                        f"""
-                        SELECT p.post_id, p.content, p.created_at,
-                               u.user_id, u.username, u.display_name,
-                               m.url AS profile_image_url
-                        FROM Posts p
-                        JOIN Users u ON u.user_id = p.user_id
-                        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
-                        WHERE p.is_deleted = FALSE
-                          AND u.is_deleted = FALSE
-                          AND {post_filter_sql}
-                        ORDER BY p.created_at DESC
-                        LIMIT 20;
-                        """,
-                        tuple(post_params),
-                    )
-                    search_posts = cursor.fetchall()
-                cursor.close()
+                if search_query:
+                    user_results, _ = search_users(conn, search_query, viewer_id, limit=15)
+                    post_results, _ = search_posts(conn, search_query, limit=20)
 
-            posts = []
-            for row in db_posts:
-                display_name = row.get("display_name") or row.get("username") or "Unknown"
-                username = row.get("username") or "unknown"
-                post_id = row.get("post_id")
-                all_replies = replies_by_post.get(post_id, [])
-                can_view_all_replies = bool(row.get("can_view_replies"))
-                restricted_at = row.get("restricted_at")
-                visible_comment_count = 0
-                if can_view_all_replies:
-                    visible_replies = all_replies
-                elif row.get("restricted_group_id"):
-                    visible_replies = [
-                        reply for reply in all_replies if not reply.get("isPrivateAfterSplit")
-                    ]
-                else:
-                    visible_replies = all_replies
-
-                rendered_comments = list(visible_replies)
-                if row.get("restricted_group_id") and restricted_at:
-                    before_split = [reply for reply in all_replies if not reply.get("isPrivateAfterSplit")]
-                    if can_view_all_replies:
-                        after_split = [reply for reply in all_replies if reply.get("isPrivateAfterSplit")]
-                        rendered_comments = before_split + [
-                            {
-                                "isMarker": True,
-                                "label": "Diskussionen bröts ut här",
-                                "timestamp": restricted_at,
-                            }
-                        ] + after_split
-                    else:
-                        rendered_comments = before_split + [
-                            {
-                                "isMarker": True,
-                                "label": "Diskussionen bröts ut här",
-                                "timestamp": restricted_at,
-                            }
-                        ]
-
-                if row.get("replies_closed") and not row.get("restricted_group_id"):
-                    rendered_comments = rendered_comments + [
-                        {
-                            "isMarker": True,
-                            "label": "Svarstråden stängdes här",
-                            "timestamp": row.get("replies_closed_at"),
-                        }
-                    ]
-
-                visible_comment_count = len([reply for reply in rendered_comments if not reply.get("isMarker")])
-
-                posts.append(
-                    {
-                        "id": post_id,
-                        "author": {
-                            "id": row.get("user_id"),
-                            "name": display_name,
-                            "username": username,
-                            "avatar": row.get("profile_image_url") or default_avatar_url,
-                        },
-                        "content": row.get("content"),
-                        "imageUrl": row.get("post_image_url"),
-                        "timestamp": row.get("created_at"),
-                        "likes": int(row.get("like_count") or 0),
-                        "comments": visible_comment_count,
-                        "commentsList": rendered_comments,
-                        "commentParticipants": (
-                            [
-                                participant
-                                for participant in list(participants_by_post.get(post_id, {}).values())
-                                if participant.get("id") != viewer_id
-                            ]
-                            if can_view_all_replies
-                            else []
-                        ),
-                        "threadClosed": bool(row.get("replies_closed")),
-                        "canViewComments": True,
-                        "canComment": bool(row.get("can_comment_replies")),
-                        "threadRestricted": bool(row.get("restricted_group_id")),
-                        "bookmarks": 0,
-                        "isLiked": bool(row.get("is_liked")),
-                        "isBookmarked": False,
-                    }
-                )
-            
+            prefetch_post_fragments(posts)
             return render_template(
                 "index.html",
                 posts=posts,  # Keep variable name for template compatibility
+                next_cursor=next_cursor,
                 default_avatar_url=default_avatar_url,
                 current_user=current_user,
                 search_query=search_query,
-                search_users=search_users,
-                search_posts=search_posts,
+                search_users=user_results,
+                search_posts=post_results,
             )
         except Exception:
             logger.error("Dashboard error", exc_info=True)
             return render_template("error.html", message="Ett fel uppstod. Försök igen."), 500
 
+    @app.route("/api/feed", methods=["GET"])
+    def feed_api():
+        viewer_id = current_user.get_id() if current_user.is_authenticated else None
+        try:
+            cursor_values = parse_feed_cursor(request.args.get("cursor"))
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+        try:
+            with get_db(app) as conn:
+                posts, next_cursor = load_feed(
+                    conn, viewer_id, cursor_values, int(app.config.get("FEED_PAGE_SIZE", 50)),
+                    use_timeline=fanout_enabled(app),
+                    reply_preview_limit=int(app.config.get("REPLY_PREVIEW_LIMIT", 5)),
+                )
+
+            prefetch_post_fragments(posts)
+            return {
+                "posts": [serialize_post_card(post) for post in posts],
+                "next_cursor": next_cursor,
+                "html": render_template("_feed_page.html", posts=posts),
+            }, 200
+        except Exception as e:
+            logger.error(f"Error loading feed page: {e}")
+            return {"error": "Failed to load feed"}, 500
+
+    @app.route("/api/stream", methods=["GET"])
+    @login_required
+    def stream_events_api():
+        """Server-Sent Events with live likes, comments, thread locks and notifications."""
+        broker = app.extensions["event_broker"]
+        try:
+            subscription = broker.subscribe(current_user.get_id())
+        except TooManyStreams:
+            return {"error": "Too many live connections, try again shortly"}, 503, {"Retry-After": "30"}
+
+        response = app.response_class(
+            stream_events(
+                broker,
+                subscription,
+                heartbeat_seconds=app.config.get("EVENT_STREAM_HEARTBEAT_SECONDS", 15),
+                max_seconds=app.config.get("EVENT_STREAM_MAX_SECONDS", 300),
+            ),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Frees the slot even if the client leaves before the first frame.
+        response.call_on_close(lambda: broker.unsubscribe(subscription))
+        return response
+
+    @app.route("/api/search", methods=["GET"])
+    def search_api():
+        search_query = (request.args.get("q") or "").strip()
+        search_type = request.args.get("type", "posts")
+        if search_type not in ("posts", "users"):
+            return {"error": "type must be 'posts' or 'users'"}, 400
+        try:
+            offset = parse_search_cursor(request.args.get("cursor"))
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+        viewer_id = current_user.get_id() if current_user.is_authenticated else None
+        limit = int(app.config.get("SEARCH_PAGE_SIZE", 20))
+        try:
+            with get_db(app) as conn:
+                if search_type == "users":
+                    results, next_cursor = search_users(conn, search_query, viewer_id, limit=limit, offset=offset)
+                else:
+                    results, next_cursor = search_posts(conn, search_query, limit=limit, offset=offset)
+
+            return {
+                "query": search_query,
+                "type": search_type,
+                "results": [serialize_post_card(row) for row in results],
+                "next_cursor": next_cursor,
+            }, 200
+        except Exception as e:
+            logger.error(f"Error searching: {e}")
+            return {"error": "Search failed"}, 500
+
     @app.route("/dashboard")
     def dashboard():
         return index()
@@ -608,6 +483,10 @@ def create_app(test_config: dict | None = None) -> Flask:
                     """,
                     (post_id, user_id, content, now, now),
                 )
+                create_post_stats(cursor, post_id)
+                adjust_user_stats(cursor, user_id, posts=1)
+                if fanout_enabled(app):
+                    fan_out_post(cursor, post_id, user_id, now)
                 cursor.close()
 
             flash("Echo skapad!", "success")
@@ -650,10 +529,11 @@ def create_app(test_config: dict | None = None) -> Flask:
                 cursor.execute(
                     """
                     UPDATE Posts
-                    SET content = %s
+                    SET content = %s,
+                        updated_at = %s
                     WHERE post_id = %s AND user_id = %s AND is_deleted = FALSE;
                     """,
-                    (new_content, post_id, user_id),
+                    (new_content, datetime.now().isoformat(timespec="seconds"), post_id, user_id),
                 )
                 cursor.close()
 
@@ -689,6 +569,10 @@ def create_app(test_config: dict | None = None) -> Flask:
                     """,
                     (post_id, user_id),
                 )
+                if cursor.rowcount:
+                    delete_post_stats(cursor, post_id)
+                    adjust_user_stats(cursor, user_id, posts=-1)
+                    remove_post_from_timelines(cursor, post_id)
                 cursor.close()
 
             flash("Echo borttagen!", "success")
@@ -727,6 +611,10 @@ def create_app(test_config: dict | None = None) -> Flask:
                     """,
                     (post_id, user_id, content, now, now),
                 )
+                create_post_stats(cursor, post_id)
+                adjust_user_stats(cursor, user_id, posts=1)
+                if fanout_enabled(app):
+                    fan_out_post(cursor, post_id, user_id, now)
                 if image_url:
                     media_id = str(uuid4())
                     cursor.execute(
@@ -749,84 +637,63 @@ def create_app(test_config: dict | None = None) -> Flask:
             logger.error(f"Error creating post (api): {e}")
             return {"error": "Failed to create post"}, 500
 
-    @app.route("/api/posts/<post_id>/like", methods=["POST"])
+    @app.route("/api/posts/<post_id>/like", methods=["POST", "PUT", "DELETE"])
     @limiter.limit(lambda: app.config["RATELIMIT_API_INTERACTIONS"])
     @login_required
     def toggle_post_like_api(post_id):
-        from uuid import uuid4
-
+        """PUT likes, DELETE unlikes (both idempotent); POST toggles."""
         user_id = current_user.get_id()
-        now = datetime.now().isoformat(timespec="seconds")
 
         try:
             with get_db(app) as conn:
                 cursor = conn.cursor(cursors.DictCursor)
-                cursor.execute(
-                    "SELECT post_id FROM Posts WHERE post_id = %s AND is_deleted = FALSE LIMIT 1",
-                    (post_id,),
-                )
-                post = cursor.fetchone()
-                if not post:
-                    cursor.close()
-                    return {"error": "Post not found"}, 404
-
-                like_reaction_type_id = _ensure_like_reaction_type(conn)
-                cursor.execute(
-                    """
-                    SELECT reaction_id
-                    FROM Reactions
-                    WHERE user_id = %s
-                      AND post_id = %s
-                      AND reply_id IS NULL
-                      AND reaction_type_id = %s
-                    LIMIT 1;
-                    """,
-                    (user_id, post_id, like_reaction_type_id),
-                )
-                existing = cursor.fetchone()
-                if existing:
-                    cursor.execute(
-                        """
-                        DELETE FROM Reactions
-                        WHERE user_id = %s
-                          AND post_id = %s
-                          AND reply_id IS NULL
-                          AND reaction_type_id = %s;
-                        """,
-                        (user_id, post_id, like_reaction_type_id),
-                    )
-                    is_liked = False
+                like_reaction_type_id = reaction_types.ensure(conn, LIKE)
+                if request.method == "POST":
+                    is_liked = changed = set_post_like(cursor, user_id, post_id, like_reaction_type_id, liked=True)
+                    if not is_liked:
+                        changed = set_post_like(cursor, user_id, post_id, like_reaction_type_id, liked=False)
                 else:
-                    cursor.execute(
-                        """
-                        INSERT INTO Reactions (
-                            reaction_id, user_id, post_id, reply_id, reaction_type_id, created_at, updated_at
-                        )
-                        VALUES (%s, %s, %s, NULL, %s, %s, %s);
-                        """,
-                        (str(uuid4()), user_id, post_id, like_reaction_type_id, now, now),
-                    )
-                    is_liked = True
+                    is_liked = request.method == "PUT"
+                    changed = set_post_like(cursor, user_id, post_id, like_reaction_type_id, liked=is_liked)
 
-                cursor.execute(
-                    """
-                    SELECT COUNT(DISTINCT r.user_id) AS likes
-                    FROM Reactions r
-                    JOIN ReactionTypes rt ON rt.reaction_type_id = r.reaction_type_id
-                    WHERE r.post_id = %s
-                      AND r.reply_id IS NULL
-                      AND rt.name = 'like';
-                    """,
-                    (post_id,),
-                )
-                likes_row = cursor.fetchone() or {}
+                likes = post_like_count(cursor, post_id)
                 cursor.close()
+                if likes is None:
+                    return {"error": "Post not found"}, 404
 
-            return {"post_id": post_id, "likes": int(likes_row.get("likes") or 0), "isLiked": is_liked}, 200
+            if changed:
+                publish_event(app, "like", {"post_id": post_id, "likes": likes})
+            return {"post_id": post_id, "likes": likes, "isLiked": is_liked}, 200
         except Exception as e:
             logger.error(f"Error toggling post like: {e}")
             return {"error": "Failed to toggle like"}, 500
 
+    @app.route("/api/posts/<post_id>/comments", methods=["GET"])
+    def list_comments_api(post_id):
+        viewer_id = current_user.get_id() if current_user.is_authenticated else None
+        try:
+            cursor_values = parse_comments_cursor(request.args.get("cursor"))
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+        try:
+            with get_db(app) as conn:
+                page = load_comments_page(
+                    conn, post_id, viewer_id, cursor_values, int(app.config.get("COMMENTS_PAGE_SIZE", 20))
+                )
+            if page is None:
+                return {"error": "Post not found"}, 404
+
+            comments, next_cursor = page
+            return {
+                "post_id": post_id,
+                "comments": [serialize_post_card(comment) for comment in comments],
+                "next_cursor": next_cursor,
+            }, 200
+        except Exception as e:
+            logger.error(f"Error loading comments: {e}")
+            return {"error": "Failed to load comments"}, 500
+
     @app.route("/api/posts/<post_id>/comments", methods=["POST"])
     @limiter.limit(lambda: app.config["RATELIMIT_API_INTERACTIONS"])
     @login_required
@@ -859,9 +726,9 @@ def create_app(test_config: dict | None = None) -> Flask:
                 cursor = conn.cursor(cursors.DictCursor)
                 cursor.execute(
                     """
-                    SELECT post_id, replies_closed, restricted_group_id, user_id
-                    FROM Posts
-                    WHERE post_id = %s AND is_deleted = FALSE;
+                    SELECT p.post_id, p.replies_closed, p.restricted_group_id, p.user_id
+                    FROM Posts p
+                    WHERE p.post_id = %s AND p.is_deleted = FALSE;
                     """,
                     (post_id,),
                 )
@@ -870,21 +737,9 @@ def create_app(test_config: dict | None = None) -> Flask:
                     cursor.close()
                     return {"error": "Post not found"}, 404
                 is_private_thread = bool(post.get("restricted_group_id"))
-                if is_private_thread:
-                    cursor.execute(
-                        """
-                        SELECT 1
-                        FROM GroupMembers
-                        WHERE group_id = %s AND user_id = %s
-                        LIMIT 1;
-                        """,
-                        (post.get("restricted_group_id"), user_id),
-                    )
-                    is_member = cursor.fetchone() is not None
-                    is_owner = post.get("user_id") == user_id
-                    if not is_member and not is_owner:
-                        cursor.close()
-                        return {"error": "Thread is private after split"}, 403
+                if is_private_thread and not can_view_thread(post, user_id, viewer_group_ids(conn, user_id)):
+                    cursor.close()
+                    return {"error": "Thread is private after split"}, 403
                 if post.get("replies_closed") and not is_private_thread:
                     cursor.close()
                     return {"error": "Thread is closed for replies"}, 403
@@ -898,6 +753,7 @@ def create_app(test_config: dict | None = None) -> Flask:
                     """,
                     (reply_id, post_id, user_id, content, is_private_thread, now, now),
                 )
+                adjust_post_stats(cursor, post_id, replies=1)
                 if image_url:
                     cursor.execute(
                         """
@@ -907,18 +763,32 @@ def create_app(test_config: dict | None = None) -> Flask:
                         (str(uuid4()), reply_id, image_url, "image", now, now),
                     )
 
-                cursor.execute(
-                    """
-                    SELECT u.user_id, u.username, u.display_name, m.url AS profile_image_url
-                    FROM Users u
-                    LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
-                    WHERE u.user_id = %s;
-                    """,
-                    (user_id,),
+                mentioned_user_ids = resolve_mentions(
+                    cursor,
+                    parse_mentions(content),
+                    restricted_group_id=post.get("restricted_group_id"),
+                    post_owner_id=post.get("user_id"),
                 )
-                author = cursor.fetchone() or {}
+                notified_user_ids = record_reply_notifications(
+                    cursor, reply_id, post_id, user_id, post.get("user_id"), mentioned_user_ids, now
+                )
+                # Activity in a split-off thread is only pushed to the people who can read it.
+                comment_recipients = None
+                if is_private_thread:
+                    comment_recipients = [
+                        post.get("user_id"),
+                        *group_member_ids(cursor, post.get("restricted_group_id")),
+                    ]
                 cursor.close()
 
+            publish_event(
+                app,
+                "comment",
+                {"post_id": post_id, "reply_id": reply_id, "author_id": user_id},
+                user_ids=comment_recipients,
+            )
+            publish_event(app, "notification", {"post_id": post_id, "reply_id": reply_id}, user_ids=notified_user_ids)
+
             return {
                 "reply_id": reply_id,
                 "post_id": post_id,
@@ -926,23 +796,22 @@ def create_app(test_config: dict | None = None) -> Flask:
                 "image_url": image_url or None,
                 "created_at": now,
                 "author": {
-                    "id": author.get("user_id"),
-                    "name": author.get("display_name") or author.get("username") or "Unknown",
-                    "avatar": author.get("profile_image_url") or default_avatar_url,
+                    "id": user_id,
+                    "name": current_user.display_name or current_user.username or "Unknown",
+                    "avatar": current_user.profile_image_url or default_avatar_url,
+                    "avatarSrcset": avatar_srcset(current_user.profile_image_renditions),
                 },
             }, 201
         except Exception as e:
             logger.error(f"Error creating comment (api): {e}")
             return {"error": "Failed to create comment"}, 500
 
-    @app.route("/api/replies/<reply_id>/like", methods=["POST"])
+    @app.route("/api/replies/<reply_id>/like", methods=["POST", "PUT", "DELETE"])
     @limiter.limit(lambda: app.config["RATELIMIT_API_INTERACTIONS"])
     @login_required
     def toggle_reply_like_api(reply_id):
-        from uuid import uuid4
-
+        """PUT likes, DELETE unlikes (both idempotent); POST toggles."""
         user_id = current_user.get_id()
-        now = datetime.now().isoformat(timespec="seconds")
 
         try:
             with get_db(app) as conn:
@@ -964,74 +833,24 @@ def create_app(test_config: dict | None = None) -> Flask:
                     return {"error": "Reply not found"}, 404
 
                 if reply.get("is_private_after_split") and reply.get("restricted_group_id"):
-                    cursor.execute(
-                        """
-                        SELECT 1
-                        FROM GroupMembers
-                        WHERE group_id = %s AND user_id = %s
-                        LIMIT 1;
-                        """,
-                        (reply.get("restricted_group_id"), user_id),
-                    )
-                    is_member = cursor.fetchone() is not None
-                    is_owner = reply.get("post_owner_id") == user_id
-                    if not is_member and not is_owner:
+                    thread = {"user_id": reply.get("post_owner_id"), "restricted_group_id": reply.get("restricted_group_id")}
+                    if not can_view_thread(thread, user_id, viewer_group_ids(conn, user_id)):
                         cursor.close()
                         return {"error": "Reply is private after split"}, 403
 
-                like_reaction_type_id = _ensure_like_reaction_type(conn)
-                cursor.execute(
-                    """
-                    SELECT reaction_id
-                    FROM Reactions
-                    WHERE user_id = %s
-                      AND reply_id = %s
-                      AND post_id IS NULL
-                      AND reaction_type_id = %s
-                    LIMIT 1;
-                    """,
-                    (user_id, reply_id, like_reaction_type_id),
-                )
-                existing = cursor.fetchone()
-                if existing:
-                    cursor.execute(
-                        """
-                        DELETE FROM Reactions
-                        WHERE user_id = %s
-                          AND reply_id = %s
-                          AND post_id IS NULL
-                          AND reaction_type_id = %s;
-                        """,
-                        (user_id, reply_id, like_reaction_type_id),
-                    )
-                    is_liked = False
+                like_reaction_type_id = reaction_types.ensure(conn, LIKE)
+                if request.method == "POST":
+                    is_liked = set_reply_like(cursor, user_id, reply_id, like_reaction_type_id, liked=True)
+                    if not is_liked:
+                        set_reply_like(cursor, user_id, reply_id, like_reaction_type_id, liked=False)
                 else:
-                    cursor.execute(
-                        """
-                        INSERT INTO Reactions (
-                            reaction_id, user_id, post_id, reply_id, reaction_type_id, created_at, updated_at
-                        )
-                        VALUES (%s, %s, NULL, %s, %s, %s, %s);
-                        """,
-                        (str(uuid4()), user_id, reply_id, like_reaction_type_id, now, now),
-                    )
-                    is_liked = True
+                    is_liked = request.method == "PUT"
+                    set_reply_like(cursor, user_id, reply_id, like_reaction_type_id, liked=is_liked)
 
-                cursor.execute(
-                    """
-                    SELECT COUNT(DISTINCT r.user_id) AS likes
-                    FROM Reactions r
-                    JOIN ReactionTypes rt ON rt.reaction_type_id = r.reaction_type_id
-                    WHERE r.reply_id = %s
-                      AND r.post_id IS NULL
-                      AND rt.name = 'like';
-                    """,
-                    (reply_id,),
-                )
-                likes_row = cursor.fetchone() or {}
+                likes = reply_like_count(cursor, reply_id)
                 cursor.close()
 
-            return {"reply_id": reply_id, "likes": int(likes_row.get("likes") or 0), "isLiked": is_liked}, 200
+            return {"reply_id": reply_id, "likes": likes, "isLiked": is_liked}, 200
         except Exception as e:
             logger.error(f"Error toggling reply like: {e}")
             return {"error": "Failed to toggle reply like"}, 500
@@ -1083,6 +902,7 @@ def create_app(test_config: dict | None = None) -> Flask:
                 )
                 cursor.close()
 
+            publish_event(app, "thread_lock", {"post_id": post_id, "is_closed": requested_state})
             return {"post_id": post_id, "is_closed": requested_state}, 200
         except Exception as e:
             logger.error(f"Error toggling reply lock: {e}")
@@ -1129,20 +949,7 @@ def create_app(test_config: dict | None = None) -> Flask:
                     cursor.close()
                     return {"error": "Only post owner can split discussion"}, 403
 
-                cursor.execute(
-                    """
-                    SELECT DISTINCT r.user_id, COALESCE(u.display_name, u.username, 'Unknown') AS name
-                    FROM Replies r
-                    LEFT JOIN Users u ON u.user_id = r.user_id
-                    WHERE r.parent_post_id = %s
-                      AND r.is_deleted = FALSE
-                      AND u.is_deleted = FALSE
-                      AND r.user_id <> %s;
-                    """,
-                    (post_id, creator_id),
-                )
-                eligible_rows = cursor.fetchall()
-                eligible_map = {row["user_id"]: row["name"] for row in eligible_rows if row.get("user_id")}
+                eligible_map = eligible_participants(cursor, post_id, creator_id, cleaned_selected_ids)
                 valid_selected = [uid for uid in cleaned_selected_ids if uid in eligible_map]
                 if not valid_selected:
                     cursor.close()
@@ -1171,16 +978,8 @@ def create_app(test_config: dict | None = None) -> Flask:
                     ),
                 )
 
-                member_ids = [creator_id, *valid_selected]
-                unique_member_ids = list(dict.fromkeys(member_ids))
-                for member_id in unique_member_ids:
-                    cursor.execute(
-                        """
-                        INSERT INTO GroupMembers (group_id, user_id, joined_at, updated_at)
-                        VALUES (%s, %s, %s, %s);
-                        """,
-                        (group_id, member_id, now, now),
-                    )
+                unique_member_ids = list(dict.fromkeys([creator_id, *valid_selected]))
+                add_group_members(cursor, group_id, unique_member_ids, now)
 
                 cursor.execute(
                     """
@@ -1210,5 +1009,59 @@ def create_app(test_config: dict | None = None) -> Flask:
         except Exception as e:
             logger.error(f"Error creating discussion group: {e}")
             return {"error": "Failed to split discussion"}, 500
+
+    @app.route("/api/groups/<group_id>/members", methods=["POST"])
+    @limiter.limit(lambda: app.config["RATELIMIT_API_INTERACTIONS"])
+    @login_required
+    def add_discussion_group_members(group_id):
+        payload = request.get_json(silent=True) or {}
+        selected_user_ids = payload.get("participant_user_ids") or []
+        user_id = current_user.get_id()
+
+        if not isinstance(selected_user_ids, list):
+            return {"error": "participant_user_ids must be a list"}, 400
+        cleaned_selected_ids = list(dict.fromkeys(str(uid).strip() for uid in selected_user_ids if str(uid).strip()))
+        if not cleaned_selected_ids:
+            return {"error": "Choose at least one participant"}, 400
+
+        try:
+            with get_db(app) as conn:
+                cursor = conn.cursor(cursors.DictCursor)
+                cursor.execute(
+                    """
+                    SELECT group_id, created_by, origin_post_id
+                    FROM UserGroups
+                    WHERE group_id = %s AND is_deleted = FALSE;
+                    """,
+                    (group_id,),
+                )
+                group = cursor.fetchone()
+                if not group:
+                    cursor.close()
+                    return {"error": "Group not found"}, 404
+                if group.get("created_by") != user_id:
+                    cursor.close()
+                    return {"error": "Only the group creator can add members"}, 403
+
+                eligible_map = eligible_participants(cursor, group["origin_post_id"], user_id, cleaned_selected_ids)
+                valid_selected = [uid for uid in cleaned_selected_ids if uid in eligible_map]
+                if not valid_selected:
+                    cursor.close()
+                    return {"error": "Selected users must be commenters on this post"}, 400
+
+                added = add_group_members(cursor, group_id, valid_selected)
+                cursor.execute("SELECT COUNT(*) AS members FROM GroupMembers WHERE group_id = %s;", (group_id,))
+                participant_count = int((cursor.fetchone() or {}).get("members") or 0)
+                cursor.close()
+
+            return {
+                "group_id": group_id,
+                "added": added,
+                "participant_count": participant_count,
+                "participants": [{"id": uid, "name": eligible_map[uid]} for uid in valid_selected],
+            }, 200
+        except Exception as e:
+            logger.error(f"Error adding discussion group members: {e}")
+            return {"error": "Failed to add members"}, 500
     
     return app
@@ -5,8 +5,34 @@ def main():
     - development: Debug enabled, verbose logging
     - testing: Test-specific configuration
     - production: Debug disabled, minimal logging
+
+    `python -m app serve` starts the production pre-fork server instead
+    of the Werkzeug development server (see app/server.py).
     """
+    import argparse
     import os
+
+    parser = argparse.ArgumentParser(prog="python -m app")
+    subcommands = parser.add_subparsers(dest="command")
+    serve_parser = subcommands.add_parser("serve", help="Run the production WSGI server")
+    serve_parser.add_argument("--bind", default=f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+    serve_parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", str((os.cpu_count() or 1) * 2 + 1))))
+    serve_parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", "4")))
+    serve_parser.add_argument("--timeout", type=int, default=int(os.environ.get("WEB_TIMEOUT", "30")))
+    serve_parser.add_argument("--metrics-port", type=int, default=int(os.environ.get("METRICS_PORT", "8080")))
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        from .server import serve
+        serve(
+            bind=args.bind,
+            workers=max(1, args.workers),
+            threads=max(1, args.threads),
+            timeout=args.timeout,
+            metrics_port=args.metrics_port,
+        )
+        return
+
     from . import create_app
     app = create_app()
     env = app.config.get("ENV", "development")
@@ -5,13 +5,15 @@ from typing import Optional
 from uuid import uuid4
 from argon2 import PasswordHasher
 from argon2.exceptions import VerificationError, VerifyMismatchError
-from flask import current_app
+from flask import Flask, current_app, has_app_context
 from flask_login import UserMixin, current_user
 from pymysql import IntegrityError, cursors
 
-from .db import get_db
+from .cache import MISSING, TTLCache
+from .db import after_commit, get_db
 
 _password_hasher = PasswordHasher()
+_user_cache = TTLCache("user", maxsize=10000, ttl=60)
 
 
 @dataclass
@@ -23,6 +25,7 @@ class User(UserMixin):
     profile_image_url: Optional[str]
     is_banned: bool
     is_deleted: bool
+    profile_image_renditions: Optional[str] = None
 
     def get_id(self) -> str:
         return self.user_id
@@ -41,6 +44,7 @@ def _row_to_user(row: dict) -> User:
         profile_image_url=row.get("profile_image_url"),
         is_banned=bool(row.get("is_banned")),
         is_deleted=bool(row.get("is_deleted")),
+        profile_image_renditions=row.get("profile_image_renditions"),
     )
 
 
@@ -52,7 +56,7 @@ def load_user_by_id(user_id: str) -> Optional[User]:
         cursor = conn.cursor(cursors.DictCursor)
         cursor.execute(
             """
-            SELECT u.user_id, u.username, u.email, u.display_name, m.url AS profile_image_url, u.is_banned, u.is_deleted
+            SELECT u.user_id, u.username, u.email, u.display_name, m.url AS profile_image_url, m.renditions AS profile_image_renditions, u.is_banned, u.is_deleted
             FROM Users u
             LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
             WHERE user_id = %s
@@ -66,6 +70,35 @@ def load_user_by_id(user_id: str) -> Optional[User]:
     return _row_to_user(row) if row else None
 
 
+def configure_user_cache(app: Flask) -> None:
+    _user_cache.configure(
+        maxsize=app.config.get("USER_CACHE_MAX_ENTRIES", 10000),
+        ttl=app.config.get("USER_CACHE_TTL_SECONDS", 60),
+    )
+
+
+def load_cached_user(user_id: str) -> Optional[User]:
+    """Flask-Login user loader backed by an in-process TTL/LRU cache.
+
+    Unknown users are not cached, so a new account is picked up immediately.
+    """
+    if not user_id:
+        return None
+
+    user = _user_cache.get(user_id)
+    if user is MISSING:
+        user = load_user_by_id(user_id)
+        if user is not None:
+            _user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_cached_user(user_id: str) -> None:
+    """Drop a cached user once the change to their profile, avatar or ban state is committed."""
+    if user_id:
+        after_commit(lambda: _user_cache.invalidate(user_id))
+
+
 def load_user_by_username(username: str) -> Optional[dict]:
     if not username:
         return None
@@ -110,7 +143,18 @@ def load_user_by_email(email: str) -> Optional[dict]:
     return row
 
 
+def _hash_pool():
+    """The app's Argon2 worker pool, or None outside an app (startup, scripts)."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("password_hash_pool")
+
+
 def verify_password(password_hash: str, password: str) -> bool:
+    """Verify a password; raises PasswordHashingBusy when the pool is saturated."""
+    pool = _hash_pool()
+    if pool is not None:
+        return pool.verify(password_hash, password)
     try:
         return _password_hasher.verify(password_hash, password)
     except (VerifyMismatchError, VerificationError):
@@ -118,9 +162,32 @@ def verify_password(password_hash: str, password: str) -> bool:
 
 
 def hash_password(password: str) -> str:
+    """Hash a password; raises PasswordHashingBusy when the pool is saturated."""
+    pool = _hash_pool()
+    if pool is not None:
+        return pool.hash(password)
     return _password_hasher.hash(password)
 
 
+def password_needs_rehash(password_hash: str) -> bool:
+    """Whether a stored hash uses other Argon2 parameters than the configured ones."""
+    pool = _hash_pool()
+    if pool is not None:
+        return pool.needs_rehash(password_hash)
+    return _password_hasher.check_needs_rehash(password_hash)
+
+
+def update_password_hash(user_id: str, password_hash: str) -> None:
+    now = datetime.now().isoformat(timespec="seconds")
+    with get_db(current_app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE Users SET password_hash = %s, updated_at = %s WHERE user_id = %s;",
+            (password_hash, now, user_id),
+        )
+        cursor.close()
+
+
 def create_user(username: str, email: str, password: str, display_name: Optional[str] = None) -> User:
     user_id = str(uuid4())
     now = datetime.now().isoformat(timespec="seconds")
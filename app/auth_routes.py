@@ -1,9 +1,14 @@
 from __future__ import annotations
+import logging
 from urllib.parse import urljoin, urlparse
 from flask import Blueprint, flash, redirect, request, url_for
 from flask_login import current_user, login_user, logout_user
 from pymysql import IntegrityError
-from .auth import assign_role, create_user, load_user_by_email, load_user_by_username, verify_password
+from .auth import (
+    assign_role, create_user, hash_password, load_user_by_email, load_user_by_username,
+    password_needs_rehash, update_password_hash, verify_password,
+)
+from .hashing import PasswordHashingBusy
 from .profile import create_profile
 from . import login_failures
 from .structured_log import (
@@ -12,6 +17,8 @@ from .structured_log import (
     log_logout,
 )
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint("auth", __name__)
 
 def _is_safe_url(target: str) -> bool:
@@ -23,6 +30,17 @@ def _is_safe_url(target: str) -> bool:
     return test_url.scheme in ("http", "https") and ref_url.netloc == test_url.netloc
 
 
+def _rehash_if_needed(user_id: str, stored_hash: str, password: str) -> None:
+    """Upgrade a hash made with old Argon2 parameters while the password is at hand."""
+    if not password_needs_rehash(stored_hash):
+        return
+    try:
+        update_password_hash(user_id, hash_password(password))
+    except PasswordHashingBusy:
+        # Not worth failing the login over; the next login retries.
+        logger.info(f"Skipped password rehash for {user_id}: hashing pool busy")
+
+
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
@@ -55,6 +73,8 @@ def login():
             flash("This account is banned.", "danger")
             return redirect(url_for("dashboard"))
 
+        _rehash_if_needed(user_row["user_id"], user_row["password_hash"], password)
+
         from .auth import User
 
         user = User(
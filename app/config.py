@@ -14,6 +14,8 @@ class Config:
     TESTING = False
     PROPAGATE_EXCEPTIONS = None
     PRESERVE_CONTEXT_ON_EXCEPTION = None
+    # Request body ceiling (413 beyond it); the profile picture route sets its own
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", str(8 * 1024 * 1024)))
     
     # Session Configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=int(os.environ.get("PERMANENT_SESSION_LIFETIME_DAYS", "7")))
@@ -53,7 +55,64 @@ class Config:
     # Profile image upload configuration
     PROFILE_IMAGE_MAX_BYTES = int(os.environ.get("PROFILE_IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
     PROFILE_IMAGE_MAX_DIMENSION = int(os.environ.get("PROFILE_IMAGE_MAX_DIMENSION", "512"))
+    # Uploads whose header declares more pixels are rejected before decoding
+    PROFILE_IMAGE_MAX_PIXELS = int(os.environ.get("PROFILE_IMAGE_MAX_PIXELS", str(40_000_000)))
     PROFILE_IMAGE_UPLOAD_SUBDIR = os.environ.get("PROFILE_IMAGE_UPLOAD_SUBDIR", "uploads/profile")
+    # Smaller avatar renditions served via srcset, in addition to PROFILE_IMAGE_MAX_DIMENSION
+    PROFILE_IMAGE_RENDITION_SIZES = os.environ.get("PROFILE_IMAGE_RENDITION_SIZES", "48,96,192")
+    # Background image processing: worker threads per process (0 = inline in the
+    # request) and the on-disk job queue (default: <instance>/image-queue)
+    PROFILE_IMAGE_WORKERS = int(os.environ.get("PROFILE_IMAGE_WORKERS", "2"))
+    PROFILE_IMAGE_QUEUE_DIR = os.environ.get("PROFILE_IMAGE_QUEUE_DIR", "")
+
+    # Argon2 hashing pool: worker processes (0 = hash on the request thread),
+    # max queued+running operations before returning 503, and wait timeout
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get("PASSWORD_HASH_QUEUE_DEPTH", "16"))
+    PASSWORD_HASH_TIMEOUT_SECONDS = float(os.environ.get("PASSWORD_HASH_TIMEOUT_SECONDS", "10"))
+    # Argon2 cost parameters (memory in KiB); pick values with `flask calibrate-argon2`.
+    # Existing hashes are upgraded on the next successful login.
+    ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", "3"))
+    ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", "65536"))
+    ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", "4"))
+
+    # Flask-Login user cache (per process); 0 disables it
+    USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+    # Profile pages rendered for anonymous viewers (per process); 0 disables it
+    PROFILE_PAGE_CACHE_TTL_SECONDS = int(os.environ.get("PROFILE_PAGE_CACHE_TTL_SECONDS", "10"))
+    PROFILE_PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PROFILE_PAGE_CACHE_MAX_ENTRIES", "1000"))
+    # Page size of the followers/following APIs
+    FOLLOW_PAGE_SIZE = int(os.environ.get("FOLLOW_PAGE_SIZE", "20"))
+    # Notification inbox: unread count/version cache per process; 0 disables it
+    NOTIFICATIONS_PAGE_SIZE = int(os.environ.get("NOTIFICATIONS_PAGE_SIZE", "20"))
+    NOTIFICATION_CACHE_TTL_SECONDS = int(os.environ.get("NOTIFICATION_CACHE_TTL_SECONDS", "5"))
+    NOTIFICATION_CACHE_MAX_ENTRIES = int(os.environ.get("NOTIFICATION_CACHE_MAX_ENTRIES", "10000"))
+    # Live updates over /api/stream. Each open stream holds a server thread,
+    # so keep the per-worker cap below WEB_THREADS (default 4). Browsers that
+    # are turned away with a 503 retry with backoff (30 s up to 5 min).
+    EVENT_STREAM_MAX_CONNECTIONS = int(os.environ.get("EVENT_STREAM_MAX_CONNECTIONS", "2"))
+    EVENT_STREAM_QUEUE_SIZE = int(os.environ.get("EVENT_STREAM_QUEUE_SIZE", "100"))
+    EVENT_STREAM_HEARTBEAT_SECONDS = int(os.environ.get("EVENT_STREAM_HEARTBEAT_SECONDS", "15"))
+    EVENT_STREAM_MAX_SECONDS = int(os.environ.get("EVENT_STREAM_MAX_SECONDS", "300"))
+
+    # Home feed configuration
+    FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE", "50"))
+    # Fan-out-on-write timelines: run `flask rebuild-timelines` after enabling.
+    FEED_FANOUT_ENABLED = os.environ.get("FEED_FANOUT_ENABLED", "False").lower() == "true"
+    FEED_FANOUT_BACKFILL_LIMIT = int(os.environ.get("FEED_FANOUT_BACKFILL_LIMIT", "200"))
+    # Latest replies rendered per feed post; older ones load via the comments API
+    REPLY_PREVIEW_LIMIT = int(os.environ.get("REPLY_PREVIEW_LIMIT", "5"))
+    COMMENTS_PAGE_SIZE = int(os.environ.get("COMMENTS_PAGE_SIZE", "20"))
+    # Post card fragment cache: "memory://" or a redis:// URL shared by workers
+    FRAGMENT_CACHE_URL = os.environ.get("FRAGMENT_CACHE_URL", "memory://")
+    FRAGMENT_CACHE_TTL_SECONDS = int(os.environ.get("FRAGMENT_CACHE_TTL_SECONDS", "300"))
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get("FRAGMENT_CACHE_MAX_ENTRIES", "2000"))
+
+    # Search: "fulltext" (MySQL FULLTEXT indexes) or "memory" (in-process inverted index)
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "fulltext")
+    SEARCH_MEMORY_REFRESH_SECONDS = int(os.environ.get("SEARCH_MEMORY_REFRESH_SECONDS", "30"))
+    SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
     
     @staticmethod
     def get_database_url():
@@ -98,6 +157,11 @@ class TestingConfig(Config):
     SESSION_COOKIE_SECURE = False
     LOG_LEVEL = "DEBUG"
     RATELIMIT_ENABLED = False
+    # Tests change profiles and read them back immediately
+    PROFILE_PAGE_CACHE_TTL_SECONDS = int(os.environ.get("PROFILE_PAGE_CACHE_TTL_SECONDS", "0"))
+    NOTIFICATION_CACHE_TTL_SECONDS = int(os.environ.get("NOTIFICATION_CACHE_TTL_SECONDS", "0"))
+    # Process uploads inline so tests see the new avatar right after the redirect
+    PROFILE_IMAGE_WORKERS = int(os.environ.get("PROFILE_IMAGE_WORKERS", "0"))
     PROPAGATE_EXCEPTIONS = True
     PRESERVE_CONTEXT_ON_EXCEPTION = True
 
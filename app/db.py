@@ -1,8 +1,8 @@
 import pymysql
 from pymysql import cursors
-from flask import Flask
+from flask import Flask, g, has_request_context
 from contextlib import contextmanager
-from typing import Any, Generator, Optional
+from typing import Any, Callable, Generator, Optional
 import logging
 from datetime import datetime
 
@@ -10,6 +10,9 @@ logger = logging.getLogger(__name__)
 
 _connection_pool: Optional[Any] = None
 
+# Session statements run once per physical connection, not per checkout.
+_SESSION_STATEMENTS = ["SET FOREIGN_KEY_CHECKS = 1"]
+
 
 def get_connection_pool():
     """Returns the global connection pool or None if not initialized."""
@@ -32,7 +35,7 @@ def init_connection_pool(app: Flask) -> None:
             maxshared=3,
             blocking=True,
             maxusage=None,
-            setsession=[],
+            setsession=list(_SESSION_STATEMENTS),
             ping=1,
             host=app.config.get("MYSQL_HOST", "localhost"),
             port=app.config.get("MYSQL_PORT", 3306),
@@ -48,31 +51,71 @@ def init_connection_pool(app: Flask) -> None:
         _connection_pool = None
 
 
+def close_connection_pool() -> None:
+    """Close every pooled connection and forget the pool.
+
+    Used by the pre-fork server so the master process does not hand its open
+    sockets down to the workers.
+    """
+    global _connection_pool
+    if _connection_pool is not None:
+        try:
+            _connection_pool.close()
+        except Exception as e:
+            logger.warning(f"Failed to close connection pool: {e}")
+    _connection_pool = None
+
+
+def _open_connection(app: Flask):
+    pool = get_connection_pool()
+    if pool:
+        return pool.connection()
+
+    # Fallback to direct connection if pool not initialized
+    return pymysql.connect(
+        host=app.config.get("MYSQL_HOST", "localhost"),
+        port=app.config.get("MYSQL_PORT", 3306),
+        user=app.config.get("MYSQL_USER", "root"),
+        password=app.config.get("MYSQL_PASSWORD", ""),
+        database=app.config.get("MYSQL_DATABASE", "EchoDB"),
+        charset="utf8mb4",
+        autocommit=False,
+        init_command="; ".join(_SESSION_STATEMENTS),
+    )
+
+
 @contextmanager
 def get_db(app: Flask) -> Generator:
-    """Context manager for database connections."""
+    """Context manager for database connections.
+
+    Inside a request, every block shares one connection stored on ``g`` and
+    the request runs as a single transaction: it is committed after the
+    response is built (``commit_request_db``) and the connection goes back to
+    the pool on teardown. An exception escaping any block rolls the request
+    transaction back. Outside a request (CLI, startup, tests) each block gets
+    its own connection and commits on exit.
+    """
+    if has_request_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            conn = _open_connection(app)
+            g._db_conn = conn
+        try:
+            yield conn
+        except pymysql.Error as e:
+            conn.rollback()
+            g.pop("_after_commit", None)
+            logger.error(f"Database error: {e}")
+            raise
+        except Exception:
+            conn.rollback()
+            g.pop("_after_commit", None)
+            raise
+        return
+
     conn = None
     try:
-        pool = get_connection_pool()
-        if pool:
-            conn = pool.connection()
-        else:
-            # Fallback to direct connection if pool not initialized
-            conn = pymysql.connect(
-                host=app.config.get("MYSQL_HOST", "localhost"),
-                port=app.config.get("MYSQL_PORT", 3306),
-                user=app.config.get("MYSQL_USER", "root"),
-                password=app.config.get("MYSQL_PASSWORD", ""),
-                database=app.config.get("MYSQL_DATABASE", "EchoDB"),
-                charset="utf8mb4",
-                autocommit=False,
-            )
-        
-        # Enable foreign keys
-        cursor = conn.cursor()
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 1;")
-        cursor.close()
-        
+        conn = _open_connection(app)
         yield conn
         conn.commit()
         
@@ -86,6 +129,63 @@ def get_db(app: Flask) -> Generator:
             conn.close()
 
 
+def after_commit(callback: Callable[[], None]) -> None:
+    """Run ``callback`` once the current request's transaction has been committed.
+
+    Cache invalidations go through here: dropping an entry before the commit
+    lets a concurrent request read the old rows and cache them again. The
+    callbacks are discarded if the transaction is rolled back. Outside a
+    request ``get_db`` commits when its block exits, so the callback runs
+    immediately and must be called after that block.
+    """
+    if has_request_context():
+        g.setdefault("_after_commit", []).append(callback)
+        return
+    callback()
+
+
+def commit_request_db(response):
+    """Commit the request transaction before the response is sent.
+
+    Runs as an ``after_request`` hook so a failed commit still turns into an
+    error response instead of a silently lost write. The ``after_commit``
+    callbacks run once the commit has succeeded.
+    """
+    conn = g.get("_db_conn")
+    if conn is not None:
+        try:
+            conn.commit()
+        except pymysql.Error as e:
+            conn.rollback()
+            g.pop("_after_commit", None)
+            logger.error(f"Failed to commit request transaction: {e}")
+            raise
+    for callback in g.pop("_after_commit", None) or ():
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"After-commit callback failed: {e}")
+    return response
+
+
+def close_request_db(exc: Optional[BaseException] = None) -> None:
+    """Return the request connection to the pool.
+
+    The pool rolls back whatever was left uncommitted (e.g. after an
+    unhandled exception skipped ``commit_request_db``); a direct connection
+    discards it on close.
+    """
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.close()
+
+
+def init_request_db(app: Flask) -> None:
+    """Register the hooks that manage the request-scoped connection."""
+    app.after_request(commit_request_db)
+    app.teardown_request(close_request_db)
+
+
 def execute_query(app: Flask, query: str, params: tuple = (), fetch_one: bool = False) -> Any:
     """Execute query and return results."""
     with get_db(app) as conn:
@@ -302,6 +402,25 @@ def ensure_default_admin(app: Flask) -> Optional[str]:
         return None
 
 
+def _apply_schema_statements(app: Flask, statements: list[str], label: str) -> None:
+    """Run idempotent schema statements, ignoring "already exists" errors."""
+    try:
+        with get_db(app) as conn:
+            cursor = conn.cursor()
+            for statement in statements:
+                try:
+                    cursor.execute(statement)
+                except pymysql.Error as e:
+                    if e.args and e.args[0] in (1060, 1061, 1826):
+                        logger.debug(f"Schema already up-to-date for {label}: {e}")
+                    else:
+                        raise
+            cursor.close()
+            conn.commit()
+    except Exception as e:
+        logger.warning(f"Could not ensure {label} schema: {e}")
+
+
 def ensure_post_thread_controls_schema(app: Flask) -> None:
     """Ensure thread control columns/constraints exist on Posts table."""
     statements = [
@@ -324,18 +443,208 @@ def ensure_post_thread_controls_schema(app: Flask) -> None:
         FOREIGN KEY (restricted_group_id) REFERENCES UserGroups(group_id) ON DELETE SET NULL
         """,
     ]
+    _apply_schema_statements(app, statements, "thread controls")
+
+
+def ensure_feed_schema(app: Flask) -> None:
+    """Ensure the composite indexes backing keyset feed, comment, follow-list and notification pagination exist."""
+    statements = [
+        "CREATE INDEX idx_posts_feed ON Posts(is_deleted, created_at, post_id)",
+        "CREATE INDEX idx_posts_author_feed ON Posts(user_id, is_deleted, created_at, post_id)",
+        "CREATE INDEX idx_replies_post_feed ON Replies(parent_post_id, is_deleted, created_at, reply_id)",
+        "CREATE INDEX idx_followers_followed_page ON Followers(followed_id, created_at, follower_id)",
+        "CREATE INDEX idx_followers_follower_page ON Followers(follower_id, created_at, followed_id)",
+        "CREATE INDEX idx_notifications_user_read_created ON Notifications(user_id, is_read, created_at, notification_id)",
+        "CREATE INDEX idx_notifications_user_created ON Notifications(user_id, created_at, notification_id)",
+    ]
+    _apply_schema_statements(app, statements, "feed")
+
+
+def ensure_media_schema(app: Flask) -> None:
+    """Ensure Media can record the resized renditions of an image."""
+    statements = [
+        "ALTER TABLE Media ADD COLUMN renditions JSON NULL",
+    ]
+    _apply_schema_statements(app, statements, "media")
+
+
+def ensure_search_schema(app: Flask) -> None:
+    """Ensure the FULLTEXT indexes used by the search backend exist."""
+    statements = [
+        "CREATE FULLTEXT INDEX ft_posts_content ON Posts(content)",
+        "CREATE FULLTEXT INDEX ft_users_names ON Users(username, display_name)",
+    ]
+    _apply_schema_statements(app, statements, "search")
+
+
+def ensure_timeline_schema(app: Flask) -> None:
+    """Ensure the fan-out Timelines table exists."""
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS Timelines (
+            user_id CHAR(36),
+            post_id CHAR(36),
+            author_id CHAR(36) NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (user_id, post_id)
+        ) ENGINE=InnoDB
+        """,
+        "CREATE INDEX idx_timelines_feed ON Timelines(user_id, created_at, post_id)",
+        "CREATE INDEX idx_timelines_author ON Timelines(user_id, author_id)",
+        "CREATE INDEX idx_timelines_post ON Timelines(post_id)",
+        """
+        ALTER TABLE Timelines
+        ADD CONSTRAINT fk_timelines_user
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        """,
+        """
+        ALTER TABLE Timelines
+        ADD CONSTRAINT fk_timelines_post
+        FOREIGN KEY (post_id) REFERENCES Posts(post_id) ON DELETE CASCADE
+        """,
+        """
+        ALTER TABLE Timelines
+        ADD CONSTRAINT fk_timelines_author
+        FOREIGN KEY (author_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        """,
+    ]
+    _apply_schema_statements(app, statements, "timelines")
+
+
+def ensure_post_stats_schema(app: Flask) -> None:
+    """Ensure the PostStats counter table exists and is seeded."""
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS PostStats (
+            post_id CHAR(36) PRIMARY KEY,
+            reply_count INT NOT NULL DEFAULT 0,
+            like_count INT NOT NULL DEFAULT 0,
+            repost_count INT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        ) ENGINE=InnoDB
+        """,
+        """
+        ALTER TABLE PostStats
+        ADD CONSTRAINT fk_poststats_post
+        FOREIGN KEY (post_id) REFERENCES Posts(post_id) ON DELETE CASCADE
+        """,
+    ]
+    _apply_schema_statements(app, statements, "post stats")
+
+    # A freshly created table has no rows for existing posts; seed it once so
+    # the feed does not show zero counters until the rebuild command is run.
     try:
         with get_db(app) as conn:
             cursor = conn.cursor()
-            for statement in statements:
-                try:
-                    cursor.execute(statement)
-                except pymysql.Error as e:
-                    if e.args and e.args[0] in (1060, 1061, 1826):
-                        logger.debug(f"Schema already up-to-date for thread controls: {e}")
-                    else:
-                        raise
+            cursor.execute("SELECT 1 FROM PostStats LIMIT 1")
+            is_seeded = cursor.fetchone() is not None
             cursor.close()
-            conn.commit()
+        if not is_seeded:
+            from .stats import rebuild_post_stats
+            rebuild_post_stats(app)
+    except Exception as e:
+        logger.warning(f"Could not seed post stats: {e}")
+
+
+def ensure_reply_stats_schema(app: Flask) -> None:
+    """Ensure the ReplyStats counter table exists and is seeded."""
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS ReplyStats (
+            reply_id CHAR(36) PRIMARY KEY,
+            like_count INT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        ) ENGINE=InnoDB
+        """,
+        """
+        ALTER TABLE ReplyStats
+        ADD CONSTRAINT fk_replystats_reply
+        FOREIGN KEY (reply_id) REFERENCES Replies(reply_id) ON DELETE CASCADE
+        """,
+    ]
+    _apply_schema_statements(app, statements, "reply stats")
+
+    try:
+        with get_db(app) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM ReplyStats LIMIT 1")
+            is_seeded = cursor.fetchone() is not None
+            cursor.close()
+        if not is_seeded:
+            from .stats import rebuild_reply_stats
+            rebuild_reply_stats(app)
+    except Exception as e:
+        logger.warning(f"Could not seed reply stats: {e}")
+
+
+def ensure_reaction_schema(app: Flask) -> None:
+    """Ensure Reactions has one row per (user, target, reaction type).
+
+    The unique keys make like writes idempotent. Duplicate rows left by the
+    old check-then-insert toggle are removed once, before the keys are added.
+    """
+    try:
+        with get_db(app) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SHOW INDEX FROM Reactions WHERE Key_name = 'uq_reactions_user_reply_type'")
+            has_unique_keys = cursor.fetchone() is not None
+            if not has_unique_keys:
+                cursor.execute(
+                    """
+                    DELETE r1
+                    FROM Reactions r1
+                    JOIN Reactions r2
+                      ON r2.user_id = r1.user_id
+                     AND r2.reaction_type_id = r1.reaction_type_id
+                     AND r2.post_id <=> r1.post_id
+                     AND r2.reply_id <=> r1.reply_id
+                     AND r2.reaction_id < r1.reaction_id
+                    """
+                )
+            cursor.close()
+    except Exception as e:
+        logger.warning(f"Could not deduplicate reactions: {e}")
+        return
+
+    statements = [
+        "CREATE UNIQUE INDEX uq_reactions_user_post_type ON Reactions(user_id, post_id, reaction_type_id)",
+        "CREATE UNIQUE INDEX uq_reactions_user_reply_type ON Reactions(user_id, reply_id, reaction_type_id)",
+    ]
+    _apply_schema_statements(app, statements, "reactions")
+
+
+def ensure_user_stats_schema(app: Flask) -> None:
+    """Ensure the UserStats counter table exists and is seeded."""
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS UserStats (
+            user_id CHAR(36) PRIMARY KEY,
+            post_count INT NOT NULL DEFAULT 0,
+            follower_count INT NOT NULL DEFAULT 0,
+            following_count INT NOT NULL DEFAULT 0,
+            unread_notification_count INT NOT NULL DEFAULT 0,
+            notification_version INT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        ) ENGINE=InnoDB
+        """,
+        "ALTER TABLE UserStats ADD COLUMN unread_notification_count INT NOT NULL DEFAULT 0",
+        "ALTER TABLE UserStats ADD COLUMN notification_version INT NOT NULL DEFAULT 0",
+        """
+        ALTER TABLE UserStats
+        ADD CONSTRAINT fk_userstats_user
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        """,
+    ]
+    _apply_schema_statements(app, statements, "user stats")
+
+    try:
+        with get_db(app) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM UserStats LIMIT 1")
+            is_seeded = cursor.fetchone() is not None
+            cursor.close()
+        if not is_seeded:
+            from .stats import rebuild_user_stats
+            rebuild_user_stats(app)
     except Exception as e:
-        logger.warning(f"Could not ensure thread control schema: {e}")
+        logger.warning(f"Could not seed user stats: {e}")
@@ -0,0 +1,168 @@
+"""
+In-process pub/sub for live updates pushed over Server-Sent Events.
+
+Likes, new comments and thread locks are published to every open stream;
+notification events only to the streams of their recipients. Events carry
+ids and counters, never content, so a client that wants the new comment
+fetches it through the comments API, which applies the usual visibility
+rules.
+
+Each worker process has its own broker, so a stream only sees events
+published by the worker it is connected to. Within a request, events are
+held back until the request's transaction has been committed and are
+dropped if the request fails.
+
+Every stream holds a server thread for as long as it is open, so a worker
+accepts at most ``EVENT_STREAM_MAX_CONNECTIONS`` streams and ends each one
+after ``EVENT_STREAM_MAX_SECONDS`` (the browser reconnects). A stream whose
+queue of ``EVENT_STREAM_QUEUE_SIZE`` events fills up because the client reads
+too slowly is sent a ``resync`` event and closed instead of buffering more.
+"""
+from __future__ import annotations
+import json
+import queue
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+from flask import Flask, g, has_request_context
+from prometheus_client import Counter, Gauge
+
+event_streams_open = Gauge(
+    "echo_event_streams_open",
+    "Open Server-Sent Events streams",
+    multiprocess_mode="livesum",
+)
+events_dropped = Counter(
+    "echo_events_dropped_total",
+    "Streams closed because their client fell behind",
+)
+
+_RESYNC = object()
+
+
+class TooManyStreams(Exception):
+    """Raised when this worker already serves its maximum number of streams."""
+
+
+class Subscription:
+    def __init__(self, user_id: Optional[str], queue_size: int) -> None:
+        self.user_id = user_id
+        self.events: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.lagged = False
+
+    def offer(self, event: tuple[str, dict]) -> bool:
+        """Queue an event; returns False once the client has fallen behind."""
+        if self.lagged:
+            return False
+        try:
+            self.events.put_nowait(event)
+            return True
+        except queue.Full:
+            self.lagged = True
+            # Make room for the marker so the stream can tell the client.
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                pass
+            self.events.put_nowait(_RESYNC)
+            events_dropped.inc()
+            return False
+
+
+class EventBroker:
+    def __init__(self, max_streams: int = 2, queue_size: int = 100) -> None:
+        self.max_streams = max(0, int(max_streams))
+        self.queue_size = queue_size
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: Optional[str]) -> Subscription:
+        with self._lock:
+            if len(self._subscriptions) >= self.max_streams:
+                raise TooManyStreams("Too many open event streams")
+            subscription = Subscription(user_id, self.queue_size)
+            self._subscriptions.add(subscription)
+        event_streams_open.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.discard(subscription)
+        event_streams_open.dec()
+
+    def publish(self, event_type: str, data: dict, user_ids: Optional[Iterable[str]] = None) -> None:
+        """Send an event to every stream, or only to the streams of ``user_ids``."""
+        recipients = set(user_ids) if user_ids is not None else None
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if recipients is None or subscription.user_id in recipients:
+                subscription.offer((event_type, data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+
+def format_event(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def stream_events(
+    broker: EventBroker,
+    subscription: Subscription,
+    heartbeat_seconds: float = 15.0,
+    max_seconds: float = 300.0,
+) -> Iterator[str]:
+    """Yield SSE frames for a subscription until it lags, times out or the client leaves."""
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = subscription.events.get(timeout=min(heartbeat_seconds, remaining))
+            except queue.Empty:
+                # Comment frames keep proxies from closing the connection and
+                # let the server notice a client that went away.
+                yield ": keep-alive\n\n"
+                continue
+            if event is _RESYNC:
+                yield format_event("resync", {})
+                return
+            yield format_event(*event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def publish_event(app: Flask, event_type: str, data: dict, user_ids: Optional[Iterable[str]] = None) -> None:
+    """Publish an event once the current request's transaction has been committed."""
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+    if has_request_context():
+        g.setdefault("_pending_events", []).append((event_type, data, user_ids))
+        return
+    app.extensions["event_broker"].publish(event_type, data, user_ids)
+
+
+def init_event_broker(app: Flask) -> None:
+    broker = EventBroker(
+        max_streams=app.config.get("EVENT_STREAM_MAX_CONNECTIONS", 2),
+        queue_size=app.config.get("EVENT_STREAM_QUEUE_SIZE", 100),
+    )
+    app.extensions["event_broker"] = broker
+
+    @app.teardown_request
+    def flush_pending_events(exc: Optional[BaseException] = None) -> None:
+        # Teardown runs after the after_request commit; an exception here
+        # means the commit (or the view) failed and the events never happened.
+        pending = g.pop("_pending_events", None)
+        if pending and exc is None:
+            for event_type, data, user_ids in pending:
+                broker.publish(event_type, data, user_ids)
@@ -0,0 +1,592 @@
+"""
+Home feed queries and post-card assembly.
+
+The feed is ordered by (is_followed_author DESC, created_at DESC, post_id DESC)
+and paged with an opaque keyset cursor over those three values. Instead of
+computing ``is_followed_author`` per row and sorting on it, a page is read in
+two index-ordered sections: posts by followed authors first, then everything
+else. Each section is a range scan on a composite (.., created_at, post_id)
+index, so deep pages cost the same as the first one.
+
+With fan-out enabled (see ``timeline.py``) the followed section reads the
+viewer's precomputed Timelines rows instead of joining Followers, and the
+second section excludes exactly those rows.
+
+Whether the viewer may read and reply to a restricted thread is decided in
+Python from the viewer's group ids (see ``groups.py``), loaded once per
+request, rather than with GroupMembers subqueries in every row.
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+from pymysql import cursors
+from .groups import can_comment_thread, can_view_thread, viewer_group_ids
+from .images import avatar_srcset
+from .pagination import decode_cursor, encode_cursor
+from .reactions import LIKE, reaction_types
+
+DEFAULT_AVATAR_URL = "https://images.unsplash.com/photo-1494790108377-be9c29b29330?w=100&h=100&fit=crop"
+
+
+def _feed_query(source_sql: str, where_sql: str, is_followed_sql: str, order_alias: str = "p") -> str:
+    return f"""
+        SELECT p.post_id, p.content, p.created_at, p.updated_at,
+               u.user_id, u.username, u.display_name,
+               m.url AS profile_image_url,
+               m.renditions AS profile_image_renditions,
+               (
+                   SELECT pm.url
+                   FROM Media pm
+                   WHERE pm.post_id = p.post_id
+                     AND pm.media_type = 'image'
+                     AND pm.is_deleted = FALSE
+                   ORDER BY pm.created_at ASC
+                   LIMIT 1
+               ) AS post_image_url,
+               COALESCE(ps.reply_count, 0) AS reply_count,
+               COALESCE(ps.like_count, 0) AS like_count,
+               COALESCE(p.replies_closed, FALSE) AS replies_closed,
+               p.replies_closed_at,
+               p.restricted_group_id,
+               p.restricted_at,
+               {is_followed_sql} AS is_followed_author,
+               CASE
+                   WHEN %s IS NULL THEN FALSE
+                   WHEN EXISTS (
+                       SELECT 1
+                       FROM Reactions lr
+                       WHERE lr.post_id = p.post_id
+                         AND lr.reply_id IS NULL
+                         AND lr.user_id = %s
+                         AND lr.reaction_type_id = %s
+                   ) THEN TRUE
+                   ELSE FALSE
+               END AS is_liked
+        FROM {source_sql}
+        LEFT JOIN Users u ON p.user_id = u.user_id
+        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+        LEFT JOIN PostStats ps ON ps.post_id = p.post_id
+        WHERE p.is_deleted = FALSE
+          {where_sql}
+        ORDER BY {order_alias}.created_at DESC, {order_alias}.post_id DESC
+        LIMIT %s;
+    """
+
+
+_FOLLOWED_SOURCE_SQL = """Posts p
+        JOIN Followers f ON f.followed_id = p.user_id AND f.follower_id = %s"""
+
+_NOT_FOLLOWED_SQL = """AND NOT EXISTS (
+              SELECT 1
+              FROM Followers f
+              WHERE f.follower_id = %s
+                AND f.followed_id = p.user_id
+          )"""
+
+_TIMELINE_SOURCE_SQL = """Timelines t
+        JOIN Posts p ON p.post_id = t.post_id"""
+
+_NOT_IN_TIMELINE_SQL = """AND NOT EXISTS (
+              SELECT 1
+              FROM Timelines t
+              WHERE t.user_id = %s
+                AND t.post_id = p.post_id
+          )"""
+
+
+def _keyset_condition(
+    created_at: Optional[str], post_id: Optional[str], alias: str = "p"
+) -> tuple[str, tuple]:
+    if not created_at or not post_id:
+        return "", ()
+    return (
+        f"AND ({alias}.created_at < %s OR ({alias}.created_at = %s AND {alias}.post_id < %s))",
+        (created_at, created_at, post_id),
+    )
+
+
+def parse_feed_cursor(token: Optional[str]) -> Optional[tuple[int, Optional[str], Optional[str]]]:
+    """Decode a feed cursor into (is_followed, created_at, post_id).
+
+    Raises ValueError when the token is malformed.
+    """
+    if not token:
+        return None
+
+    is_followed, created_at, post_id = decode_cursor(token, 3)
+    if is_followed not in (0, 1):
+        raise ValueError("Invalid cursor")
+    if created_at is not None:
+        if not isinstance(created_at, str):
+            raise ValueError("Invalid cursor")
+        datetime.fromisoformat(created_at)
+    if post_id is not None and not isinstance(post_id, str):
+        raise ValueError("Invalid cursor")
+    return is_followed, created_at, post_id
+
+
+def _cursor_for_row(is_followed: int, row: dict) -> str:
+    created_at = row.get("created_at")
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=" ", timespec="seconds")
+    return encode_cursor(is_followed, created_at, row.get("post_id"))
+
+
+def load_feed_page(
+    conn,
+    viewer_id: Optional[str],
+    cursor_values: Optional[tuple[int, Optional[str], Optional[str]]],
+    limit: int,
+    use_timeline: bool = False,
+) -> tuple[list[dict], Optional[str]]:
+    """Return one feed page of post rows and the cursor for the next page.
+
+    ``use_timeline`` reads the followed section from the fan-out Timelines
+    table instead of joining Followers.
+    """
+    viewer_params = (viewer_id, viewer_id, reaction_types.get(conn, LIKE))
+    is_followed, created_at, post_id = cursor_values or (1, None, None)
+    rows: list[dict] = []
+
+    cursor = conn.cursor(cursors.DictCursor)
+    try:
+        if viewer_id and is_followed == 1:
+            if use_timeline:
+                keyset_sql, keyset_params = _keyset_condition(created_at, post_id, alias="t")
+                cursor.execute(
+                    _feed_query(
+                        _TIMELINE_SOURCE_SQL,
+                        f"AND t.user_id = %s\n          {keyset_sql}",
+                        "TRUE",
+                        order_alias="t",
+                    ),
+                    (*viewer_params, viewer_id, *keyset_params, limit + 1),
+                )
+            else:
+                keyset_sql, keyset_params = _keyset_condition(created_at, post_id)
+                cursor.execute(
+                    _feed_query(_FOLLOWED_SOURCE_SQL, keyset_sql, "TRUE"),
+                    (*viewer_params, viewer_id, *keyset_params, limit + 1),
+                )
+            rows = list(cursor.fetchall())
+            if len(rows) > limit:
+                rows = rows[:limit]
+                return _with_thread_access(conn, rows, viewer_id), _cursor_for_row(1, rows[-1])
+            # Followed section exhausted: continue with the rest from the top.
+            created_at, post_id = None, None
+
+        remaining = limit - len(rows)
+        if remaining <= 0:
+            return _with_thread_access(conn, rows, viewer_id), encode_cursor(0, None, None)
+
+        keyset_sql, keyset_params = _keyset_condition(created_at, post_id)
+        where_sql = keyset_sql
+        where_params: tuple = keyset_params
+        if viewer_id:
+            excluded_sql = _NOT_IN_TIMELINE_SQL if use_timeline else _NOT_FOLLOWED_SQL
+            where_sql = f"{excluded_sql}\n          {keyset_sql}"
+            where_params = (viewer_id, *keyset_params)
+        cursor.execute(
+            _feed_query("Posts p", where_sql, "FALSE"),
+            (*viewer_params, *where_params, remaining + 1),
+        )
+        other_rows = list(cursor.fetchall())
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    if len(other_rows) > remaining:
+        other_rows = other_rows[:remaining]
+        next_cursor = _cursor_for_row(0, other_rows[-1])
+    return _with_thread_access(conn, rows + other_rows, viewer_id), next_cursor
+
+
+def _with_thread_access(conn, rows: list[dict], viewer_id: Optional[str]) -> list[dict]:
+    """Set ``can_view_replies``/``can_comment_replies`` on feed rows."""
+    group_ids: frozenset[str] = frozenset()
+    if viewer_id and any(
+        row.get("restricted_group_id") and row.get("user_id") != viewer_id for row in rows
+    ):
+        group_ids = viewer_group_ids(conn, viewer_id)
+    for row in rows:
+        row["can_view_replies"] = can_view_thread(row, viewer_id, group_ids)
+        row["can_comment_replies"] = can_comment_thread(row, viewer_id, group_ids)
+    return rows
+
+
+def _reply_query(from_sql: str, where_sql: str, order_sql: str, limit_sql: str = "") -> str:
+    """Build the reply SELECT shared by feed previews and the comments API.
+
+    Takes two viewer params and the like reaction type id (for ``is_liked``)
+    before any params of the ``from_sql``/``where_sql`` fragments.
+    """
+    return f"""
+        SELECT r.reply_id, r.parent_post_id, r.content, r.created_at,
+               COALESCE(r.is_private_after_split, FALSE) AS is_private_after_split,
+               COALESCE(rs.like_count, 0) AS like_count,
+               u.user_id, u.username, u.display_name,
+               m.url AS profile_image_url,
+               m.renditions AS profile_image_renditions,
+               (
+                   SELECT rm.url
+                   FROM Media rm
+                   WHERE rm.reply_id = r.reply_id
+                     AND rm.media_type = 'image'
+                     AND rm.is_deleted = FALSE
+                   ORDER BY rm.created_at ASC
+                   LIMIT 1
+               ) AS reply_image_url,
+               CASE
+                   WHEN %s IS NULL THEN FALSE
+                   WHEN EXISTS (
+                       SELECT 1
+                       FROM Reactions rr
+                       WHERE rr.reply_id = r.reply_id
+                         AND rr.post_id IS NULL
+                         AND rr.user_id = %s
+                         AND rr.reaction_type_id = %s
+                   ) THEN TRUE
+                   ELSE FALSE
+               END AS is_liked
+        FROM {from_sql}
+        LEFT JOIN ReplyStats rs ON rs.reply_id = r.reply_id
+        LEFT JOIN Users u ON r.user_id = u.user_id
+        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+        {where_sql}
+        ORDER BY {order_sql}
+        {limit_sql};
+    """
+
+
+def _reply_card(reply: dict) -> dict:
+    name = reply.get("display_name") or reply.get("username") or "Unknown"
+    return {
+        "id": reply.get("reply_id"),
+        "content": reply.get("content"),
+        "timestamp": reply.get("created_at"),
+        "imageUrl": reply.get("reply_image_url"),
+        "isPrivateAfterSplit": bool(reply.get("is_private_after_split")),
+        "likes": int(reply.get("like_count") or 0),
+        "isLiked": bool(reply.get("is_liked")),
+        "author": {
+            "id": reply.get("user_id"),
+            "name": name,
+            "avatar": reply.get("profile_image_url") or DEFAULT_AVATAR_URL,
+            "avatarSrcset": avatar_srcset(reply.get("profile_image_renditions")),
+        },
+    }
+
+
+def _comments_cursor_for(reply: dict) -> str:
+    created_at = reply.get("timestamp")
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=" ", timespec="seconds")
+    return encode_cursor(created_at, reply.get("id"))
+
+
+def parse_comments_cursor(token: Optional[str]) -> Optional[tuple[str, str]]:
+    """Decode a comments cursor into (created_at, reply_id).
+
+    Raises ValueError when the token is malformed.
+    """
+    if not token:
+        return None
+
+    created_at, reply_id = decode_cursor(token, 2)
+    if not isinstance(created_at, str) or not isinstance(reply_id, str):
+        raise ValueError("Invalid cursor")
+    datetime.fromisoformat(created_at)
+    return created_at, reply_id
+
+
+def load_reply_previews(
+    conn,
+    post_ids: list[str],
+    viewer_id: Optional[str],
+    per_post_limit: int,
+    hidden_private_post_ids: tuple = (),
+) -> tuple[dict, dict, dict]:
+    """Load the latest ``per_post_limit`` replies of each post in one query.
+
+    Replies marked private after a split are skipped for the posts listed in
+    ``hidden_private_post_ids``. Returns (replies_by_post, participants_by_post,
+    older_cursor_by_post), where the last maps posts that have more replies
+    than were loaded to a comments-API cursor for the next older page.
+    """
+    replies_by_post: dict = {}
+    participants_by_post: dict = {}
+    older_cursor_by_post: dict = {}
+    if not post_ids:
+        return replies_by_post, participants_by_post, older_cursor_by_post
+
+    placeholders = ", ".join(["%s"] * len(post_ids))
+    hidden_sql = ""
+    hidden_params: tuple = ()
+    if hidden_private_post_ids:
+        hidden_placeholders = ", ".join(["%s"] * len(hidden_private_post_ids))
+        hidden_sql = f"""AND NOT (
+                    r.parent_post_id IN ({hidden_placeholders})
+                    AND COALESCE(r.is_private_after_split, FALSE) = TRUE
+                )"""
+        hidden_params = tuple(hidden_private_post_ids)
+
+    # Rank replies newest-first per post and keep one extra row per post so we
+    # know whether an "older comments" cursor is needed.
+    from_sql = f"""(
+            SELECT r.reply_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY r.parent_post_id
+                       ORDER BY r.created_at DESC, r.reply_id DESC
+                   ) AS preview_rank
+            FROM Replies r
+            WHERE r.is_deleted = FALSE
+              AND r.parent_post_id IN ({placeholders})
+              {hidden_sql}
+        ) ranked
+        JOIN Replies r ON r.reply_id = ranked.reply_id"""
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute(
+        _reply_query(
+            from_sql,
+            "WHERE ranked.preview_rank <= %s",
+            "r.parent_post_id, r.created_at ASC, r.reply_id ASC",
+        ),
+        (viewer_id, viewer_id, reaction_types.get(conn, LIKE), *post_ids, *hidden_params, per_post_limit + 1),
+    )
+    db_replies = cursor.fetchall()
+    cursor.close()
+
+    for reply in db_replies:
+        parent_post_id = reply.get("parent_post_id")
+        if not parent_post_id:
+            continue
+        replies_by_post.setdefault(parent_post_id, []).append(_reply_card(reply))
+
+    for parent_post_id, replies in replies_by_post.items():
+        if len(replies) > per_post_limit:
+            # Rows are oldest-first, so the extra row is the first one.
+            del replies[0]
+            older_cursor_by_post[parent_post_id] = _comments_cursor_for(replies[0])
+        for reply in replies:
+            author = reply["author"]
+            if author.get("id"):
+                participants_by_post.setdefault(parent_post_id, {})
+                participants_by_post[parent_post_id][author["id"]] = {
+                    "id": author["id"],
+                    "name": author["name"],
+                }
+
+    return replies_by_post, participants_by_post, older_cursor_by_post
+
+
+def load_comments_page(
+    conn,
+    post_id: str,
+    viewer_id: Optional[str],
+    cursor_values: Optional[tuple[str, str]],
+    limit: int,
+) -> Optional[tuple[list[dict], Optional[str]]]:
+    """Load one page of a post's replies, newest page first, each page oldest-first.
+
+    Returns None when the post does not exist, otherwise (replies, next_cursor)
+    where ``next_cursor`` points at the next older page.
+    """
+    cursor = conn.cursor(cursors.DictCursor)
+    try:
+        cursor.execute(
+            """
+            SELECT p.post_id, p.user_id, p.restricted_group_id
+            FROM Posts p
+            WHERE p.post_id = %s AND p.is_deleted = FALSE;
+            """,
+            (post_id,),
+        )
+        post = cursor.fetchone()
+        if not post:
+            return None
+
+        group_ids = viewer_group_ids(conn, viewer_id) if post.get("restricted_group_id") else frozenset()
+        where_sql = "WHERE r.parent_post_id = %s AND r.is_deleted = FALSE"
+        params: tuple = (post_id,)
+        if not can_view_thread(post, viewer_id, group_ids):
+            where_sql += " AND COALESCE(r.is_private_after_split, FALSE) = FALSE"
+        if cursor_values:
+            created_at, reply_id = cursor_values
+            where_sql += " AND (r.created_at < %s OR (r.created_at = %s AND r.reply_id < %s))"
+            params += (created_at, created_at, reply_id)
+
+        cursor.execute(
+            _reply_query("Replies r", where_sql, "r.created_at DESC, r.reply_id DESC", "LIMIT %s"),
+            (viewer_id, viewer_id, reaction_types.get(conn, LIKE), *params, limit + 1),
+        )
+        rows = list(cursor.fetchall())
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    replies = [_reply_card(row) for row in rows[:limit]]
+    if len(rows) > limit:
+        next_cursor = _comments_cursor_for(replies[-1])
+    replies.reverse()
+    return replies, next_cursor
+
+
+def build_post_cards(
+    db_posts: list[dict],
+    replies_by_post: dict,
+    participants_by_post: dict,
+    viewer_id: Optional[str],
+    older_cursor_by_post: Optional[dict] = None,
+) -> list[dict]:
+    """Shape feed rows and their replies into the dicts the templates render."""
+    posts = []
+    for row in db_posts:
+        display_name = row.get("display_name") or row.get("username") or "Unknown"
+        username = row.get("username") or "unknown"
+        post_id = row.get("post_id")
+        all_replies = replies_by_post.get(post_id, [])
+        can_view_all_replies = bool(row.get("can_view_replies"))
+        restricted_at = row.get("restricted_at")
+        visible_comment_count = 0
+        if can_view_all_replies:
+            visible_replies = all_replies
+        elif row.get("restricted_group_id"):
+            visible_replies = [
+                reply for reply in all_replies if not reply.get("isPrivateAfterSplit")
+            ]
+        else:
+            visible_replies = all_replies
+
+        rendered_comments = list(visible_replies)
+        if row.get("restricted_group_id") and restricted_at:
+            before_split = [reply for reply in all_replies if not reply.get("isPrivateAfterSplit")]
+            if can_view_all_replies:
+                after_split = [reply for reply in all_replies if reply.get("isPrivateAfterSplit")]
+                rendered_comments = before_split + [
+                    {
+                        "isMarker": True,
+                        "label": "Diskussionen bröts ut här",
+                        "timestamp": restricted_at,
+                    }
+                ] + after_split
+            else:
+                rendered_comments = before_split + [
+                    {
+                        "isMarker": True,
+                        "label": "Diskussionen bröts ut här",
+                        "timestamp": restricted_at,
+                    }
+                ]
+
+        if row.get("replies_closed") and not row.get("restricted_group_id"):
+            rendered_comments = rendered_comments + [
+                {
+                    "isMarker": True,
+                    "label": "Svarstråden stängdes här",
+                    "timestamp": row.get("replies_closed_at"),
+                }
+            ]
+
+        visible_comment_count = len([reply for reply in rendered_comments if not reply.get("isMarker")])
+        # Only the latest replies are loaded; the full count comes from the row
+        # (PostStats, or the public replies for viewers outside a split thread).
+        visible_comment_count = max(visible_comment_count, int(row.get("reply_count") or 0))
+
+        posts.append(
+            {
+                "id": post_id,
+                "author": {
+                    "id": row.get("user_id"),
+                    "name": display_name,
+                    "username": username,
+                    "avatar": row.get("profile_image_url") or DEFAULT_AVATAR_URL,
+                    "avatarSrcset": avatar_srcset(row.get("profile_image_renditions")),
+                },
+                "content": row.get("content"),
+                "imageUrl": row.get("post_image_url"),
+                "timestamp": row.get("created_at"),
+                "updatedAt": row.get("updated_at"),
+                "likes": int(row.get("like_count") or 0),
+                "comments": visible_comment_count,
+                "commentsList": rendered_comments,
+                "olderCommentsCursor": (older_cursor_by_post or {}).get(post_id),
+                "commentParticipants": (
+                    [
+                        participant
+                        for participant in list(participants_by_post.get(post_id, {}).values())
+                        if participant.get("id") != viewer_id
+                    ]
+                    if can_view_all_replies
+                    else []
+                ),
+                "threadClosed": bool(row.get("replies_closed")),
+                "canViewComments": True,
+                "canComment": bool(row.get("can_comment_replies")),
+                "threadRestricted": bool(row.get("restricted_group_id")),
+                "bookmarks": 0,
+                "isLiked": bool(row.get("is_liked")),
+                "isBookmarked": False,
+            }
+        )
+    return posts
+
+
+def _public_reply_counts(conn, post_ids: tuple) -> dict[str, int]:
+    """Replies of each post that are not private after a split, for viewers outside the group."""
+    placeholders = ", ".join(["%s"] * len(post_ids))
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute(
+        f"""
+        SELECT r.parent_post_id, COUNT(*) AS reply_count
+        FROM Replies r
+        WHERE r.parent_post_id IN ({placeholders})
+          AND r.is_deleted = FALSE
+          AND COALESCE(r.is_private_after_split, FALSE) = FALSE
+        GROUP BY r.parent_post_id;
+        """,
+        post_ids,
+    )
+    counts = {row["parent_post_id"]: int(row["reply_count"]) for row in cursor.fetchall()}
+    cursor.close()
+    return counts
+
+
+def load_feed(
+    conn,
+    viewer_id: Optional[str],
+    cursor_values: Optional[tuple[int, Optional[str], Optional[str]]],
+    limit: int,
+    use_timeline: bool = False,
+    reply_preview_limit: int = 5,
+) -> tuple[list[dict], Optional[str]]:
+    """Load one feed page as renderable post cards plus the next cursor."""
+    db_posts, next_cursor = load_feed_page(conn, viewer_id, cursor_values, limit, use_timeline)
+    post_ids = [row.get("post_id") for row in db_posts if row.get("post_id")]
+    hidden_private_post_ids = tuple(
+        row.get("post_id")
+        for row in db_posts
+        if row.get("restricted_group_id") and not row.get("can_view_replies")
+    )
+    replies_by_post, participants_by_post, older_cursor_by_post = load_reply_previews(
+        conn, post_ids, viewer_id, reply_preview_limit, hidden_private_post_ids
+    )
+    if hidden_private_post_ids:
+        public_counts = _public_reply_counts(conn, hidden_private_post_ids)
+        for row in db_posts:
+            if row.get("post_id") in hidden_private_post_ids:
+                row["reply_count"] = public_counts.get(row.get("post_id"), 0)
+    posts = build_post_cards(
+        db_posts, replies_by_post, participants_by_post, viewer_id, older_cursor_by_post
+    )
+    return posts, next_cursor
+
+
+def serialize_post_card(value):
+    """Convert a post card (or any nested part of it) into JSON-safe values."""
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="seconds")
+    if isinstance(value, dict):
+        return {key: serialize_post_card(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [serialize_post_card(item) for item in value]
+    return value
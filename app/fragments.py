@@ -0,0 +1,153 @@
+"""
+Shared cache for the viewer-independent parts of rendered post cards.
+
+The avatar, byline and body of a post card look the same for every viewer, so
+they are rendered once from the macros in ``_post_fragments.html`` and cached
+under a key derived from the post id, its ``updated_at``, its content and the
+author fields they show. ``updated_at`` only has one-second resolution, so the
+content is part of the key to catch an edit made in the same second as a
+render. Everything that depends on the viewer (like state, owner menu,
+comment form, reply previews) is still rendered per request by
+``_post_card.html``, which stitches the cached fragments in through the
+``post_fragment`` template global.
+
+``FRAGMENT_CACHE_URL`` selects the backend: ``memory://`` (default) keeps an
+LRU per process, while ``redis://...`` shares fragments between workers
+through any Redis-compatible server when the ``redis`` package is installed.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import logging
+from typing import Iterable
+from flask import Flask, current_app, g, get_template_attribute
+from markupsafe import Markup
+from .cache import MISSING, TTLCache, cache_requests
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_TEMPLATE = "_post_fragments.html"
+FRAGMENT_NAMES = ("avatar", "byline", "body")
+_CACHE_NAME = "post_fragment"
+
+
+class MemoryFragmentBackend:
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache = TTLCache(_CACHE_NAME, maxsize=maxsize, ttl=ttl)
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        found = {}
+        for key in keys:
+            value = self._cache.get(key)
+            if value is not MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, items: dict[str, dict]) -> None:
+        for key, value in items.items():
+            self._cache.set(key, value)
+
+
+class RedisFragmentBackend:
+    def __init__(self, url: str, ttl: float, prefix: str = "echo:fragment:") -> None:
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._ttl = max(1, int(ttl))
+        self._prefix = prefix
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        if not keys:
+            return {}
+        try:
+            values = self._client.mget([self._prefix + key for key in keys])
+        except Exception as e:
+            logger.warning(f"Fragment cache read failed: {e}")
+            values = [None] * len(keys)
+
+        found = {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+        cache_requests.labels(_CACHE_NAME, "hit").inc(len(found))
+        cache_requests.labels(_CACHE_NAME, "miss").inc(len(keys) - len(found))
+        return found
+
+    def set_many(self, items: dict[str, dict]) -> None:
+        if not items:
+            return
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipeline.setex(self._prefix + key, self._ttl, json.dumps(value))
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Fragment cache write failed: {e}")
+
+
+def init_fragment_cache(app: Flask) -> None:
+    """Create the configured fragment backend and register ``post_fragment``."""
+    url = app.config.get("FRAGMENT_CACHE_URL", "memory://")
+    ttl = app.config.get("FRAGMENT_CACHE_TTL_SECONDS", 300)
+    backend = None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            backend = RedisFragmentBackend(url, ttl)
+        except ImportError:
+            logger.warning("redis package not available. Falling back to in-process fragment cache.")
+    if backend is None:
+        backend = MemoryFragmentBackend(app.config.get("FRAGMENT_CACHE_MAX_ENTRIES", 2000), ttl)
+
+    app.extensions["fragment_cache"] = backend
+    app.jinja_env.globals["post_fragment"] = post_fragment
+
+
+def fragment_key(post: dict) -> str:
+    author = post.get("author") or {}
+    raw = json.dumps(
+        [
+            post.get("id"),
+            str(post.get("updatedAt") or ""),
+            post.get("content"),
+            author.get("name"),
+            author.get("username"),
+            author.get("avatar"),
+            author.get("avatarSrcset"),
+            post.get("imageUrl"),
+        ],
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _render_fragments(post: dict) -> dict:
+    return {
+        name: str(get_template_attribute(FRAGMENT_TEMPLATE, name)(post))
+        for name in FRAGMENT_NAMES
+    }
+
+
+def prefetch_post_fragments(posts: Iterable[dict]) -> None:
+    """Resolve the fragments of a page of posts with one backend round-trip.
+
+    Misses are rendered and written back in a single batch. Results are kept
+    on ``g`` for ``post_fragment`` to pick up while the page renders.
+    """
+    fragments_by_post = g.setdefault("_post_fragments", {})
+    keyed_posts = {fragment_key(post): post for post in posts if post.get("id")}
+    if not keyed_posts:
+        return
+
+    backend = current_app.extensions["fragment_cache"]
+    found = backend.get_many(list(keyed_posts))
+    rendered = {key: _render_fragments(post) for key, post in keyed_posts.items() if key not in found}
+    backend.set_many(rendered)
+
+    for key, post in keyed_posts.items():
+        fragments_by_post[post["id"]] = found.get(key) or rendered[key]
+
+
+def post_fragment(post: dict, name: str) -> Markup:
+    """Template global returning one cached fragment of a post card."""
+    fragments = g.get("_post_fragments", {}).get(post.get("id"))
+    if fragments is None:
+        prefetch_post_fragments([post])
+        fragments = g._post_fragments[post.get("id")]
+    return Markup(fragments[name])
@@ -0,0 +1,107 @@
+"""
+Discussion groups split out of a post's comment thread.
+
+Members are written with one multi-row ``INSERT IGNORE`` (PyMySQL's
+``executemany`` folds the rows into a single statement), so the
+``(group_id, user_id)`` primary key removes duplicates in SQL and adding a
+thousand members costs one round trip instead of a thousand.
+
+Access to a restricted thread is decided in Python from the viewer's set of
+group ids, read once per request with ``viewer_group_ids`` (a covering scan
+of ``idx_groupmembers_user``) instead of a correlated ``GroupMembers``
+subquery per post. ``add_group_members`` drops the request's copy, so a
+request that changes membership sees the change.
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import Iterable, Optional
+from flask import g, has_request_context
+from pymysql import cursors
+
+
+def eligible_participants(cursor, post_id: str, owner_id: str, user_ids: Iterable[str]) -> dict[str, str]:
+    """Map the ids in ``user_ids`` that commented on the post (other than its owner) to display names."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor.execute(
+        f"""
+        SELECT u.user_id, COALESCE(u.display_name, u.username, 'Unknown') AS name
+        FROM Users u
+        WHERE u.user_id IN ({placeholders})
+          AND u.user_id <> %s
+          AND u.is_deleted = FALSE
+          AND EXISTS (
+              SELECT 1
+              FROM Replies r
+              WHERE r.parent_post_id = %s
+                AND r.user_id = u.user_id
+                AND r.is_deleted = FALSE
+          );
+        """,
+        (*user_ids, owner_id, post_id),
+    )
+    return {row["user_id"]: row["name"] for row in cursor.fetchall()}
+
+
+def add_group_members(cursor, group_id: str, user_ids: Iterable[str], now: Optional[str] = None) -> int:
+    """Add users to a group, skipping existing members. Returns how many were added."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0
+
+    now = now or datetime.now().isoformat(timespec="seconds")
+    cursor.executemany(
+        """
+        INSERT IGNORE INTO GroupMembers (group_id, user_id, joined_at, updated_at)
+        VALUES (%s, %s, %s, %s);
+        """,
+        [(group_id, user_id, now, now) for user_id in user_ids],
+    )
+    if has_request_context():
+        g.pop("_viewer_group_ids", None)
+    return cursor.rowcount
+
+
+def group_member_ids(cursor, group_id: str) -> list[str]:
+    """User ids of every member of a group. Expects a ``DictCursor``."""
+    cursor.execute("SELECT user_id FROM GroupMembers WHERE group_id = %s;", (group_id,))
+    return [row["user_id"] for row in cursor.fetchall()]
+
+
+def viewer_group_ids(conn, user_id: Optional[str]) -> frozenset[str]:
+    """Ids of the groups ``user_id`` belongs to, loaded at most once per request."""
+    if not user_id:
+        return frozenset()
+    if has_request_context():
+        cached = g.get("_viewer_group_ids")
+        if cached is not None and cached[0] == user_id:
+            return cached[1]
+
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute("SELECT group_id FROM GroupMembers WHERE user_id = %s;", (user_id,))
+    group_ids = frozenset(row["group_id"] for row in cursor.fetchall())
+    cursor.close()
+
+    if has_request_context():
+        g._viewer_group_ids = (user_id, group_ids)
+    return group_ids
+
+
+def can_view_thread(post: dict, viewer_id: Optional[str], group_ids: frozenset[str]) -> bool:
+    """Whether the viewer may read every reply of a post (``user_id``/``restricted_group_id`` row)."""
+    group_id = post.get("restricted_group_id")
+    if not group_id:
+        return True
+    if not viewer_id:
+        return False
+    return post.get("user_id") == viewer_id or group_id in group_ids
+
+
+def can_comment_thread(post: dict, viewer_id: Optional[str], group_ids: frozenset[str]) -> bool:
+    """Whether the viewer may reply: group members and the owner after a split, anyone on an open thread."""
+    if post.get("restricted_group_id"):
+        return bool(viewer_id) and can_view_thread(post, viewer_id, group_ids)
+    return not post.get("replies_closed")
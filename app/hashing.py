@@ -0,0 +1,193 @@
+"""
+Bounded process pool for Argon2 password hashing.
+
+Argon2 is deliberately CPU- and memory-heavy, so running it on the request
+thread lets a burst of logins starve every other request on the worker.
+Hash and verify calls are instead submitted to a small ``ProcessPoolExecutor``
+(created lazily, so a pre-fork server creates one per worker after fork, and
+with the ``spawn`` start method so children never inherit sockets or locks).
+
+At most ``PASSWORD_HASH_QUEUE_DEPTH`` operations may be queued or running at
+once; beyond that ``PasswordHashingBusy`` is raised and turned into a 503 by
+the app's error handler. ``PASSWORD_HASH_WORKERS = 0`` hashes on the calling
+thread but keeps the same limit and metrics.
+
+Argon2 cost parameters come from ``ARGON2_TIME_COST``, ``ARGON2_MEMORY_COST``
+(KiB) and ``ARGON2_PARALLELISM``; ``calibrate_argon2`` (exposed as
+``flask calibrate-argon2``) picks values that hit a target verify latency on
+the current host. Stored hashes made with other parameters are upgraded on
+the next successful login.
+"""
+from __future__ import annotations
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from statistics import median
+from typing import Callable, Optional
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, VerifyMismatchError
+from flask import Flask
+from prometheus_client import Histogram
+
+password_hash_queue_seconds = Histogram(
+    "echo_password_hash_queue_seconds",
+    "Time Argon2 operations wait for a free hashing worker",
+    ["operation"],
+)
+password_hash_seconds = Histogram(
+    "echo_password_hash_seconds",
+    "Time spent computing Argon2 operations",
+    ["operation"],
+)
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool cannot take more work right now."""
+
+
+@lru_cache(maxsize=8)
+def _hasher(params: tuple) -> PasswordHasher:
+    return PasswordHasher(**dict(params))
+
+
+def _run_operation(operation: str, params: tuple, args: tuple) -> tuple:
+    """Worker entry point: returns (result, started_at, elapsed_seconds)."""
+    started_at = time.time()
+    hasher = _hasher(params)
+    if operation == "hash":
+        result = hasher.hash(*args)
+    else:
+        try:
+            result = hasher.verify(*args)
+        except (VerifyMismatchError, VerificationError):
+            result = False
+    return result, started_at, time.time() - started_at
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int = 2, queue_depth: int = 16, timeout: float = 10.0, params: Optional[dict] = None) -> None:
+        self.workers = max(0, int(workers))
+        self.timeout = timeout
+        self.params = tuple(sorted((params or {}).items()))
+        self._slots = threading.BoundedSemaphore(queue_depth) if queue_depth > 0 else None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def run(self, operation: str, *args):
+        if self._slots is None or not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("Password hashing queue is full")
+
+        submitted_at = time.time()
+        if self.workers == 0:
+            try:
+                result, started_at, elapsed = _run_operation(operation, self.params, args)
+            finally:
+                self._slots.release()
+        else:
+            try:
+                future = self._get_executor().submit(_run_operation, operation, self.params, args)
+            except Exception:
+                self._slots.release()
+                raise
+            # The slot is held until the job really finishes, even if the
+            # caller gave up waiting, so the limit reflects actual CPU use.
+            future.add_done_callback(lambda _future: self._slots.release())
+            try:
+                result, started_at, elapsed = future.result(timeout=self.timeout)
+            except FutureTimeoutError as exc:
+                future.cancel()
+                raise PasswordHashingBusy("Password hashing timed out") from exc
+
+        password_hash_queue_seconds.labels(operation).observe(max(0.0, started_at - submitted_at))
+        password_hash_seconds.labels(operation).observe(elapsed)
+        return result
+
+    def hash(self, password: str) -> str:
+        return self.run("hash", password)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return bool(self.run("verify", password_hash, password))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Whether a stored hash was made with different parameters (cheap, no hashing)."""
+        return _hasher(self.params).check_needs_rehash(password_hash)
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def argon2_params(app: Flask) -> dict:
+    return {
+        "time_cost": int(app.config.get("ARGON2_TIME_COST", 3)),
+        "memory_cost": int(app.config.get("ARGON2_MEMORY_COST", 65536)),
+        "parallelism": int(app.config.get("ARGON2_PARALLELISM", 4)),
+    }
+
+
+def init_password_hashing(app: Flask) -> None:
+    app.extensions["password_hash_pool"] = PasswordHashPool(
+        workers=app.config.get("PASSWORD_HASH_WORKERS", 2),
+        # A depth of 0 would turn every login into a 503.
+        queue_depth=max(1, int(app.config.get("PASSWORD_HASH_QUEUE_DEPTH", 16))),
+        timeout=app.config.get("PASSWORD_HASH_TIMEOUT_SECONDS", 10),
+        params=argon2_params(app),
+    )
+
+
+def _measure_verify_ms(params: dict, samples: int = 3) -> float:
+    hasher = PasswordHasher(**params)
+    password_hash = hasher.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        started_at = time.perf_counter()
+        hasher.verify(password_hash, "calibration-password")
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return median(timings)
+
+
+def calibrate_argon2(
+    target_ms: float,
+    max_memory_kib: int,
+    parallelism: int,
+    measure: Callable[[dict], float] = _measure_verify_ms,
+    max_time_cost: int = 10,
+) -> tuple[dict, float]:
+    """Pick Argon2 parameters whose verify time is closest to ``target_ms``.
+
+    Memory is the main cost lever, so it starts at ``max_memory_kib`` and is
+    halved while a single pass is already too slow; the time cost is then
+    raised one pass at a time until the target is reached. Returns
+    (params, measured_ms).
+    """
+    parallelism = max(1, int(parallelism))
+    min_memory_kib = 8 * parallelism
+    params = {"time_cost": 1, "memory_cost": max(min_memory_kib, int(max_memory_kib)), "parallelism": parallelism}
+
+    elapsed = measure(params)
+    while elapsed > target_ms and params["memory_cost"] // 2 >= min_memory_kib:
+        params["memory_cost"] //= 2
+        elapsed = measure(params)
+
+    best = (dict(params), elapsed)
+    while elapsed < target_ms and params["time_cost"] < max_time_cost:
+        params["time_cost"] += 1
+        elapsed = measure(params)
+        if abs(elapsed - target_ms) < abs(best[1] - target_ms):
+            best = (dict(params), elapsed)
+        if elapsed >= target_ms:
+            break
+    return best
@@ -0,0 +1,380 @@
+"""
+Background processing of uploaded profile images.
+
+Decoding, resizing and WEBP-encoding an upload takes hundreds of milliseconds,
+so the upload route only checks the image header, writes the raw bytes to an
+on-disk queue and returns. A small thread pool per process picks the job up,
+writes a set of resized renditions (``PROFILE_IMAGE_RENDITION_SIZES`` plus
+``PROFILE_IMAGE_MAX_DIMENSION``) under ``static/`` from a single decode, and
+then points the user's ``Media.url`` at the largest one and records all of
+them in ``Media.renditions`` for ``srcset``.
+
+Rendition files are named after a hash of their content, so identical images
+share one file and a URL never changes meaning; the ``static`` endpoint serves
+them with a one-year immutable ``Cache-Control`` and the hash as ETag, and
+``flask gc-media`` removes files no ``Media`` row references any more.
+
+Each job is two files in ``PROFILE_IMAGE_QUEUE_DIR`` (default
+``<instance>/image-queue``): ``<job>.raw`` with the upload and ``<job>.json``
+with its metadata, written last so a half-written job is never picked up. A
+worker claims a job by renaming the metadata to ``<job>.working``; jobs left
+behind by a restart are resumed when the process serves its first request.
+``PROFILE_IMAGE_WORKERS = 0`` processes uploads inline in the request.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
+from uuid import uuid4
+from flask import Flask, Response, has_app_context, send_from_directory
+from PIL import Image
+from prometheus_client import Histogram
+from werkzeug.exceptions import RequestEntityTooLarge
+from .db import get_db
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_IMAGE_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+# A claimed job older than this is assumed to belong to a dead process.
+_STALE_CLAIM_SECONDS = 300
+
+CONTENT_HASH_LENGTH = 32
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_CONTENT_ADDRESSED_NAME = re.compile(rf"^([0-9a-f]{{{CONTENT_HASH_LENGTH}}})\.webp$")
+
+image_job_queue_seconds = Histogram(
+    "echo_image_job_queue_seconds",
+    "Time profile image jobs wait in the queue before processing starts",
+)
+image_job_seconds = Histogram(
+    "echo_image_job_seconds",
+    "Time spent processing profile image jobs",
+    ["result"],
+)
+
+
+def read_limited(stream: BinaryIO, max_bytes: int, chunk_size: int = 64 * 1024) -> bytes:
+    """Read a stream in chunks, raising RequestEntityTooLarge past ``max_bytes``.
+
+    Memory use is bounded by the limit, not by what the client sends.
+    """
+    buffer = BytesIO()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return buffer.getvalue()
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise RequestEntityTooLarge()
+        buffer.write(chunk)
+
+
+def check_image_header(raw_bytes: bytes, max_pixels: int) -> tuple[str, int, int]:
+    """Validate format and pixel dimensions from the header, without decoding.
+
+    Returns (format, width, height). Raises UnidentifiedImageError for
+    non-images and ValueError for formats or sizes we do not accept, which
+    keeps decompression bombs away from the image pipeline.
+    """
+    with Image.open(BytesIO(raw_bytes)) as image:
+        source_format = (image.format or "").upper()
+        width, height = image.size
+    if source_format not in ALLOWED_IMAGE_FORMATS:
+        raise ValueError("Only JPG, PNG, and WEBP images are allowed.")
+    if width * height > max_pixels:
+        raise ValueError("Image dimensions are too large.")
+    return source_format, width, height
+
+
+def render_avatar_renditions(raw_bytes: bytes, sizes: Iterable[int]) -> list[tuple[int, int, bytes]]:
+    """Decode an upload once and encode a WEBP for every bounding-box size.
+
+    Each rendition is downscaled from the previous, larger one. Returns
+    (size, width, webp_bytes) from largest to smallest; sizes larger than the
+    source collapse into a single rendition at the source size.
+    """
+    renditions: list[tuple[int, int, bytes]] = []
+    with Image.open(BytesIO(raw_bytes)) as image:
+        source_format = (image.format or "").upper()
+        if source_format not in ALLOWED_IMAGE_FORMATS:
+            raise ValueError("Only JPG, PNG, and WEBP images are allowed.")
+
+        # JPEGs can be decoded directly at a reduced scale close to the largest size.
+        image.draft("RGB", (max(sizes), max(sizes)))
+        normalized = image.convert("RGBA")
+        for size in sorted(set(sizes), reverse=True):
+            normalized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if renditions and renditions[-1][1] == normalized.width:
+                continue
+            out_buffer = BytesIO()
+            normalized.save(out_buffer, format="WEBP", quality=85, method=6)
+            renditions.append((size, normalized.width, out_buffer.getvalue()))
+    return renditions
+
+
+def rendition_sizes(app: Flask) -> list[int]:
+    """Configured avatar sizes, capped by and including ``PROFILE_IMAGE_MAX_DIMENSION``."""
+    max_dimension = int(app.config.get("PROFILE_IMAGE_MAX_DIMENSION", 512))
+    configured = str(app.config.get("PROFILE_IMAGE_RENDITION_SIZES", "48,96,192"))
+    sizes = {int(size) for size in configured.split(",") if size.strip()}
+    return sorted({size for size in sizes if 0 < size < max_dimension} | {max_dimension})
+
+
+def avatar_srcset(renditions) -> str:
+    """Build a ``srcset`` value from ``Media.renditions`` (JSON text or list)."""
+    if not renditions:
+        return ""
+    if isinstance(renditions, (str, bytes)):
+        try:
+            renditions = json.loads(renditions)
+        except ValueError:
+            return ""
+    return ", ".join(f"{item['url']} {int(item['width'])}w" for item in sorted(renditions, key=lambda item: item["width"]))
+
+
+def store_content_addressed(directory: Path, data: bytes, suffix: str) -> str:
+    """Write ``data`` under a name derived from its hash and return that name.
+
+    Identical content maps to the same file, which is written only once; the
+    write goes through a temporary file so readers never see a partial file.
+    """
+    file_name = hashlib.sha256(data).hexdigest()[:CONTENT_HASH_LENGTH] + suffix
+    path = directory / file_name
+    if not path.exists():
+        tmp_path = directory / f".{file_name}.{uuid4().hex}.tmp"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return file_name
+
+
+def serve_static_media(app: Flask, filename: str) -> Response:
+    """``static`` endpoint that serves content-addressed uploads as immutable.
+
+    Their names change whenever their content does, so browsers and CDNs may
+    keep them for a year and revalidate with the content hash as strong ETag.
+    Every other static file is served by Flask as before.
+    """
+    upload_prefix = app.config.get("PROFILE_IMAGE_UPLOAD_SUBDIR", "uploads/profile").strip("/") + "/"
+    name = filename[len(upload_prefix):] if filename.startswith(upload_prefix) else ""
+    match = _CONTENT_ADDRESSED_NAME.match(name)
+    if not match:
+        return app.send_static_file(filename)
+
+    response = send_from_directory(
+        app.static_folder,
+        filename,
+        etag=match.group(1),
+        max_age=IMMUTABLE_MAX_AGE,
+        conditional=True,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def collect_unreferenced_media(app: Flask, min_age_seconds: float = 3600, dry_run: bool = False) -> tuple[int, int]:
+    """Delete content-addressed uploads that no Media row references.
+
+    Files younger than ``min_age_seconds`` are kept so a job that has written
+    its renditions but not yet committed ``Media`` is never raced. Returns
+    (removed, kept).
+    """
+    upload_dir = Path(app.static_folder) / app.config.get("PROFILE_IMAGE_UPLOAD_SUBDIR", "uploads/profile")
+    if not upload_dir.is_dir():
+        return 0, 0
+
+    referenced: set[str] = set()
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT url, renditions FROM Media;")
+        for url, renditions in cursor.fetchall():
+            referenced.add(url.rsplit("/", 1)[-1])
+            for item in json.loads(renditions) if renditions else []:
+                referenced.add(item["url"].rsplit("/", 1)[-1])
+        cursor.close()
+
+    removed = kept = 0
+    now = time.time()
+    for path in upload_dir.iterdir():
+        if not path.is_file() or path.name in referenced:
+            kept += 1
+            continue
+        if now - path.stat().st_mtime < min_age_seconds:
+            kept += 1
+            continue
+        if not dry_run:
+            path.unlink(missing_ok=True)
+        removed += 1
+    return removed, kept
+
+
+class ImagePipeline:
+    def __init__(self, app: Flask, queue_dir: Path, workers: int = 2) -> None:
+        self.app = app
+        self.queue_dir = Path(queue_dir)
+        self.workers = max(0, int(workers))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._latest_job_by_user: dict[str, str] = {}
+        self._latest_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-job")
+                self._recover()
+            return self._executor
+
+    def start(self) -> None:
+        """Start this process's workers and resume queued jobs (idempotent)."""
+        if self.workers and self._executor is None:
+            self._get_executor()
+
+    def enqueue(self, user_id: str, raw_bytes: bytes, output_subdir: str, media_url_prefix: str, sizes: list[int]) -> bool:
+        """Persist an upload and schedule its processing.
+
+        Returns False only when inline processing (no workers) failed.
+        """
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        job_id = uuid4().hex
+        job = {
+            "job_id": job_id,
+            "user_id": user_id,
+            "output_subdir": output_subdir,
+            "media_url_prefix": media_url_prefix.rstrip("/"),
+            "sizes": list(sizes),
+            "created_at": time.time(),
+        }
+
+        raw_path = self.queue_dir / f"{job_id}.raw"
+        raw_path.write_bytes(raw_bytes)
+        tmp_path = self.queue_dir / f"{job_id}.json.tmp"
+        tmp_path.write_text(json.dumps(job))
+        os.replace(tmp_path, self.queue_dir / f"{job_id}.json")
+
+        with self._latest_lock:
+            self._latest_job_by_user[user_id] = job_id
+
+        if self.workers == 0:
+            return self.process(job_id)
+        self._get_executor().submit(self.process, job_id)
+        return True
+
+    def _recover(self) -> None:
+        if not self.queue_dir.is_dir():
+            return
+        now = time.time()
+        for working_path in self.queue_dir.glob("*.working"):
+            try:
+                if now - working_path.stat().st_mtime > _STALE_CLAIM_SECONDS:
+                    os.replace(working_path, working_path.with_suffix(".json"))
+            except FileNotFoundError:
+                continue
+
+        pending = []
+        for job_path in self.queue_dir.glob("*.json"):
+            try:
+                pending.append((json.loads(job_path.read_text()), job_path.stem))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable image job {job_path.name}: {e}")
+        pending.sort(key=lambda item: item[0].get("created_at", 0))
+
+        with self._latest_lock:
+            for job, job_id in pending:
+                self._latest_job_by_user[job["user_id"]] = job_id
+        for _, job_id in pending:
+            self._executor.submit(self.process, job_id)
+        if pending:
+            logger.info(f"Resumed {len(pending)} queued profile image jobs")
+
+    def process(self, job_id: str) -> bool:
+        """Run one queued job; returns False when it failed or was superseded."""
+        job_path = self.queue_dir / f"{job_id}.json"
+        working_path = self.queue_dir / f"{job_id}.working"
+        raw_path = self.queue_dir / f"{job_id}.raw"
+        try:
+            os.replace(job_path, working_path)
+        except FileNotFoundError:
+            return False  # Claimed by another worker process.
+
+        started_at = time.time()
+        result = "ok"
+        user_id = None
+        try:
+            job = json.loads(working_path.read_text())
+            user_id = job["user_id"]
+            image_job_queue_seconds.observe(max(0.0, started_at - job.get("created_at", started_at)))
+            # Inline jobs share the request's context (and its transaction);
+            # pool threads push their own.
+            context = nullcontext() if has_app_context() else self.app.app_context()
+            with context:
+                result = self._run(job, raw_path)
+        except Exception as e:
+            result = "failed"
+            logger.error(f"Profile image job {job_id} failed: {e}")
+        finally:
+            image_job_seconds.labels(result).observe(time.time() - started_at)
+            working_path.unlink(missing_ok=True)
+            raw_path.unlink(missing_ok=True)
+            # Forget the user once their newest job is done so the map only
+            # holds users with work in flight.
+            with self._latest_lock:
+                if user_id is not None and self._latest_job_by_user.get(user_id) == job_id:
+                    del self._latest_job_by_user[user_id]
+        return result == "ok"
+
+    def _run(self, job: dict, raw_path: Path) -> str:
+        from .profile import upsert_profile_image
+
+        user_id = job["user_id"]
+        with self._latest_lock:
+            latest_job_id = self._latest_job_by_user.get(user_id, job["job_id"])
+        if latest_job_id != job["job_id"]:
+            return "superseded"
+
+        output_dir = Path(self.app.static_folder) / job["output_subdir"]
+        output_dir.mkdir(parents=True, exist_ok=True)
+        renditions = []
+        for _size, width, data in render_avatar_renditions(raw_path.read_bytes(), job["sizes"]):
+            file_name = store_content_addressed(output_dir, data, ".webp")
+            renditions.append({"width": width, "url": f"{job['media_url_prefix']}/{file_name}"})
+
+        # Media.url keeps pointing at the largest rendition for plain <img src>.
+        # Files of an upload that never gets referenced are left to `flask gc-media`.
+        updated = upsert_profile_image(user_id, renditions[0]["url"], media_type="image/webp", renditions=renditions)
+        return "ok" if updated else "failed"
+
+    def wait(self) -> None:
+        """Block until every job submitted so far has finished (used by tests)."""
+        with self._executor_lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def init_image_pipeline(app: Flask) -> None:
+    queue_dir = app.config.get("PROFILE_IMAGE_QUEUE_DIR") or os.path.join(app.instance_path, "image-queue")
+    pipeline = ImagePipeline(app, Path(queue_dir), workers=app.config.get("PROFILE_IMAGE_WORKERS", 2))
+    app.extensions["image_pipeline"] = pipeline
+    app.jinja_env.filters["srcset"] = avatar_srcset
+    app.view_functions["static"] = lambda filename: serve_static_media(app, filename)
+
+    @app.before_request
+    def start_image_pipeline() -> None:
+        pipeline.start()
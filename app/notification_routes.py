@@ -0,0 +1,103 @@
+from __future__ import annotations
+import logging
+import zlib
+from flask import Blueprint, current_app, request
+from flask_login import current_user, login_required
+from .feed import DEFAULT_AVATAR_URL
+from .notifications import (
+    inbox_state,
+    load_notifications,
+    mark_notifications_read,
+    newest_notification_cursor,
+    parse_notification_cursor,
+)
+
+logger = logging.getLogger(__name__)
+
+notification_bp = Blueprint("notifications", __name__)
+
+
+def _serialize_notification(row: dict) -> dict:
+    return {
+        "id": row["notification_id"],
+        "type": row["type"],
+        "is_read": bool(row.get("is_read")),
+        "post_id": row.get("post_id"),
+        "reply_id": row.get("reply_id"),
+        "created_at": row["created_at"].isoformat() if row.get("created_at") else None,
+        "actor": {
+            "id": row.get("actor_id"),
+            "username": row.get("actor_username"),
+            "name": row.get("actor_display_name") or row.get("actor_username") or "Unknown",
+            "avatar": row.get("actor_image_url") or DEFAULT_AVATAR_URL,
+        },
+    }
+
+
+@notification_bp.route("/api/notifications", methods=["GET"])
+@login_required
+def list_notifications_api():
+    """Notification inbox; cheap to poll with ``?since=`` and ``If-None-Match``."""
+    user_id = current_user.get_id()
+    try:
+        before = parse_notification_cursor(request.args.get("cursor"))
+        since = parse_notification_cursor(request.args.get("since"))
+    except ValueError:
+        return {"error": "Invalid cursor"}, 400
+    unread_only = request.args.get("unread") in ("1", "true")
+
+    # The version changes with every new or read notification, so it
+    # identifies the response together with the query string.
+    unread_count, version = inbox_state(user_id)
+    etag = f"n{version}-{unread_count}-{zlib.crc32(request.query_string):08x}"
+    if request.if_none_match.contains(etag):
+        return "", 304, {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+
+    try:
+        rows, next_cursor, has_more = load_notifications(
+            user_id,
+            before=before,
+            since=since,
+            unread_only=unread_only,
+            limit=int(current_app.config.get("NOTIFICATIONS_PAGE_SIZE", 20)),
+        )
+    except Exception as e:
+        logger.error(f"Error loading notifications: {e}")
+        return {"error": "Failed to load notifications"}, 500
+
+    response = current_app.make_response(
+        (
+            {
+                "notifications": [_serialize_notification(row) for row in rows],
+                "unread_count": unread_count,
+                "next_cursor": next_cursor,
+                "since": None if before else newest_notification_cursor(rows, request.args.get("since")),
+                "has_more": has_more,
+            },
+            200,
+        )
+    )
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@notification_bp.route("/api/notifications/read", methods=["POST"])
+@login_required
+def mark_notifications_read_api():
+    """Mark the notifications in ``ids`` read, or all of them when ``ids`` is omitted."""
+    payload = request.get_json(silent=True) or {}
+    notification_ids = payload.get("ids")
+    if notification_ids is not None and (
+        not isinstance(notification_ids, list) or not all(isinstance(value, str) for value in notification_ids)
+    ):
+        return {"error": "ids must be a list of notification ids"}, 400
+
+    try:
+        updated = mark_notifications_read(current_user.get_id(), notification_ids)
+    except Exception as e:
+        logger.error(f"Error marking notifications read: {e}")
+        return {"error": "Failed to update notifications"}, 500
+
+    unread_count, _ = inbox_state(current_user.get_id(), cached=False)
+    return {"updated": updated, "unread_count": unread_count}, 200
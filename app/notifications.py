@@ -0,0 +1,281 @@
+"""
+Mentions, notifications and the notification inbox.
+
+The @mentions in a comment are parsed from its text and resolved with one
+``Users`` lookup. The ``Mentions`` rows and the ``Notifications`` rows (one per
+mentioned user, plus a ``reply`` notification for the post owner) are then
+each written with a single multi-row INSERT inside the comment's transaction,
+so creating a comment costs the same number of statements however many users
+it mentions. At most ``MAX_MENTIONS`` distinct names per comment are resolved.
+
+Each user's unread count and an inbox version live in UserStats and change
+in the same transaction as the notifications. ``inbox_state`` serves them
+from a short per-process cache, so a client polling with ``If-None-Match``
+gets its 304 without touching Notifications.
+"""
+from __future__ import annotations
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+from uuid import uuid4
+from flask import Flask, current_app
+from pymysql import cursors
+from .cache import MISSING, TTLCache
+from .db import after_commit, get_db
+from .pagination import decode_cursor, encode_cursor
+from .stats import add_unread_notifications, adjust_user_stats
+
+MAX_MENTIONS = 20
+
+NOTIFICATION_MENTION = "mention"
+NOTIFICATION_REPLY = "reply"
+
+_MENTION_RE = re.compile(r"(?<![\w@])@(\w[\w.-]*)", re.UNICODE)
+
+_inbox_cache = TTLCache("notification_inbox", maxsize=10000, ttl=5)
+
+
+def configure_notification_cache(app: Flask) -> None:
+    _inbox_cache.configure(
+        maxsize=app.config.get("NOTIFICATION_CACHE_MAX_ENTRIES", 10000),
+        ttl=app.config.get("NOTIFICATION_CACHE_TTL_SECONDS", 5),
+    )
+
+
+def parse_mentions(content: str) -> list[str]:
+    """Distinct usernames mentioned in ``content``, in order of appearance."""
+    usernames: list[str] = []
+    for match in _MENTION_RE.finditer(content or ""):
+        # Trailing punctuation ("thanks @anna.") is not part of the name.
+        username = match.group(1).rstrip(".-")
+        if username and username not in usernames:
+            usernames.append(username)
+            if len(usernames) >= MAX_MENTIONS:
+                break
+    return usernames
+
+
+def resolve_mentions(
+    cursor,
+    usernames: list[str],
+    restricted_group_id: Optional[str] = None,
+    post_owner_id: Optional[str] = None,
+) -> list[str]:
+    """User ids of the active users named in ``usernames``, in one query.
+
+    In a thread restricted to a group only members and the post owner are
+    kept, since nobody else can read the reply. Expects a ``DictCursor``.
+    """
+    if not usernames:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(usernames))
+    params: tuple = tuple(usernames)
+    restricted_sql = ""
+    if restricted_group_id:
+        restricted_sql = """AND (
+                u.user_id = %s
+                OR EXISTS (
+                    SELECT 1
+                    FROM GroupMembers gm
+                    WHERE gm.group_id = %s
+                      AND gm.user_id = u.user_id
+                )
+            )"""
+        params += (post_owner_id, restricted_group_id)
+
+    cursor.execute(
+        f"""
+        SELECT u.user_id
+        FROM Users u
+        WHERE u.username IN ({placeholders})
+          AND u.is_deleted = FALSE
+          AND u.is_banned = FALSE
+          {restricted_sql};
+        """,
+        params,
+    )
+    return [row["user_id"] for row in cursor.fetchall()]
+
+
+def record_reply_notifications(
+    cursor,
+    reply_id: str,
+    post_id: str,
+    author_id: str,
+    post_owner_id: Optional[str],
+    mentioned_user_ids: Iterable[str],
+    now: str,
+) -> list[str]:
+    """Insert the Mentions and Notifications rows for a new reply.
+
+    Mentioned users get a ``mention`` notification and the post owner a
+    ``reply`` notification unless they were mentioned too; nobody is notified
+    about their own reply. Returns the ids of the notified users.
+    """
+    mentioned_user_ids = list(dict.fromkeys(mentioned_user_ids))
+    if mentioned_user_ids:
+        # executemany folds these into one multi-row INSERT.
+        cursor.executemany(
+            """
+            INSERT INTO Mentions (mention_id, post_id, reply_id, mentioned_user_id, created_at)
+            VALUES (%s, %s, %s, %s, %s);
+            """,
+            [(str(uuid4()), None, reply_id, user_id, now) for user_id in mentioned_user_ids],
+        )
+
+    recipients = [(user_id, NOTIFICATION_MENTION) for user_id in mentioned_user_ids if user_id != author_id]
+    if post_owner_id and post_owner_id != author_id and post_owner_id not in mentioned_user_ids:
+        recipients.append((post_owner_id, NOTIFICATION_REPLY))
+    if recipients:
+        cursor.executemany(
+            """
+            INSERT INTO Notifications (
+                notification_id, user_id, triggered_by_user_id, post_id, reply_id, type, created_at, updated_at
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+            """,
+            [
+                (str(uuid4()), user_id, author_id, post_id, reply_id, notification_type, now, now)
+                for user_id, notification_type in recipients
+            ],
+        )
+        add_unread_notifications(cursor, Counter(user_id for user_id, _ in recipients))
+        for user_id, _ in recipients:
+            after_commit(lambda user_id=user_id: _inbox_cache.invalidate(user_id))
+    return [user_id for user_id, _ in recipients]
+
+
+def inbox_state(user_id: str, cached: bool = True) -> tuple[int, int]:
+    """(unread_count, inbox_version) of a user; the version changes with every inbox change.
+
+    ``cached=False`` reads the row and leaves the cache alone, for a request
+    that has just changed the inbox and has not committed yet.
+    """
+    state = _inbox_cache.get(user_id) if cached else MISSING
+    if state is not MISSING:
+        return state
+
+    with get_db(current_app) as conn:
+        cursor = conn.cursor(cursors.DictCursor)
+        cursor.execute(
+            "SELECT unread_notification_count, notification_version FROM UserStats WHERE user_id = %s;",
+            (user_id,),
+        )
+        row = cursor.fetchone() or {}
+        cursor.close()
+
+    state = (int(row.get("unread_notification_count") or 0), int(row.get("notification_version") or 0))
+    if cached:
+        _inbox_cache.set(user_id, state)
+    return state
+
+
+def parse_notification_cursor(token: Optional[str]) -> Optional[tuple[str, str]]:
+    """Decode a ``cursor``/``since`` token into (created_at, notification_id).
+
+    Raises ValueError when the token is malformed.
+    """
+    if not token:
+        return None
+
+    created_at, notification_id = decode_cursor(token, 2)
+    if not isinstance(created_at, str) or not isinstance(notification_id, str):
+        raise ValueError("Invalid cursor")
+    datetime.fromisoformat(created_at)
+    return created_at, notification_id
+
+
+def _notification_cursor(row: dict) -> str:
+    return encode_cursor(row["created_at"].isoformat(sep=" ", timespec="seconds"), row["notification_id"])
+
+
+def load_notifications(
+    user_id: str,
+    before: Optional[tuple[str, str]] = None,
+    since: Optional[tuple[str, str]] = None,
+    unread_only: bool = False,
+    limit: int = 20,
+) -> tuple[list[dict], Optional[str], bool]:
+    """One page of a user's notifications, newest first.
+
+    ``before`` pages back through older notifications; ``since`` returns only
+    the ones newer than a notification the client already has, oldest of them
+    first in the query so none are skipped when more than ``limit`` arrived.
+    Walks ``idx_notifications_user_created`` (or ``..._user_read_created``
+    with ``unread_only``). Returns (rows, next_cursor, has_more_since).
+    """
+    where_sql = "n.user_id = %s"
+    params: tuple = (user_id,)
+    if unread_only:
+        where_sql += " AND n.is_read = FALSE"
+    if before:
+        created_at, notification_id = before
+        where_sql += " AND (n.created_at < %s OR (n.created_at = %s AND n.notification_id < %s))"
+        params += (created_at, created_at, notification_id)
+    if since:
+        created_at, notification_id = since
+        where_sql += " AND (n.created_at > %s OR (n.created_at = %s AND n.notification_id > %s))"
+        params += (created_at, created_at, notification_id)
+    direction = "ASC" if since else "DESC"
+
+    with get_db(current_app) as conn:
+        cursor = conn.cursor(cursors.DictCursor)
+        cursor.execute(
+            f"""
+            SELECT n.notification_id, n.type, n.is_read, n.post_id, n.reply_id, n.created_at,
+                   a.user_id AS actor_id, a.username AS actor_username, a.display_name AS actor_display_name,
+                   m.url AS actor_image_url
+            FROM Notifications n
+            LEFT JOIN Users a ON a.user_id = n.triggered_by_user_id
+            LEFT JOIN Media m ON m.media_id = a.profile_media_id AND m.is_deleted = FALSE
+            WHERE {where_sql}
+            ORDER BY n.created_at {direction}, n.notification_id {direction}
+            LIMIT %s
+            """,
+            (*params, limit + 1),
+        )
+        rows = list(cursor.fetchall())
+        cursor.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if since:
+        rows.reverse()
+        return rows, None, has_more
+
+    next_cursor = _notification_cursor(rows[-1]) if has_more else None
+    return rows, next_cursor, False
+
+
+def newest_notification_cursor(rows: list[dict], fallback: Optional[str] = None) -> Optional[str]:
+    """``since`` token for the next poll: the newest row's key, or ``fallback`` if there are none."""
+    return _notification_cursor(rows[0]) if rows else fallback
+
+
+def mark_notifications_read(user_id: str, notification_ids: Optional[list[str]] = None) -> int:
+    """Mark some (or, with no ids, all) of a user's notifications read. Returns how many changed."""
+    where_sql = "user_id = %s AND is_read = FALSE"
+    params: tuple = (user_id,)
+    if notification_ids is not None:
+        if not notification_ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(notification_ids))
+        where_sql += f" AND notification_id IN ({placeholders})"
+        params += tuple(notification_ids)
+
+    now = datetime.now().isoformat(timespec="seconds")
+    with get_db(current_app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"UPDATE Notifications SET is_read = TRUE, updated_at = %s WHERE {where_sql};",
+            (now, *params),
+        )
+        changed = cursor.rowcount
+        if changed:
+            adjust_user_stats(cursor, user_id, unread_notifications=-changed)
+        cursor.close()
+
+    after_commit(lambda: _inbox_cache.invalidate(user_id))
+    return changed
@@ -0,0 +1,31 @@
+"""
+Opaque keyset cursors for paginated endpoints.
+
+A cursor is the sort key of the last row on a page, JSON-encoded and wrapped
+in URL-safe base64 so clients treat it as an opaque token.
+"""
+from __future__ import annotations
+import base64
+import binascii
+import json
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> list:
+    """Decode a cursor token into its ``size`` sort-key values.
+
+    Raises ValueError for anything that was not produced by ``encode_cursor``.
+    """
+    padding = "=" * (-len(token) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + padding).decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
@@ -1,10 +1,18 @@
 from __future__ import annotations
+import json
 from datetime import datetime
 from typing import Optional
 from uuid import uuid4
-from flask import current_app
+from flask import Flask, current_app
 from pymysql import cursors
+from .auth import invalidate_cached_user
+from .cache import MISSING, TTLCache
 from .db import get_db
+from .pagination import decode_cursor, encode_cursor
+from .stats import adjust_user_stats
+from .timeline import backfill_author, fanout_enabled, prune_author
+
+_profile_page_cache = TTLCache("profile_page", maxsize=1000, ttl=10)
 
 def create_profile(user_id: str, display_name: Optional[str] = None, bio: Optional[str] = None) -> bool:
     if not user_id:
@@ -45,23 +53,13 @@ def get_profile_by_user_id(user_id: str) -> Optional[dict]:
                 u.display_name,
                 u.bio,
                 m.url AS profile_image_url,
+                m.renditions AS profile_image_renditions,
                 u.created_at,
-                (
-                    SELECT COUNT(*)
-                    FROM Posts p
-                    WHERE p.user_id = u.user_id AND p.is_deleted = FALSE
-                ) AS posts_count,
-                (
-                    SELECT COUNT(*)
-                    FROM Followers f
-                    WHERE f.followed_id = u.user_id
-                ) AS followers_count,
-                (
-                    SELECT COUNT(*)
-                    FROM Followers f
-                    WHERE f.follower_id = u.user_id
-                ) AS following_count
+                COALESCE(us.post_count, 0) AS posts_count,
+                COALESCE(us.follower_count, 0) AS followers_count,
+                COALESCE(us.following_count, 0) AS following_count
             FROM Users u
+            LEFT JOIN UserStats us ON us.user_id = u.user_id
             LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
             WHERE u.user_id = %s AND u.is_deleted = FALSE
             LIMIT 1
@@ -89,23 +87,13 @@ def get_profile_by_username(username: str) -> Optional[dict]:
                 u.display_name,
                 u.bio,
                 m.url AS profile_image_url,
+                m.renditions AS profile_image_renditions,
                 u.created_at,
-                (
-                    SELECT COUNT(*)
-                    FROM Posts p
-                    WHERE p.user_id = u.user_id AND p.is_deleted = FALSE
-                ) AS posts_count,
-                (
-                    SELECT COUNT(*)
-                    FROM Followers f
-                    WHERE f.followed_id = u.user_id
-                ) AS followers_count,
-                (
-                    SELECT COUNT(*)
-                    FROM Followers f
-                    WHERE f.follower_id = u.user_id
-                ) AS following_count
+                COALESCE(us.post_count, 0) AS posts_count,
+                COALESCE(us.follower_count, 0) AS followers_count,
+                COALESCE(us.following_count, 0) AS following_count
             FROM Users u
+            LEFT JOIN UserStats us ON us.user_id = u.user_id
             LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
             WHERE u.username = %s AND u.is_deleted = FALSE
             LIMIT 1
@@ -118,6 +106,147 @@ def get_profile_by_username(username: str) -> Optional[dict]:
     return row
 
 
+def configure_profile_page_cache(app: Flask) -> None:
+    _profile_page_cache.configure(
+        maxsize=app.config.get("PROFILE_PAGE_CACHE_MAX_ENTRIES", 1000),
+        ttl=app.config.get("PROFILE_PAGE_CACHE_TTL_SECONDS", 10),
+    )
+
+
+def _fetch_profile_page(conn, username: str, viewer_id: Optional[str], posts_limit: int, follow_limit: int) -> Optional[dict]:
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute(
+        """
+        SELECT
+            u.user_id,
+            u.username,
+            u.email,
+            u.display_name,
+            u.bio,
+            m.url AS profile_image_url,
+            m.renditions AS profile_image_renditions,
+            u.created_at,
+            COALESCE(us.post_count, 0) AS posts_count,
+            COALESCE(us.follower_count, 0) AS followers_count,
+            COALESCE(us.following_count, 0) AS following_count,
+            EXISTS (
+                SELECT 1
+                FROM Followers vf
+                JOIN Users viewer ON viewer.user_id = vf.follower_id AND viewer.is_deleted = FALSE
+                WHERE vf.follower_id = %s
+                  AND vf.followed_id = u.user_id
+            ) AS viewer_is_following
+        FROM Users u
+        LEFT JOIN UserStats us ON us.user_id = u.user_id
+        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+        WHERE u.username = %s AND u.is_deleted = FALSE
+        LIMIT 1
+        """,
+        (viewer_id, username),
+    )
+    profile = cursor.fetchone()
+    if not profile:
+        cursor.close()
+        return None
+
+    # Recent posts and both follow lists in one round trip; `kind` tells the
+    # branches apart and unused columns are NULL.
+    user_id = profile["user_id"]
+    cursor.execute(
+        """
+        (
+            SELECT 'post' AS kind, p.post_id AS id, p.content, p.created_at, p.updated_at,
+                   NULL AS username, NULL AS display_name,
+                   NULL AS profile_image_url, NULL AS profile_image_renditions
+            FROM Posts p
+            WHERE p.user_id = %s AND p.is_deleted = FALSE
+            ORDER BY p.created_at DESC
+            LIMIT %s
+        )
+        UNION ALL
+        (
+            SELECT 'follower', u.user_id, NULL, f.created_at, NULL,
+                   u.username, u.display_name, m.url, m.renditions
+            FROM Followers f
+            JOIN Users u ON u.user_id = f.follower_id AND u.is_deleted = FALSE
+            LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+            WHERE f.followed_id = %s
+            ORDER BY f.created_at DESC
+            LIMIT %s
+        )
+        UNION ALL
+        (
+            SELECT 'following', u.user_id, NULL, f.created_at, NULL,
+                   u.username, u.display_name, m.url, m.renditions
+            FROM Followers f
+            JOIN Users u ON u.user_id = f.followed_id AND u.is_deleted = FALSE
+            LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+            WHERE f.follower_id = %s
+            ORDER BY f.created_at DESC
+            LIMIT %s
+        )
+        """,
+        (user_id, posts_limit, user_id, follow_limit, user_id, follow_limit),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+
+    page = {
+        "profile": profile,
+        "viewer_is_following": bool(profile.pop("viewer_is_following")) and viewer_id != user_id,
+        "recent_posts": [],
+        "followers": [],
+        "following": [],
+    }
+    for row in rows:
+        if row["kind"] == "post":
+            page["recent_posts"].append(
+                {
+                    "post_id": row["id"],
+                    "content": row["content"],
+                    "created_at": row["created_at"],
+                    "updated_at": row["updated_at"],
+                }
+            )
+        else:
+            page["followers" if row["kind"] == "follower" else "following"].append(
+                {
+                    "user_id": row["id"],
+                    "username": row["username"],
+                    "display_name": row["display_name"],
+                    "profile_image_url": row["profile_image_url"],
+                    "profile_image_renditions": row["profile_image_renditions"],
+                }
+            )
+    return page
+
+
+def load_profile_page(username: str, viewer_id: Optional[str] = None, posts_limit: int = 20, follow_limit: int = 20) -> Optional[dict]:
+    """Everything the profile page shows, in two statements on one connection.
+
+    Returns {profile, recent_posts, viewer_is_following, followers, following}
+    or None when the user does not exist. Pages for anonymous viewers are kept
+    in a short-lived per-process cache (``PROFILE_PAGE_CACHE_TTL_SECONDS``).
+    """
+    if not username:
+        return None
+
+    posts_limit = max(1, min(posts_limit, 50))
+    follow_limit = max(1, min(follow_limit, 100))
+    cache_key = (username, posts_limit, follow_limit)
+    if viewer_id is None:
+        page = _profile_page_cache.get(cache_key)
+        if page is not MISSING:
+            return page
+
+    with get_db(current_app) as conn:
+        page = _fetch_profile_page(conn, username, viewer_id, posts_limit, follow_limit)
+
+    if viewer_id is None and page is not None:
+        _profile_page_cache.set(cache_key, page)
+    return page
+
+
 def list_recent_posts_for_user(user_id: str, limit: int = 20) -> list[dict]:
     if not user_id:
         return []
@@ -200,6 +329,16 @@ def follow_user(follower_id: str, followed_id: str) -> bool:
             (follower_id, followed_id, now, now),
         )
         inserted_rows = cursor.rowcount
+        if inserted_rows > 0:
+            adjust_user_stats(cursor, follower_id, following=1)
+            adjust_user_stats(cursor, followed_id, followers=1)
+        if inserted_rows > 0 and fanout_enabled(current_app):
+            backfill_author(
+                cursor,
+                follower_id,
+                followed_id,
+                current_app.config.get("FEED_FANOUT_BACKFILL_LIMIT", 200),
+            )
         cursor.close()
 
     return inserted_rows > 0
@@ -220,6 +359,10 @@ def unfollow_user(follower_id: str, followed_id: str) -> bool:
             (follower_id, followed_id),
         )
         deleted_rows = cursor.rowcount
+        if deleted_rows > 0:
+            adjust_user_stats(cursor, follower_id, following=-1)
+            adjust_user_stats(cursor, followed_id, followers=-1)
+            prune_author(cursor, follower_id, followed_id)
         cursor.close()
 
     return deleted_rows > 0
@@ -234,7 +377,7 @@ def list_followers(user_id: str, limit: int = 20) -> list[dict]:
         cursor = conn.cursor(cursors.DictCursor)
         cursor.execute(
             """
-            SELECT u.user_id, u.username, u.display_name, m.url AS profile_image_url
+            SELECT u.user_id, u.username, u.display_name, m.url AS profile_image_url, m.renditions AS profile_image_renditions
             FROM Followers f
             JOIN Users u ON u.user_id = f.follower_id AND u.is_deleted = FALSE
             LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
@@ -259,7 +402,7 @@ def list_following(user_id: str, limit: int = 20) -> list[dict]:
         cursor = conn.cursor(cursors.DictCursor)
         cursor.execute(
             """
-            SELECT u.user_id, u.username, u.display_name, m.url AS profile_image_url
+            SELECT u.user_id, u.username, u.display_name, m.url AS profile_image_url, m.renditions AS profile_image_renditions
             FROM Followers f
             JOIN Users u ON u.user_id = f.followed_id AND u.is_deleted = FALSE
             LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
@@ -275,6 +418,75 @@ def list_following(user_id: str, limit: int = 20) -> list[dict]:
     return rows
 
 
+_FOLLOW_DIRECTIONS = {
+    # direction: (column matching the profile, column of the listed users)
+    "followers": ("followed_id", "follower_id"),
+    "following": ("follower_id", "followed_id"),
+}
+
+
+def parse_follow_cursor(token: Optional[str]) -> Optional[tuple[str, str]]:
+    """Decode a follow-list cursor into (created_at, user_id).
+
+    Raises ValueError when the token is malformed.
+    """
+    if not token:
+        return None
+
+    created_at, user_id = decode_cursor(token, 2)
+    if not isinstance(created_at, str) or not isinstance(user_id, str):
+        raise ValueError("Invalid cursor")
+    datetime.fromisoformat(created_at)
+    return created_at, user_id
+
+
+def load_follow_page(
+    user_id: str,
+    direction: str,
+    cursor_values: Optional[tuple[str, str]] = None,
+    limit: int = 20,
+) -> tuple[list[dict], Optional[str]]:
+    """One page of a user's followers or followed users, newest follow first.
+
+    Walks ``idx_followers_followed_page`` / ``idx_followers_follower_page`` by
+    (created_at, user id) so every page costs the same however deep it is.
+    Returns (users, next_cursor).
+    """
+    match_column, listed_column = _FOLLOW_DIRECTIONS[direction]
+    where_sql = f"f.{match_column} = %s"
+    params: tuple = (user_id,)
+    if cursor_values:
+        created_at, last_user_id = cursor_values
+        where_sql += f" AND (f.created_at < %s OR (f.created_at = %s AND f.{listed_column} < %s))"
+        params += (created_at, created_at, last_user_id)
+
+    with get_db(current_app) as conn:
+        cursor = conn.cursor(cursors.DictCursor)
+        cursor.execute(
+            f"""
+            SELECT u.user_id, u.username, u.display_name,
+                   m.url AS profile_image_url, m.renditions AS profile_image_renditions,
+                   f.created_at AS followed_at
+            FROM Followers f
+            JOIN Users u ON u.user_id = f.{listed_column} AND u.is_deleted = FALSE
+            LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+            WHERE {where_sql}
+            ORDER BY f.created_at DESC, f.{listed_column} DESC
+            LIMIT %s
+            """,
+            (*params, limit + 1),
+        )
+        rows = list(cursor.fetchall())
+        cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["followed_at"].isoformat(sep=" ", timespec="seconds"), last["user_id"])
+    return rows, next_cursor
+
+
 def update_profile(user_id: str, display_name: Optional[str], bio: Optional[str]) -> bool:
     if not user_id:
         return False
@@ -296,6 +508,7 @@ def update_profile(user_id: str, display_name: Optional[str], bio: Optional[str]
         updated_rows = cursor.rowcount
         cursor.close()
 
+    invalidate_cached_user(user_id)
     return updated_rows > 0
 
 
@@ -320,14 +533,21 @@ def delete_profile(user_id: str) -> bool:
         updated_rows = cursor.rowcount
         cursor.close()
 
+    invalidate_cached_user(user_id)
     return updated_rows > 0
 
 
-def upsert_profile_image(user_id: str, media_url: str, media_type: str = "image/webp") -> bool:
+def upsert_profile_image(
+    user_id: str,
+    media_url: str,
+    media_type: str = "image/webp",
+    renditions: Optional[list[dict]] = None,
+) -> bool:
     if not user_id or not media_url:
         return False
 
     now = datetime.now().isoformat(timespec="seconds")
+    renditions_json = json.dumps(renditions) if renditions else None
 
     with get_db(current_app) as conn:
         cursor = conn.cursor(cursors.DictCursor)
@@ -353,22 +573,23 @@ def upsert_profile_image(user_id: str, media_url: str, media_type: str = "image/
                 UPDATE Media
                 SET url = %s,
                     media_type = %s,
+                    renditions = %s,
                     is_deleted = FALSE,
                     deleted_at = NULL,
                     deleted_by = NULL,
                     updated_at = %s
                 WHERE media_id = %s
                 """,
-                (media_url, media_type, now, media_id),
+                (media_url, media_type, renditions_json, now, media_id),
             )
         else:
             media_id = str(uuid4())
             cursor.execute(
                 """
-                INSERT INTO Media (media_id, post_id, reply_id, url, media_type, is_deleted, created_at, updated_at)
-                VALUES (%s, NULL, NULL, %s, %s, FALSE, %s, %s)
+                INSERT INTO Media (media_id, post_id, reply_id, url, media_type, renditions, is_deleted, created_at, updated_at)
+                VALUES (%s, NULL, NULL, %s, %s, %s, FALSE, %s, %s)
                 """,
-                (media_id, media_url, media_type, now, now),
+                (media_id, media_url, media_type, renditions_json, now, now),
             )
             cursor.execute(
                 """
@@ -382,4 +603,5 @@ def upsert_profile_image(user_id: str, media_url: str, media_type: str = "image/
 
         cursor.close()
 
+    invalidate_cached_user(user_id)
     return True
\ No newline at end of file
@@ -1,26 +1,29 @@
 from __future__ import annotations
-from io import BytesIO
-from pathlib import Path
+import logging
 from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required, logout_user
-from PIL import Image, UnidentifiedImageError
+from PIL import UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
+from .images import avatar_srcset, check_image_header, read_limited, rendition_sizes
 from .profile import (
     create_profile,
     delete_profile,
     follow_user,
     get_profile_by_username,
     is_following,
-    list_followers,
-    list_following,
-    list_recent_posts_for_user,
+    load_follow_page,
+    load_profile_page,
+    parse_follow_cursor,
     unfollow_user,
-    upsert_profile_image,
     update_profile,
 )
 
+logger = logging.getLogger(__name__)
+
 profile_bp = Blueprint("profile", __name__)
 
-ALLOWED_IMAGE_FORMATS = {"JPEG", "PNG", "WEBP"}
+# Room for multipart boundaries, headers and the other form fields.
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
 
 def _normalize_profile_input(display_name: str | None, bio: str | None) -> tuple[str | None, str | None]:
@@ -35,22 +38,6 @@ def _normalize_profile_input(display_name: str | None, bio: str | None) -> tuple
     return clean_display_name, clean_bio
 
 
-def _transform_profile_image(raw_bytes: bytes) -> bytes:
-    max_dimension = int(current_app.config.get("PROFILE_IMAGE_MAX_DIMENSION", 512))
-
-    with Image.open(BytesIO(raw_bytes)) as image:
-        source_format = (image.format or "").upper()
-        if source_format not in ALLOWED_IMAGE_FORMATS:
-            raise ValueError("Only JPG, PNG, and WEBP images are allowed.")
-
-        normalized = image.convert("RGBA")
-        normalized.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
-
-        out_buffer = BytesIO()
-        normalized.save(out_buffer, format="WEBP", quality=85, method=6)
-        return out_buffer.getvalue()
-
-
 @profile_bp.route("/profile")
 @login_required
 def my_profile():
@@ -60,29 +47,23 @@ def my_profile():
 @profile_bp.route("/profile/<username>")
 def user_profile(username: str):
     default_avatar_url = "https://images.unsplash.com/photo-1494790108377-be9c29b29330?w=100&h=100&fit=crop"
-    profile = get_profile_by_username(username)
-    if not profile:
+    viewer_id = current_user.get_id() if current_user.is_authenticated else None
+    page = load_profile_page(username, viewer_id)
+    if not page:
         flash("Profile not found.", "danger")
         return redirect(url_for("dashboard"))
 
-    recent_posts = list_recent_posts_for_user(profile["user_id"], limit=20)
-    is_owner = current_user.is_authenticated and current_user.get_id() == profile["user_id"]
-    viewer_is_following = (
-        current_user.is_authenticated
-        and not is_owner
-        and is_following(current_user.get_id(), profile["user_id"])
-    )
-    followers = list_followers(profile["user_id"], limit=20)
-    following = list_following(profile["user_id"], limit=20)
+    profile = page["profile"]
+    is_owner = viewer_id == profile["user_id"]
 
     return render_template(
         "profile.html",
         profile=profile,
-        recent_posts=recent_posts,
+        recent_posts=page["recent_posts"],
         is_owner=is_owner,
-        viewer_is_following=viewer_is_following,
-        followers=followers,
-        following=following,
+        viewer_is_following=page["viewer_is_following"],
+        followers=page["followers"],
+        following=page["following"],
         default_avatar_url=default_avatar_url,
     )
 
@@ -111,22 +92,27 @@ def update_my_profile():
 @profile_bp.route("/profile/picture", methods=["POST"])
 @login_required
 def update_profile_picture():
-    file = request.files.get("profile_picture")
-    if not file or not file.filename:
-        flash("Choose an image to upload.", "danger")
+    max_bytes = int(current_app.config.get("PROFILE_IMAGE_MAX_BYTES", 5 * 1024 * 1024))
+    too_large_message = f"Image is too large. Maximum size is {max_bytes // (1024 * 1024)} MB."
+    # Bound the whole multipart body so an oversize upload is refused from its
+    # Content-Length, or as soon as a chunked body crosses the limit.
+    request.max_content_length = max_bytes + _MULTIPART_OVERHEAD_BYTES
+    try:
+        file = request.files.get("profile_picture")
+        if not file or not file.filename:
+            flash("Choose an image to upload.", "danger")
+            return redirect(url_for("profile.my_profile"))
+        raw_bytes = read_limited(file.stream, max_bytes)
+    except RequestEntityTooLarge:
+        flash(too_large_message, "danger")
         return redirect(url_for("profile.my_profile"))
 
-    raw_bytes = file.read()
-    max_bytes = int(current_app.config.get("PROFILE_IMAGE_MAX_BYTES", 5 * 1024 * 1024))
     if not raw_bytes:
         flash("Uploaded file is empty.", "danger")
         return redirect(url_for("profile.my_profile"))
-    if len(raw_bytes) > max_bytes:
-        flash("Image is too large. Maximum size is 5 MB.", "danger")
-        return redirect(url_for("profile.my_profile"))
 
     try:
-        transformed = _transform_profile_image(raw_bytes)
+        check_image_header(raw_bytes, int(current_app.config.get("PROFILE_IMAGE_MAX_PIXELS", 40_000_000)))
     except UnidentifiedImageError:
         flash("Invalid image file.", "danger")
         return redirect(url_for("profile.my_profile"))
@@ -134,21 +120,29 @@ def update_profile_picture():
         flash(str(exc), "danger")
         return redirect(url_for("profile.my_profile"))
 
+    # Resizing and encoding happen in the image pipeline; Media.url is
+    # switched to the new file once it has been written.
     upload_subdir = current_app.config.get("PROFILE_IMAGE_UPLOAD_SUBDIR", "uploads/profile")
-    upload_dir = Path(current_app.static_folder) / upload_subdir
-    upload_dir.mkdir(parents=True, exist_ok=True)
-
-    file_name = f"{current_user.get_id()}.webp"
-    absolute_file_path = upload_dir / file_name
-    absolute_file_path.write_bytes(transformed)
-
-    media_url = url_for("static", filename=f"{upload_subdir}/{file_name}")
-    updated = upsert_profile_image(current_user.get_id(), media_url, media_type="image/webp")
-    if not updated:
+    pipeline = current_app.extensions["image_pipeline"]
+    try:
+        queued = pipeline.enqueue(
+            current_user.get_id(),
+            raw_bytes,
+            output_subdir=upload_subdir,
+            media_url_prefix=url_for("static", filename=upload_subdir),
+            sizes=rendition_sizes(current_app),
+        )
+    except OSError as exc:
+        logger.error(f"Could not queue profile picture: {exc}")
+        queued = False
+    if not queued:
         flash("Could not update profile picture.", "danger")
         return redirect(url_for("profile.my_profile"))
 
-    flash("Profile picture updated.", "success")
+    if pipeline.workers == 0:
+        flash("Profile picture updated.", "success")
+    else:
+        flash("Profile picture uploaded. It will appear in a moment.", "success")
     return redirect(url_for("profile.my_profile"))
 
 
@@ -211,6 +205,41 @@ def get_profile_api(username: str):
     }, 200
 
 
+@profile_bp.route("/api/profile/<username>/followers", methods=["GET"], defaults={"direction": "followers"})
+@profile_bp.route("/api/profile/<username>/following", methods=["GET"], defaults={"direction": "following"})
+def list_follows_api(username: str, direction: str):
+    try:
+        cursor_values = parse_follow_cursor(request.args.get("cursor"))
+    except ValueError:
+        return {"error": "Invalid cursor"}, 400
+
+    profile = get_profile_by_username(username)
+    if not profile:
+        return {"error": "Profile not found"}, 404
+
+    users, next_cursor = load_follow_page(
+        profile["user_id"],
+        direction,
+        cursor_values,
+        int(current_app.config.get("FOLLOW_PAGE_SIZE", 20)),
+    )
+    return {
+        "username": profile["username"],
+        direction: [
+            {
+                "user_id": user["user_id"],
+                "username": user["username"],
+                "display_name": user.get("display_name"),
+                "profile_image_url": user.get("profile_image_url"),
+                "profile_image_srcset": avatar_srcset(user.get("profile_image_renditions")) or None,
+                "followed_at": user["followed_at"].isoformat() if user.get("followed_at") else None,
+            }
+            for user in users
+        ],
+        "next_cursor": next_cursor,
+    }, 200
+
+
 @profile_bp.route("/api/profile/<username>/follow", methods=["GET", "POST", "DELETE"])
 @login_required
 def follow_profile_api(username: str):
@@ -0,0 +1,187 @@
+"""
+Reaction types and idempotent like writes for posts and replies.
+
+``reaction_types`` is a process-wide registry that maps ReactionTypes names
+to ids. The table is tiny and changes rarely, so it is loaded once at startup
+and queries filter on ``reaction_type_id`` directly instead of joining
+ReactionTypes on the name. A name missing from the map causes one reload,
+which is how a type added by another worker (``flask add-reaction-type``)
+becomes visible here.
+
+Reactions has unique ``(user_id, post_id, reaction_type_id)`` and
+``(user_id, reply_id, reaction_type_id)`` keys, so adding a like is a single
+``INSERT ... ON DUPLICATE KEY UPDATE`` and removing one a single ``DELETE``.
+The affected-row count says whether anything changed, and only then is the
+PostStats/ReplyStats counter adjusted; the like count returned to clients is
+read back from that counter instead of counting Reactions. The count readers
+expect a ``DictCursor``.
+"""
+from __future__ import annotations
+import logging
+from datetime import datetime
+from typing import Optional
+from uuid import uuid4
+from flask import Flask
+from pymysql import cursors
+from .db import get_db
+from .stats import adjust_post_stats, adjust_reply_stats
+
+logger = logging.getLogger(__name__)
+
+LIKE = "like"
+BUILTIN_REACTION_TYPES = (LIKE,)
+
+
+class ReactionTypeRegistry:
+    """In-memory name -> reaction_type_id map for the ReactionTypes table."""
+
+    def __init__(self) -> None:
+        self._ids: dict[str, str] = {}
+
+    def load(self, conn) -> None:
+        cursor = conn.cursor(cursors.DictCursor)
+        cursor.execute("SELECT reaction_type_id, name FROM ReactionTypes;")
+        # Swap the whole map so concurrent readers never see a partial one.
+        self._ids = {row["name"]: row["reaction_type_id"] for row in cursor.fetchall()}
+        cursor.close()
+
+    def get(self, conn, name: str) -> Optional[str]:
+        """Id of a reaction type, or None if it does not exist."""
+        reaction_type_id = self._ids.get(name)
+        if reaction_type_id is None:
+            self.load(conn)
+            reaction_type_id = self._ids.get(name)
+        return reaction_type_id
+
+    def ensure(self, conn, name: str) -> str:
+        """Id of a reaction type, creating it if it does not exist yet."""
+        reaction_type_id = self.get(conn, name)
+        if reaction_type_id is not None:
+            return reaction_type_id
+
+        now = datetime.now().isoformat(timespec="seconds")
+        cursor = conn.cursor()
+        # The name is unique, so a concurrent insert by another worker wins
+        # and the reload below picks up its id.
+        cursor.execute(
+            """
+            INSERT IGNORE INTO ReactionTypes (reaction_type_id, name, created_at, updated_at)
+            VALUES (%s, %s, %s, %s);
+            """,
+            (str(uuid4()), name, now, now),
+        )
+        cursor.close()
+        self.load(conn)
+        return self._ids[name]
+
+    def names(self) -> list[str]:
+        return sorted(self._ids)
+
+
+reaction_types = ReactionTypeRegistry()
+
+
+def init_reaction_types(app: Flask) -> None:
+    """Create the built-in reaction types and load the registry."""
+    try:
+        with get_db(app) as conn:
+            for name in BUILTIN_REACTION_TYPES:
+                reaction_types.ensure(conn, name)
+    except Exception as e:
+        logger.warning(f"Could not load reaction types: {e}")
+
+
+def set_post_like(cursor, user_id: str, post_id: str, reaction_type_id: str, liked: bool) -> bool:
+    """Like or unlike a live post. Returns True if a reaction row changed.
+
+    Nothing is written for a missing or deleted post; ``post_like_count``
+    tells the caller whether the post exists.
+    """
+    if liked:
+        now = datetime.now().isoformat(timespec="seconds")
+        cursor.execute(
+            """
+            INSERT INTO Reactions (
+                reaction_id, user_id, post_id, reply_id, reaction_type_id, created_at, updated_at
+            )
+            SELECT %s, %s, p.post_id, NULL, %s, %s, %s
+            FROM Posts p
+            WHERE p.post_id = %s
+              AND p.is_deleted = FALSE
+            ON DUPLICATE KEY UPDATE Reactions.reaction_id = Reactions.reaction_id;
+            """,
+            (str(uuid4()), user_id, reaction_type_id, now, now, post_id),
+        )
+    else:
+        cursor.execute(
+            """
+            DELETE r
+            FROM Reactions r
+            JOIN Posts p ON p.post_id = r.post_id AND p.is_deleted = FALSE
+            WHERE r.user_id = %s
+              AND r.post_id = %s
+              AND r.reply_id IS NULL
+              AND r.reaction_type_id = %s;
+            """,
+            (user_id, post_id, reaction_type_id),
+        )
+
+    changed = cursor.rowcount > 0
+    if changed:
+        adjust_post_stats(cursor, post_id, likes=1 if liked else -1)
+    return changed
+
+
+def set_reply_like(cursor, user_id: str, reply_id: str, reaction_type_id: str, liked: bool) -> bool:
+    """Like or unlike a reply the caller has already checked. Returns True if a row changed."""
+    if liked:
+        now = datetime.now().isoformat(timespec="seconds")
+        cursor.execute(
+            """
+            INSERT INTO Reactions (
+                reaction_id, user_id, post_id, reply_id, reaction_type_id, created_at, updated_at
+            )
+            VALUES (%s, %s, NULL, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE reaction_id = reaction_id;
+            """,
+            (str(uuid4()), user_id, reply_id, reaction_type_id, now, now),
+        )
+    else:
+        cursor.execute(
+            """
+            DELETE FROM Reactions
+            WHERE user_id = %s
+              AND reply_id = %s
+              AND post_id IS NULL
+              AND reaction_type_id = %s;
+            """,
+            (user_id, reply_id, reaction_type_id),
+        )
+
+    changed = cursor.rowcount > 0
+    if changed:
+        adjust_reply_stats(cursor, reply_id, likes=1 if liked else -1)
+    return changed
+
+
+def post_like_count(cursor, post_id: str) -> Optional[int]:
+    """Like counter of a live post, or None if the post does not exist."""
+    cursor.execute(
+        """
+        SELECT COALESCE(ps.like_count, 0) AS likes
+        FROM Posts p
+        LEFT JOIN PostStats ps ON ps.post_id = p.post_id
+        WHERE p.post_id = %s
+          AND p.is_deleted = FALSE;
+        """,
+        (post_id,),
+    )
+    row = cursor.fetchone()
+    return int(row["likes"]) if row else None
+
+
+def reply_like_count(cursor, reply_id: str) -> int:
+    """Like counter of a reply (0 if it has never been liked)."""
+    cursor.execute("SELECT like_count FROM ReplyStats WHERE reply_id = %s;", (reply_id,))
+    row = cursor.fetchone()
+    return int(row["like_count"]) if row else 0
@@ -0,0 +1,309 @@
+"""
+Post and user search.
+
+The default ``fulltext`` backend uses the MySQL FULLTEXT indexes on
+``Posts(content)`` and ``Users(username, display_name)`` in boolean mode, so
+every query term is a required prefix match and results are ranked by MySQL's
+relevance score. A post matches when its content contains all terms or when
+its author's names do.
+
+This is narrower than the ``LIKE '%term%'`` filters it replaced, on purpose:
+terms only match at the start of a word ("grape" finds "grapefruit", "fruit"
+does not), and a query can no longer be satisfied by some terms in the
+content and the rest in the author's names. Both would need a full scan.
+
+The ``memory`` backend answers the same queries from a pure-Python inverted
+index built from the database. It is meant for tests and for servers where
+FULLTEXT is unavailable; the index is rebuilt at most every
+``SEARCH_MEMORY_REFRESH_SECONDS`` (0 rebuilds it for every query).
+"""
+from __future__ import annotations
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Iterable, Optional
+from flask import current_app
+from pymysql import cursors
+from .pagination import decode_cursor, encode_cursor
+
+MAX_SEARCH_TERMS = 5
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_POST_COLUMNS_SQL = """
+    p.post_id, p.content, p.created_at,
+    u.user_id, u.username, u.display_name,
+    m.url AS profile_image_url, m.renditions AS profile_image_renditions
+"""
+
+_USER_COLUMNS_SQL = """
+    u.user_id, u.username, u.display_name, m.url AS profile_image_url, m.renditions AS profile_image_renditions
+"""
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def search_terms(query: Optional[str]) -> list[str]:
+    """Split a user query into at most ``MAX_SEARCH_TERMS`` lowercase word terms."""
+    terms: list[str] = []
+    for term in tokenize(query):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_SEARCH_TERMS]
+
+
+def _boolean_query(terms: list[str]) -> str:
+    return " ".join(f"+{term}*" for term in terms)
+
+
+def parse_search_cursor(token: Optional[str]) -> int:
+    """Decode a search cursor into a result offset.
+
+    Raises ValueError when the token is malformed.
+    """
+    if not token:
+        return 0
+    (offset,) = decode_cursor(token, 1)
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def _page(rows: list, limit: int, offset: int) -> tuple[list, Optional[str]]:
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(offset + limit)
+    return rows, None
+
+
+class InvertedIndex:
+    """Token -> {doc_id: term frequency} index with prefix lookups."""
+
+    def __init__(self) -> None:
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._tokens: list[str] = []
+
+    def add(self, doc_id: str, *texts: Optional[str]) -> None:
+        for text in texts:
+            for token in tokenize(text):
+                postings = self._postings[token]
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+        self._tokens = sorted(self._postings)
+
+    def _prefix_matches(self, prefix: str) -> dict[str, int]:
+        matches: dict[str, int] = {}
+        start = bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            for doc_id, count in self._postings[token].items():
+                matches[doc_id] = matches.get(doc_id, 0) + count
+        return matches
+
+    def search(self, terms: Iterable[str]) -> dict[str, int]:
+        """Return {doc_id: score} for documents matching every term as a prefix."""
+        scores: Optional[dict[str, int]] = None
+        for term in terms:
+            matches = self._prefix_matches(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {doc_id: scores[doc_id] + count for doc_id, count in matches.items() if doc_id in scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+
+class _MemorySearchIndex:
+    def __init__(self) -> None:
+        self.post_content = InvertedIndex()
+        self.user_names = InvertedIndex()
+        self.post_authors: dict[str, str] = {}
+        self.built_at = 0.0
+
+
+_memory_index: Optional[_MemorySearchIndex] = None
+_memory_index_lock = threading.Lock()
+
+
+def _build_memory_index(conn) -> _MemorySearchIndex:
+    index = _MemorySearchIndex()
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute("SELECT user_id, username, display_name FROM Users WHERE is_deleted = FALSE;")
+    for row in cursor.fetchall():
+        index.user_names.add(row["user_id"], row.get("username"), row.get("display_name"))
+    cursor.execute("SELECT post_id, user_id, content FROM Posts WHERE is_deleted = FALSE;")
+    for row in cursor.fetchall():
+        index.post_content.add(row["post_id"], row.get("content"))
+        index.post_authors[row["post_id"]] = row["user_id"]
+    cursor.close()
+    index.built_at = time.monotonic()
+    return index
+
+
+def _get_memory_index(conn) -> _MemorySearchIndex:
+    global _memory_index
+    refresh_seconds = float(current_app.config.get("SEARCH_MEMORY_REFRESH_SECONDS", 30))
+    with _memory_index_lock:
+        if _memory_index is None or time.monotonic() - _memory_index.built_at >= refresh_seconds:
+            _memory_index = _build_memory_index(conn)
+        return _memory_index
+
+
+def _use_memory_backend() -> bool:
+    return current_app.config.get("SEARCH_BACKEND", "fulltext") == "memory"
+
+
+def _fetch_ranked(conn, columns_sql: str, from_sql: str, id_column: str, scores: dict[str, int]) -> list[dict]:
+    if not scores:
+        return []
+    placeholders = ", ".join(["%s"] * len(scores))
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute(
+        f"""
+        SELECT {columns_sql}
+        {from_sql}
+          AND {id_column} IN ({placeholders});
+        """,
+        tuple(scores),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    for row in rows:
+        row["score"] = float(scores[row[id_column.split(".")[-1]]])
+    return sorted(rows, key=lambda row: (row["score"], row["created_at"]), reverse=True)
+
+
+def search_users(
+    conn,
+    query: Optional[str],
+    viewer_id: Optional[str] = None,
+    limit: int = 15,
+    offset: int = 0,
+) -> tuple[list[dict], Optional[str]]:
+    """Rank users whose username or display name match every query term.
+
+    Returns (rows, next_cursor); the viewer is never part of the results.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], None
+
+    if _use_memory_backend():
+        index = _get_memory_index(conn)
+        scores = index.user_names.search(terms)
+        scores.pop(viewer_id, None)
+        rows = _fetch_ranked(
+            conn,
+            _USER_COLUMNS_SQL + ", u.created_at",
+            """
+            FROM Users u
+            LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+            WHERE u.is_deleted = FALSE
+            """,
+            "u.user_id",
+            scores,
+        )
+        return _page(rows[offset:offset + limit + 1], limit, offset)
+
+    boolean_query = _boolean_query(terms)
+    exclude_viewer_sql = ""
+    params: list = [boolean_query, boolean_query]
+    if viewer_id:
+        exclude_viewer_sql = "AND u.user_id <> %s"
+        params.append(viewer_id)
+
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute(
+        f"""
+        SELECT {_USER_COLUMNS_SQL},
+               MATCH(u.username, u.display_name) AGAINST(%s IN BOOLEAN MODE) AS score
+        FROM Users u
+        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+        WHERE MATCH(u.username, u.display_name) AGAINST(%s IN BOOLEAN MODE)
+          AND u.is_deleted = FALSE
+          {exclude_viewer_sql}
+        ORDER BY score DESC, u.created_at DESC, u.user_id DESC
+        LIMIT %s OFFSET %s;
+        """,
+        (*params, limit + 1, offset),
+    )
+    rows = list(cursor.fetchall())
+    cursor.close()
+    return _page(rows, limit, offset)
+
+
+def search_posts(
+    conn,
+    query: Optional[str],
+    limit: int = 20,
+    offset: int = 0,
+) -> tuple[list[dict], Optional[str]]:
+    """Rank posts whose content, or whose author's names, match every query term.
+
+    Returns (rows, next_cursor).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], None
+
+    if _use_memory_backend():
+        index = _get_memory_index(conn)
+        scores = index.post_content.search(terms)
+        author_scores = index.user_names.search(terms)
+        if author_scores:
+            for post_id, author_id in index.post_authors.items():
+                if author_id in author_scores:
+                    scores[post_id] = scores.get(post_id, 0) + author_scores[author_id]
+        rows = _fetch_ranked(
+            conn,
+            _POST_COLUMNS_SQL,
+            """
+            FROM Posts p
+            JOIN Users u ON u.user_id = p.user_id
+            LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+            WHERE p.is_deleted = FALSE
+              AND u.is_deleted = FALSE
+            """,
+            "p.post_id",
+            scores,
+        )
+        return _page(rows[offset:offset + limit + 1], limit, offset)
+
+    # Content and author matches are collected separately so each side can use
+    # its own FULLTEXT index; OR-ing both MATCH() calls would force a scan.
+    boolean_query = _boolean_query(terms)
+    cursor = conn.cursor(cursors.DictCursor)
+    cursor.execute(
+        f"""
+        SELECT {_POST_COLUMNS_SQL}, hits.score
+        FROM (
+            SELECT matches.post_id, SUM(matches.score) AS score
+            FROM (
+                SELECT cp.post_id, MATCH(cp.content) AGAINST(%s IN BOOLEAN MODE) AS score
+                FROM Posts cp
+                WHERE MATCH(cp.content) AGAINST(%s IN BOOLEAN MODE)
+                  AND cp.is_deleted = FALSE
+                UNION ALL
+                SELECT ap.post_id, MATCH(au.username, au.display_name) AGAINST(%s IN BOOLEAN MODE) AS score
+                FROM Users au
+                JOIN Posts ap ON ap.user_id = au.user_id AND ap.is_deleted = FALSE
+                WHERE MATCH(au.username, au.display_name) AGAINST(%s IN BOOLEAN MODE)
+                  AND au.is_deleted = FALSE
+            ) matches
+            GROUP BY matches.post_id
+        ) hits
+        JOIN Posts p ON p.post_id = hits.post_id
+        JOIN Users u ON u.user_id = p.user_id
+        LEFT JOIN Media m ON m.media_id = u.profile_media_id AND m.is_deleted = FALSE
+        WHERE u.is_deleted = FALSE
+        ORDER BY hits.score DESC, p.created_at DESC, p.post_id DESC
+        LIMIT %s OFFSET %s;
+        """,
+        (boolean_query, boolean_query, boolean_query, boolean_query, limit + 1, offset),
+    )
+    rows = list(cursor.fetchall())
+    cursor.close()
+    return _page(rows, limit, offset)
@@ -0,0 +1,103 @@
+"""
+Production server: pre-fork Gunicorn workers around ``create_app``.
+
+``python -m app serve`` loads the app once in the master process (so schema
+checks run once), closes the master's database pool and forks the workers.
+Each worker opens its own pool in ``post_fork`` instead of sharing the
+master's sockets. Prometheus runs in multiprocess mode: every worker writes
+its samples to ``PROMETHEUS_MULTIPROC_DIR`` and the master serves the
+aggregated registry on the metrics port.
+"""
+from __future__ import annotations
+import glob
+import logging
+import os
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MULTIPROC_DIR = os.path.join(tempfile.gettempdir(), "echo-prometheus")
+
+
+def _reset_multiproc_dir(path: str) -> None:
+    os.makedirs(path, exist_ok=True)
+    for stale_file in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale_file)
+
+
+def _post_fork(server, worker) -> None:
+    from .db import init_connection_pool
+
+    # With preload_app the master has already loaded the app; wsgi() returns it.
+    app = server.app.wsgi()
+    try:
+        init_connection_pool(app)
+    except Exception as e:
+        logger.error(f"Worker {worker.pid} could not open its connection pool: {e}")
+        if app.config.get("ENV") == "production":
+            raise
+
+
+def _child_exit(server, worker) -> None:
+    from prometheus_flask_exporter.multiprocess import GunicornPrometheusMetrics
+
+    GunicornPrometheusMetrics.mark_process_dead_on_child_exit(worker.pid)
+
+
+def serve(
+    bind: str,
+    workers: int,
+    threads: int,
+    timeout: int = 30,
+    metrics_port: int = 8080,
+) -> None:
+    """Run the app under Gunicorn until the master process exits."""
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not multiproc_dir:
+        # prometheus_client picks its value store when it is first imported,
+        # which has already happened by the time `python -m app` parses its
+        # arguments; restart with the directory set in the environment.
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = DEFAULT_MULTIPROC_DIR
+        _reset_multiproc_dir(DEFAULT_MULTIPROC_DIR)
+        os.execv(sys.executable, [sys.executable, "-m", "app", *sys.argv[1:]])
+    _reset_multiproc_dir(multiproc_dir)
+
+    from gunicorn.app.base import BaseApplication
+
+    def when_ready(server) -> None:
+        from prometheus_flask_exporter.multiprocess import GunicornPrometheusMetrics
+
+        GunicornPrometheusMetrics.start_http_server_when_ready(metrics_port)
+        logger.info(f"Serving aggregated metrics on port {metrics_port}")
+
+    class EchoApplication(BaseApplication):
+        def __init__(self, options: dict) -> None:
+            self.options = options
+            super().__init__()
+
+        def load_config(self) -> None:
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from . import create_app
+            from .db import close_connection_pool
+
+            app = create_app()
+            close_connection_pool()
+            return app
+
+    EchoApplication(
+        {
+            "bind": bind,
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread" if threads > 1 else "sync",
+            "timeout": timeout,
+            "preload_app": True,
+            "post_fork": _post_fork,
+            "child_exit": _child_exit,
+            "when_ready": when_ready,
+        }
+    ).run()
@@ -21,6 +21,10 @@ function createCommentElement(comment) {
     const avatar = document.createElement('img');
     avatar.className = 'comment-avatar';
     avatar.src = comment.author.avatar;
+    if (comment.author.avatarSrcset) {
+        avatar.srcset = comment.author.avatarSrcset;
+        avatar.sizes = '28px';
+    }
     avatar.alt = comment.author.name;
 
     const body = document.createElement('div');
@@ -39,7 +43,7 @@ function createCommentElement(comment) {
 
     const time = document.createElement('span');
     time.className = 'comment-time';
-    time.textContent = formatTimestamp(comment.created_at);
+    time.textContent = formatTimestamp(comment.created_at || comment.timestamp);
 
     const content = document.createElement('p');
     content.className = 'comment-content';
@@ -246,9 +250,16 @@ document.addEventListener('click', async (e) => {
 
     if (!action) return;
 
+    // Likes send the desired state (PUT/DELETE) so a double click or retry
+    // cannot flip the like back.
+    let method = 'POST';
+    if (action === 'like') {
+        method = actionBtn.classList.contains('liked') ? 'DELETE' : 'PUT';
+    }
+
     try {
         const response = await fetch(`/api/posts/${postId}/${action}`, {
-            method: 'POST',
+            method,
         });
 
         if (response.ok) {
@@ -288,16 +299,78 @@ document.addEventListener('click', async (e) => {
 });
 
 // Update all timestamps
-document.querySelectorAll('.post-time').forEach(el => {
-    el.textContent = formatTimestamp(el.textContent);
-});
+function formatTimestamps(root) {
+    root.querySelectorAll('.post-time, .comment-time, .thread-marker-time').forEach(el => {
+        el.textContent = formatTimestamp(el.textContent);
+    });
+}
 
-document.querySelectorAll('.comment-time').forEach(el => {
-    el.textContent = formatTimestamp(el.textContent);
-});
+formatTimestamps(document);
+
+// Infinite scroll: load the next feed page when the sentinel scrolls into view
+const postsFeed = document.getElementById('postsFeed');
+const feedSentinel = document.getElementById('feedSentinel');
+let feedLoading = false;
+
+async function loadNextFeedPage() {
+    const cursor = postsFeed?.dataset.nextCursor;
+    if (!postsFeed || !cursor || feedLoading) return;
+
+    feedLoading = true;
+    try {
+        const response = await fetch(`/api/feed?cursor=${encodeURIComponent(cursor)}`);
+        if (!response.ok) throw new Error('failed');
+        const payload = await response.json();
+
+        const page = document.createElement('div');
+        page.innerHTML = payload.html;
+        formatTimestamps(page);
+        postsFeed.append(...page.children);
+        postsFeed.dataset.nextCursor = payload.next_cursor || '';
+    } catch (_err) {
+        showAlert('Kunde inte ladda fler inlägg.', 'alert-danger');
+    } finally {
+        feedLoading = false;
+    }
+}
+
+if (postsFeed && feedSentinel && 'IntersectionObserver' in window) {
+    const feedObserver = new IntersectionObserver((entries) => {
+        if (entries.some((entry) => entry.isIntersecting)) {
+            loadNextFeedPage();
+        }
+    }, { rootMargin: '600px 0px' });
+    feedObserver.observe(feedSentinel);
+}
+
+// Expand a thread with older comments than the feed preview shows
+document.addEventListener('click', async (e) => {
+    const olderBtn = e.target.closest('.older-comments-btn');
+    if (!olderBtn || olderBtn.disabled) return;
+
+    const postCard = olderBtn.closest('.post-card');
+    const commentsList = postCard?.querySelector('.comments-list');
+    const postId = postCard?.dataset.postId;
+    const cursor = olderBtn.dataset.cursor;
+    if (!commentsList || !postId || !cursor) return;
+
+    olderBtn.disabled = true;
+    try {
+        const response = await fetch(`/api/posts/${postId}/comments?cursor=${encodeURIComponent(cursor)}`);
+        if (!response.ok) throw new Error('failed');
+        const payload = await response.json();
 
-document.querySelectorAll('.thread-marker-time').forEach(el => {
-    el.textContent = formatTimestamp(el.textContent);
+        commentsList.prepend(...payload.comments.map(createCommentElement));
+        if (payload.next_cursor) {
+            olderBtn.dataset.cursor = payload.next_cursor;
+        } else {
+            olderBtn.remove();
+        }
+    } catch (_err) {
+        showAlert('Kunde inte ladda fler kommentarer.', 'alert-danger');
+    } finally {
+        olderBtn.disabled = false;
+    }
 });
 
 document.addEventListener('click', async (e) => {
@@ -470,7 +543,8 @@ document.addEventListener('click', async (e) => {
 
     likeBtn.disabled = true;
     try {
-        const response = await fetch(`/api/replies/${replyId}/like`, { method: 'POST' });
+        const method = likeBtn.classList.contains('liked') ? 'DELETE' : 'PUT';
+        const response = await fetch(`/api/replies/${replyId}/like`, { method });
         if (!response.ok) {
             throw new Error('failed');
         }
@@ -707,6 +781,90 @@ function showAlert(message, type, openModal) {
 
 window.showAlert = showAlert;
 
+// Live updates: likes, comments and thread locks arrive over Server-Sent
+// Events instead of reloading the feed.
+function findPostCard(postId) {
+    return document.querySelector(`.post-card[data-post-id="${CSS.escape(postId)}"]`);
+}
+
+async function appendNewComments(postCard, postId) {
+    const commentsList = postCard.querySelector('.comments-list');
+    if (!commentsList) return;
+
+    const response = await fetch(`/api/posts/${postId}/comments`);
+    if (!response.ok) return;
+    const payload = await response.json();
+    payload.comments.forEach((comment) => {
+        const replyId = comment.reply_id || comment.id;
+        if (commentsList.querySelector(`.reply-like-btn[data-reply-id="${CSS.escape(replyId)}"]`)) return;
+        commentsList.append(createCommentElement(comment));
+    });
+}
+
+function startEventStream(url, retryDelay = 30000) {
+    const currentUserId = document.body.dataset.userId;
+    const source = new EventSource(url);
+
+    source.addEventListener('open', () => {
+        retryDelay = 30000;
+    });
+
+    source.addEventListener('error', () => {
+        // EventSource retries dropped connections itself but gives up for good
+        // on a non-200 answer, e.g. the 503 sent when this worker already
+        // serves its maximum number of streams. Try again later, backing off
+        // up to five minutes, with jitter so rejected tabs do not return together.
+        if (source.readyState !== EventSource.CLOSED) return;
+        const delay = retryDelay * (0.5 + Math.random());
+        setTimeout(() => startEventStream(url, Math.min(retryDelay * 2, 300000)), delay);
+    });
+
+    source.addEventListener('like', (event) => {
+        const data = JSON.parse(event.data);
+        const count = findPostCard(data.post_id)?.querySelector('.like-btn .like-count');
+        if (count) count.textContent = data.likes;
+    });
+
+    source.addEventListener('comment', (event) => {
+        const data = JSON.parse(event.data);
+        // Our own comments are already shown by the submit handler.
+        if (data.author_id === currentUserId) return;
+        const postCard = findPostCard(data.post_id);
+        if (!postCard) return;
+
+        const countEl = postCard.querySelector('.comment-count');
+        if (countEl) {
+            countEl.textContent = `${(parseInt(countEl.textContent, 10) || 0) + 1}`;
+        }
+        appendNewComments(postCard, data.post_id).catch(() => {});
+    });
+
+    source.addEventListener('thread_lock', (event) => {
+        const data = JSON.parse(event.data);
+        const postCard = findPostCard(data.post_id);
+        if (!postCard) return;
+        if (postCard.dataset.threadRestricted !== 'true') {
+            postCard.dataset.canComment = data.is_closed ? 'false' : 'true';
+        }
+        setThreadClosedState(postCard, Boolean(data.is_closed));
+    });
+
+    source.addEventListener('notification', () => {
+        showAlert('Du har en ny notis.', 'alert-info');
+    });
+
+    source.addEventListener('resync', () => {
+        // We fell behind; reconnecting resumes live updates, and the counters
+        // refresh with the next event for each post.
+        source.close();
+        setTimeout(() => startEventStream(url), 1000);
+    });
+}
+
+if (document.body.dataset.eventStream && 'EventSource' in window) {
+    startEventStream(document.body.dataset.eventStream);
+}
+
 const profileBio = document.getElementById('profile_bio');
 const profileBioCount = document.getElementById('profileBioCount');
 
@@ -0,0 +1,292 @@
+"""
+Materialized per-post, per-reply and per-user counters.
+
+PostStats holds reply/like/repost counts so the feed can read them with a
+primary-key join instead of aggregating Replies and Reactions on every
+request; ReplyStats does the same for reply likes and UserStats for the
+post/follower/following counts on profiles and the unread notification count.
+Counters are adjusted inside the same transaction as the write that changes
+them; the ``rebuild_*`` functions recompute everything from the source tables
+to repair drift and are exposed as ``flask rebuild-post-stats`` and
+``flask rebuild-user-stats``.
+"""
+from __future__ import annotations
+from datetime import datetime
+from flask import Flask
+from .db import get_db
+
+_POST_STAT_COLUMNS = {
+    "replies": "reply_count",
+    "likes": "like_count",
+    "reposts": "repost_count",
+}
+
+_USER_STAT_COLUMNS = {
+    "posts": "post_count",
+    "followers": "follower_count",
+    "following": "following_count",
+    "unread_notifications": "unread_notification_count",
+}
+
+
+def _adjust_counters(cursor, table: str, key_column: str, key: str, changed: dict[str, int]) -> None:
+    if not changed:
+        return
+
+    now = datetime.now().isoformat(timespec="seconds")
+    columns = ", ".join(changed)
+    placeholders = ", ".join(["GREATEST(%s, 0)"] * len(changed))
+    updates = ", ".join(f"{column} = GREATEST({column} + %s, 0)" for column in changed)
+    cursor.execute(
+        f"""
+        INSERT INTO {table} ({key_column}, {columns}, updated_at)
+        VALUES (%s, {placeholders}, %s)
+        ON DUPLICATE KEY UPDATE {updates}, updated_at = %s;
+        """,
+        (key, *changed.values(), now, *changed.values(), now),
+    )
+
+
+def create_post_stats(cursor, post_id: str) -> None:
+    """Insert an all-zero counter row for a newly created post."""
+    now = datetime.now().isoformat(timespec="seconds")
+    cursor.execute(
+        """
+        INSERT IGNORE INTO PostStats (post_id, reply_count, like_count, repost_count, updated_at)
+        VALUES (%s, 0, 0, 0, %s);
+        """,
+        (post_id, now),
+    )
+
+
+def adjust_post_stats(cursor, post_id: str, replies: int = 0, likes: int = 0, reposts: int = 0) -> None:
+    """Apply counter deltas for a post, creating its row if it is missing."""
+    deltas = {"replies": replies, "likes": likes, "reposts": reposts}
+    changed = {_POST_STAT_COLUMNS[name]: delta for name, delta in deltas.items() if delta}
+    _adjust_counters(cursor, "PostStats", "post_id", post_id, changed)
+
+
+def delete_post_stats(cursor, post_id: str) -> None:
+    """Drop the counter row of a post that is no longer shown anywhere."""
+    cursor.execute("DELETE FROM PostStats WHERE post_id = %s;", (post_id,))
+
+
+def rebuild_post_stats(app: Flask) -> int:
+    """Recompute PostStats from Replies, Reactions and Reposts.
+
+    Returns the number of live posts whose counters were rebuilt.
+    """
+    now = datetime.now().isoformat(timespec="seconds")
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO PostStats (post_id, reply_count, like_count, repost_count, updated_at)
+            SELECT p.post_id,
+                   (
+                       SELECT COUNT(*)
+                       FROM Replies r
+                       WHERE r.parent_post_id = p.post_id
+                         AND r.is_deleted = FALSE
+                   ),
+                   (
+                       SELECT COUNT(DISTINCT rx.user_id)
+                       FROM Reactions rx
+                       JOIN ReactionTypes rt ON rt.reaction_type_id = rx.reaction_type_id
+                       WHERE rx.post_id = p.post_id
+                         AND rx.reply_id IS NULL
+                         AND rt.name = 'like'
+                   ),
+                   (
+                       SELECT COUNT(*)
+                       FROM Reposts rp
+                       WHERE rp.post_id = p.post_id
+                   ),
+                   %s
+            FROM Posts p
+            WHERE p.is_deleted = FALSE
+            ON DUPLICATE KEY UPDATE
+                reply_count = VALUES(reply_count),
+                like_count = VALUES(like_count),
+                repost_count = VALUES(repost_count),
+                updated_at = VALUES(updated_at);
+            """,
+            (now,),
+        )
+        cursor.execute(
+            """
+            DELETE ps
+            FROM PostStats ps
+            JOIN Posts p ON p.post_id = ps.post_id
+            WHERE p.is_deleted = TRUE;
+            """
+        )
+        cursor.execute("SELECT COUNT(*) FROM Posts WHERE is_deleted = FALSE;")
+        rebuilt = int(cursor.fetchone()[0])
+        cursor.close()
+
+    return rebuilt
+
+
+def adjust_reply_stats(cursor, reply_id: str, likes: int = 0) -> None:
+    """Apply a like-count delta for a reply, creating its row if it is missing."""
+    changed = {"like_count": likes} if likes else {}
+    _adjust_counters(cursor, "ReplyStats", "reply_id", reply_id, changed)
+
+
+def rebuild_reply_stats(app: Flask) -> int:
+    """Recompute ReplyStats from Reactions.
+
+    Returns the number of live replies whose counters were rebuilt.
+    """
+    now = datetime.now().isoformat(timespec="seconds")
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO ReplyStats (reply_id, like_count, updated_at)
+            SELECT r.reply_id,
+                   (
+                       SELECT COUNT(DISTINCT rx.user_id)
+                       FROM Reactions rx
+                       JOIN ReactionTypes rt ON rt.reaction_type_id = rx.reaction_type_id
+                       WHERE rx.reply_id = r.reply_id
+                         AND rx.post_id IS NULL
+                         AND rt.name = 'like'
+                   ),
+                   %s
+            FROM Replies r
+            WHERE r.is_deleted = FALSE
+            ON DUPLICATE KEY UPDATE
+                like_count = VALUES(like_count),
+                updated_at = VALUES(updated_at);
+            """,
+            (now,),
+        )
+        cursor.execute("SELECT COUNT(*) FROM Replies WHERE is_deleted = FALSE;")
+        rebuilt = int(cursor.fetchone()[0])
+        cursor.close()
+
+    return rebuilt
+
+
+def adjust_user_stats(
+    cursor,
+    user_id: str,
+    posts: int = 0,
+    followers: int = 0,
+    following: int = 0,
+    unread_notifications: int = 0,
+) -> None:
+    """Apply counter deltas for a user, creating their row if it is missing.
+
+    Any change to the unread notification count also bumps
+    ``notification_version``, which the inbox API uses as its ETag.
+    """
+    deltas = {
+        "posts": posts,
+        "followers": followers,
+        "following": following,
+        "unread_notifications": unread_notifications,
+    }
+    changed = {_USER_STAT_COLUMNS[name]: delta for name, delta in deltas.items() if delta}
+    if unread_notifications:
+        changed["notification_version"] = 1
+    _adjust_counters(cursor, "UserStats", "user_id", user_id, changed)
+
+
+def add_unread_notifications(cursor, counts: dict[str, int]) -> None:
+    """Raise the unread notification count of several users in one statement."""
+    if not counts:
+        return
+
+    now = datetime.now().isoformat(timespec="seconds")
+    # executemany folds this into one multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+    cursor.executemany(
+        """
+        INSERT INTO UserStats (user_id, unread_notification_count, notification_version, updated_at)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            unread_notification_count = unread_notification_count + VALUES(unread_notification_count),
+            notification_version = notification_version + 1,
+            updated_at = VALUES(updated_at);
+        """,
+        [(user_id, count, 1, now) for user_id, count in counts.items() if count > 0],
+    )
+
+
+def rebuild_user_stats(app: Flask) -> int:
+    """Recompute UserStats from Posts, Followers and Notifications.
+
+    Returns the number of users whose stored counters had drifted.
+    """
+    now = datetime.now().isoformat(timespec="seconds")
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+            FROM Users u
+            LEFT JOIN UserStats us ON us.user_id = u.user_id
+            WHERE COALESCE(us.post_count, 0) <> (
+                      SELECT COUNT(*) FROM Posts p WHERE p.user_id = u.user_id AND p.is_deleted = FALSE
+                  )
+               OR COALESCE(us.follower_count, 0) <> (
+                      SELECT COUNT(*) FROM Followers f WHERE f.followed_id = u.user_id
+                  )
+               OR COALESCE(us.following_count, 0) <> (
+                      SELECT COUNT(*) FROM Followers f WHERE f.follower_id = u.user_id
+                  )
+               OR COALESCE(us.unread_notification_count, 0) <> (
+                      SELECT COUNT(*) FROM Notifications n WHERE n.user_id = u.user_id AND n.is_read = FALSE
+                  );
+            """
+        )
+        drifted = int(cursor.fetchone()[0])
+        cursor.execute(
+            """
+            INSERT INTO UserStats (
+                user_id, post_count, follower_count, following_count, unread_notification_count, updated_at
+            )
+            SELECT u.user_id,
+                   (
+                       SELECT COUNT(*)
+                       FROM Posts p
+                       WHERE p.user_id = u.user_id
+                         AND p.is_deleted = FALSE
+                   ),
+                   (
+                       SELECT COUNT(*)
+                       FROM Followers f
+                       WHERE f.followed_id = u.user_id
+                   ),
+                   (
+                       SELECT COUNT(*)
+                       FROM Followers f
+                       WHERE f.follower_id = u.user_id
+                   ),
+                   (
+                       SELECT COUNT(*)
+                       FROM Notifications n
+                       WHERE n.user_id = u.user_id
+                         AND n.is_read = FALSE
+                   ),
+                   %s
+            FROM Users u
+            ON DUPLICATE KEY UPDATE
+                post_count = VALUES(post_count),
+                follower_count = VALUES(follower_count),
+                following_count = VALUES(following_count),
+                notification_version = notification_version
+                    + (unread_notification_count <> VALUES(unread_notification_count)),
+                unread_notification_count = VALUES(unread_notification_count),
+                updated_at = VALUES(updated_at);
+            """,
+            (now,),
+        )
+        cursor.close()
+
+    return drifted
@@ -0,0 +1,86 @@
+"""
+Fan-out-on-write home timelines.
+
+When ``FEED_FANOUT_ENABLED`` is set, every new post is copied into the
+Timelines rows of the author's followers at write time. The followed section
+of the home feed then becomes a single range scan on
+``Timelines(user_id, created_at, post_id)`` instead of a join against
+Followers and Posts. Rows are removed when a post is deleted or when the
+viewer unfollows its author, and a follow backfills the author's most recent
+posts. ``rebuild_timelines`` recomputes the table from Followers and Posts and
+is exposed as the ``flask rebuild-timelines`` command; run it after turning
+fan-out on for an existing database.
+"""
+from __future__ import annotations
+from flask import Flask
+from .db import get_db
+
+
+def fanout_enabled(app: Flask) -> bool:
+    return bool(app.config.get("FEED_FANOUT_ENABLED", False))
+
+
+def fan_out_post(cursor, post_id: str, author_id: str, created_at: str) -> None:
+    """Copy a new post into the timeline of every follower of its author."""
+    cursor.execute(
+        """
+        INSERT IGNORE INTO Timelines (user_id, post_id, author_id, created_at)
+        SELECT f.follower_id, %s, %s, %s
+        FROM Followers f
+        WHERE f.followed_id = %s;
+        """,
+        (post_id, author_id, created_at, author_id),
+    )
+
+
+def remove_post_from_timelines(cursor, post_id: str) -> None:
+    cursor.execute("DELETE FROM Timelines WHERE post_id = %s;", (post_id,))
+
+
+def backfill_author(cursor, follower_id: str, author_id: str, limit: int) -> None:
+    """Copy the author's latest ``limit`` posts into a new follower's timeline.
+
+    Older posts are not copied; the feed shows them in its second section.
+    """
+    cursor.execute(
+        """
+        INSERT IGNORE INTO Timelines (user_id, post_id, author_id, created_at)
+        SELECT %s, p.post_id, p.user_id, p.created_at
+        FROM Posts p
+        WHERE p.user_id = %s
+          AND p.is_deleted = FALSE
+        ORDER BY p.created_at DESC, p.post_id DESC
+        LIMIT %s;
+        """,
+        (follower_id, author_id, max(0, int(limit))),
+    )
+
+
+def prune_author(cursor, follower_id: str, author_id: str) -> None:
+    """Remove an unfollowed author's posts from the follower's timeline."""
+    cursor.execute(
+        "DELETE FROM Timelines WHERE user_id = %s AND author_id = %s;",
+        (follower_id, author_id),
+    )
+
+
+def rebuild_timelines(app: Flask) -> int:
+    """Recompute Timelines from Followers and Posts.
+
+    Returns the number of timeline rows written.
+    """
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM Timelines;")
+        cursor.execute(
+            """
+            INSERT INTO Timelines (user_id, post_id, author_id, created_at)
+            SELECT f.follower_id, p.post_id, p.user_id, p.created_at
+            FROM Followers f
+            JOIN Posts p ON p.user_id = f.followed_id AND p.is_deleted = FALSE;
+            """
+        )
+        rebuilt = cursor.rowcount
+        cursor.close()
+
+    return rebuilt
@@ -34,6 +34,7 @@ CREATE TABLE IF NOT EXISTS Users (
 CREATE INDEX idx_users_profile_media ON Users(profile_media_id);
 CREATE INDEX idx_users_deleted_by ON Users(deleted_by);
 CREATE INDEX idx_users_banned_by ON Users(banned_by);
+CREATE FULLTEXT INDEX ft_users_names ON Users(username, display_name);
 CREATE INDEX idx_users_is_banned ON Users(is_banned);
 
 -- ----------------------------------------------------------
@@ -98,6 +99,9 @@ CREATE INDEX idx_posts_created_at ON Posts(created_at);
 CREATE INDEX idx_posts_deleted_by ON Posts(deleted_by);
 CREATE INDEX idx_posts_replies_closed_by ON Posts(replies_closed_by);
 CREATE INDEX idx_posts_restricted_group ON Posts(restricted_group_id);
+CREATE INDEX idx_posts_feed ON Posts(is_deleted, created_at, post_id);
+CREATE INDEX idx_posts_author_feed ON Posts(user_id, is_deleted, created_at, post_id);
+CREATE FULLTEXT INDEX ft_posts_content ON Posts(content);
 
 -- ----------------------------------------------------------
 
@@ -119,6 +123,7 @@ CREATE INDEX idx_replies_user ON Replies(user_id);
 CREATE INDEX idx_replies_parent_post ON Replies(parent_post_id);
 CREATE INDEX idx_replies_parent_reply ON Replies(parent_reply_id);
 CREATE INDEX idx_replies_created_at ON Replies(created_at);
+CREATE INDEX idx_replies_post_feed ON Replies(parent_post_id, is_deleted, created_at, reply_id);
 
 -- ----------------------------------------------------------
 
@@ -176,6 +181,8 @@ CREATE INDEX idx_reactions_user ON Reactions(user_id);
 CREATE INDEX idx_reactions_post ON Reactions(post_id);
 CREATE INDEX idx_reactions_reply ON Reactions(reply_id);
 CREATE INDEX idx_reactions_type ON Reactions(reaction_type_id);
+CREATE UNIQUE INDEX uq_reactions_user_post_type ON Reactions(user_id, post_id, reaction_type_id);
+CREATE UNIQUE INDEX uq_reactions_user_reply_type ON Reactions(user_id, reply_id, reaction_type_id);
 
 -- ----------------------------------------------------------
 
@@ -192,6 +199,36 @@ CREATE INDEX idx_reposts_post ON Reposts(post_id);
 
 -- ----------------------------------------------------------
 
+CREATE TABLE IF NOT EXISTS PostStats (
+    post_id CHAR(36) PRIMARY KEY,
+    reply_count INT NOT NULL DEFAULT 0,
+    like_count INT NOT NULL DEFAULT 0,
+    repost_count INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL
+) ENGINE=InnoDB;
+
+-- ----------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS ReplyStats (
+    reply_id CHAR(36) PRIMARY KEY,
+    like_count INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL
+) ENGINE=InnoDB;
+
+-- ----------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS UserStats (
+    user_id CHAR(36) PRIMARY KEY,
+    post_count INT NOT NULL DEFAULT 0,
+    follower_count INT NOT NULL DEFAULT 0,
+    following_count INT NOT NULL DEFAULT 0,
+    unread_notification_count INT NOT NULL DEFAULT 0,
+    notification_version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL
+) ENGINE=InnoDB;
+
+-- ----------------------------------------------------------
+
 CREATE TABLE IF NOT EXISTS Followers (
     follower_id CHAR(36),
     followed_id CHAR(36),
@@ -202,6 +239,22 @@ CREATE TABLE IF NOT EXISTS Followers (
 
 CREATE INDEX idx_followers_follower ON Followers(follower_id);
 CREATE INDEX idx_followers_followed ON Followers(followed_id);
+CREATE INDEX idx_followers_followed_page ON Followers(followed_id, created_at, follower_id);
+CREATE INDEX idx_followers_follower_page ON Followers(follower_id, created_at, followed_id);
+
+-- ----------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS Timelines (
+    user_id CHAR(36),
+    post_id CHAR(36),
+    author_id CHAR(36) NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (user_id, post_id)
+) ENGINE=InnoDB;
+
+CREATE INDEX idx_timelines_feed ON Timelines(user_id, created_at, post_id);
+CREATE INDEX idx_timelines_author ON Timelines(user_id, author_id);
+CREATE INDEX idx_timelines_post ON Timelines(post_id);
 
 -- ----------------------------------------------------------
 
@@ -211,6 +264,7 @@ CREATE TABLE IF NOT EXISTS Media (
     reply_id CHAR(36) NULL,
     url VARCHAR(500) NOT NULL,
     media_type VARCHAR(50) NOT NULL,
+    renditions JSON NULL,
     is_deleted BOOLEAN DEFAULT FALSE,
     deleted_at DATETIME NULL,
     deleted_by CHAR(36) NULL,
@@ -260,6 +314,8 @@ CREATE INDEX idx_notifications_triggered_by ON Notifications(triggered_by_user_i
 CREATE INDEX idx_notifications_post ON Notifications(post_id);
 CREATE INDEX idx_notifications_reply ON Notifications(reply_id);
 CREATE INDEX idx_notifications_is_read ON Notifications(is_read);
+CREATE INDEX idx_notifications_user_read_created ON Notifications(user_id, is_read, created_at, notification_id);
+CREATE INDEX idx_notifications_user_created ON Notifications(user_id, created_at, notification_id);
 
 -- ----------------------------------------------------------
 
@@ -328,10 +384,24 @@ ALTER TABLE Reposts
   ADD CONSTRAINT fk_reposts_user FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
   ADD CONSTRAINT fk_reposts_post FOREIGN KEY (post_id) REFERENCES Posts(post_id) ON DELETE CASCADE;
 
+ALTER TABLE PostStats
+  ADD CONSTRAINT fk_poststats_post FOREIGN KEY (post_id) REFERENCES Posts(post_id) ON DELETE CASCADE;
+
+ALTER TABLE ReplyStats
+  ADD CONSTRAINT fk_replystats_reply FOREIGN KEY (reply_id) REFERENCES Replies(reply_id) ON DELETE CASCADE;
+
+ALTER TABLE UserStats
+  ADD CONSTRAINT fk_userstats_user FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE;
+
 ALTER TABLE Followers
   ADD CONSTRAINT fk_followers_follower FOREIGN KEY (follower_id) REFERENCES Users(user_id) ON DELETE CASCADE,
   ADD CONSTRAINT fk_followers_followed FOREIGN KEY (followed_id) REFERENCES Users(user_id) ON DELETE CASCADE;
 
+ALTER TABLE Timelines
+  ADD CONSTRAINT fk_timelines_user FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+  ADD CONSTRAINT fk_timelines_post FOREIGN KEY (post_id) REFERENCES Posts(post_id) ON DELETE CASCADE,
+  ADD CONSTRAINT fk_timelines_author FOREIGN KEY (author_id) REFERENCES Users(user_id) ON DELETE CASCADE;
+
 ALTER TABLE Media
   ADD CONSTRAINT fk_media_post FOREIGN KEY (post_id) REFERENCES Posts(post_id) ON DELETE CASCADE,
   ADD CONSTRAINT fk_media_reply FOREIGN KEY (reply_id) REFERENCES Replies(reply_id) ON DELETE CASCADE,
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+
+from pymysql import cursors
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import create_app  # noqa: E402
+from app.db import get_db  # noqa: E402
+from app.groups import add_group_members, eligible_participants  # noqa: E402
+
+
+def _seed_thread(cursor, participants: int, now: str) -> tuple[str, list[str]]:
+    """A post with one comment from each of ``participants`` fresh users."""
+    tag = uuid4().hex[:8]
+    user_ids = [str(uuid4()) for _ in range(participants + 1)]
+    cursor.executemany(
+        """
+        INSERT INTO Users (user_id, username, email, password_hash, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s);
+        """,
+        [
+            (user_id, f"bench_{tag}_{index}", f"bench_{tag}_{index}@example.invalid", "x", now, now)
+            for index, user_id in enumerate(user_ids)
+        ],
+    )
+    post_id = str(uuid4())
+    cursor.execute(
+        "INSERT INTO Posts (post_id, user_id, content, created_at, updated_at) VALUES (%s, %s, %s, %s, %s);",
+        (post_id, user_ids[0], "bench", now, now),
+    )
+    cursor.executemany(
+        """
+        INSERT INTO Replies (reply_id, parent_post_id, user_id, content, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s);
+        """,
+        [(str(uuid4()), post_id, user_id, "bench", now, now) for user_id in user_ids[1:]],
+    )
+    return post_id, user_ids
+
+
+def _create_group(cursor, post_id: str, owner_id: str, now: str) -> str:
+    group_id = str(uuid4())
+    cursor.execute(
+        """
+        INSERT INTO UserGroups (group_id, created_by, origin_post_id, name, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s);
+        """,
+        (group_id, owner_id, post_id, "bench", now, now),
+    )
+    return group_id
+
+
+def _legacy_create(cursor, post_id: str, owner_id: str, selected: list[str], now: str) -> None:
+    cursor.execute(
+        """
+        SELECT DISTINCT r.user_id, COALESCE(u.display_name, u.username, 'Unknown') AS name
+        FROM Replies r
+        LEFT JOIN Users u ON u.user_id = r.user_id
+        WHERE r.parent_post_id = %s
+          AND r.is_deleted = FALSE
+          AND u.is_deleted = FALSE
+          AND r.user_id <> %s;
+        """,
+        (post_id, owner_id),
+    )
+    eligible = {row["user_id"] for row in cursor.fetchall()}
+    group_id = _create_group(cursor, post_id, owner_id, now)
+    for member_id in [owner_id, *[uid for uid in selected if uid in eligible]]:
+        cursor.execute(
+            """
+            INSERT INTO GroupMembers (group_id, user_id, joined_at, updated_at)
+            VALUES (%s, %s, %s, %s);
+            """,
+            (group_id, member_id, now, now),
+        )
+
+
+def _bulk_create(cursor, post_id: str, owner_id: str, selected: list[str], now: str) -> None:
+    eligible = eligible_participants(cursor, post_id, owner_id, selected)
+    group_id = _create_group(cursor, post_id, owner_id, now)
+    add_group_members(cursor, group_id, [owner_id, *[uid for uid in selected if uid in eligible]], now)
+
+
+def _measure(label: str, func, iterations: int) -> None:
+    func()  # warm up
+    timings = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<28} mean {statistics.mean(timings):7.2f} ms   p50 {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Time discussion group creation against the configured database. Everything is rolled back."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    now = datetime.now().isoformat(timespec="seconds")
+    with app.app_context():
+        with get_db(app) as conn:
+            cursor = conn.cursor(cursors.DictCursor)
+            try:
+                for size in args.sizes:
+                    post_id, user_ids = _seed_thread(cursor, size, now)
+                    owner_id, selected = user_ids[0], user_ids[1:]
+                    _measure(
+                        f"{size:>5} per-row INSERTs",
+                        lambda: _legacy_create(cursor, post_id, owner_id, selected, now),
+                        args.iterations,
+                    )
+                    _measure(
+                        f"{size:>5} one INSERT IGNORE",
+                        lambda: _bulk_create(cursor, post_id, owner_id, selected, now),
+                        args.iterations,
+                    )
+            finally:
+                cursor.close()
+                conn.rollback()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
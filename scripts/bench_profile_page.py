@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import create_app  # noqa: E402
+from app.profile import (  # noqa: E402
+    configure_profile_page_cache,
+    get_profile_by_username,
+    is_following,
+    list_followers,
+    list_following,
+    list_recent_posts_for_user,
+    load_profile_page,
+)
+
+
+def _legacy_profile_page(username: str, viewer_id: str | None) -> None:
+    profile = get_profile_by_username(username)
+    if not profile:
+        return
+    list_recent_posts_for_user(profile["user_id"], limit=20)
+    if viewer_id and viewer_id != profile["user_id"]:
+        is_following(viewer_id, profile["user_id"])
+    list_followers(profile["user_id"], limit=20)
+    list_following(profile["user_id"], limit=20)
+
+
+def _measure(label: str, func, iterations: int) -> None:
+    func()  # warm up the connection pool
+    timings = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<28} mean {statistics.mean(timings):7.2f} ms   p50 {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the profile page data paths against the configured database.")
+    parser.add_argument("username", help="Profile to load")
+    parser.add_argument("--viewer", help="Username of the viewing user (default: anonymous)")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.test_request_context():
+        viewer_id = None
+        if args.viewer:
+            viewer = get_profile_by_username(args.viewer)
+            if not viewer:
+                print(f"Unknown viewer: {args.viewer}")
+                return 1
+            viewer_id = viewer["user_id"]
+        if not get_profile_by_username(args.username):
+            print(f"Unknown profile: {args.username}")
+            return 1
+
+        app.config["PROFILE_PAGE_CACHE_TTL_SECONDS"] = 0
+        configure_profile_page_cache(app)
+        _measure("five queries (previous)", lambda: _legacy_profile_page(args.username, viewer_id), args.iterations)
+        _measure("load_profile_page", lambda: load_profile_page(args.username, viewer_id), args.iterations)
+
+        if viewer_id is None:
+            app.config["PROFILE_PAGE_CACHE_TTL_SECONDS"] = 10
+            configure_profile_page_cache(app)
+            _measure("load_profile_page (cached)", lambda: load_profile_page(args.username), args.iterations)
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -51,7 +51,7 @@ docker run -d \
   -e FLASK_ENV=development \
   -v "$(pwd)/app:/code/app" \
   --restart unless-stopped \
-  echo_web:latest
+  echo_web:latest python -m app
 
 echo "Done! Application running on http://localhost:5001"
 docker ps
\ No newline at end of file
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime, timedelta
 from io import BytesIO
 from uuid import uuid4
@@ -265,6 +266,60 @@ def test_toggle_reply_like_authenticated(client):
     assert unlike_payload["likes"] == 0
 
 
+def test_put_and_delete_like_are_idempotent(client):
+    """Repeated PUT/DELETE likes leave a single reaction and an exact count."""
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    post_id = client.post("/api/posts", json={"content": "Idempotent likes"}).get_json()["post_id"]
+    reply_id = client.post(
+        f"/api/posts/{post_id}/comments",
+        json={"content": "Idempotent reply likes"},
+    ).get_json()["reply_id"]
+
+    for url in (f"/api/posts/{post_id}/like", f"/api/replies/{reply_id}/like"):
+        for _ in range(2):
+            resp = client.put(url)
+            assert resp.status_code == 200
+            assert resp.get_json()["isLiked"] is True
+            assert resp.get_json()["likes"] == 1
+        for _ in range(2):
+            resp = client.delete(url)
+            assert resp.status_code == 200
+            assert resp.get_json()["isLiked"] is False
+            assert resp.get_json()["likes"] == 0
+
+    assert client.put("/api/posts/00000000-0000-0000-0000-00000000dead/like").status_code == 404
+
+
+def test_reaction_type_registry_picks_up_new_types(app):
+    """Reaction types added by name resolve from the registry without a query per lookup."""
+    from app.reactions import LIKE, reaction_types
+
+    name = "emoji_" + datetime.now().isoformat(timespec="seconds").replace(":", "")
+    result = app.test_cli_runner().invoke(args=["add-reaction-type", name])
+    assert result.exit_code == 0, result.output
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SELECT name, reaction_type_id FROM ReactionTypes WHERE name IN (%s, %s)", (LIKE, name))
+        stored = {row["name"]: row["reaction_type_id"] for row in cursor.fetchall()}
+        cursor.close()
+
+        assert reaction_types.get(conn, LIKE) == stored[LIKE]
+        # Another worker added the type: an unknown name triggers one reload.
+        reaction_types._ids = {}
+        assert reaction_types.get(conn, name) == stored[name]
+        assert reaction_types.get(conn, "no_such_reaction") is None
+
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ReactionTypes WHERE name = %s", (name,))
+        cursor.close()
+        conn.commit()
+    reaction_types._ids.pop(name, None)
+
+
 def test_create_post_with_image_url_authenticated(app, client):
     """Authenticated user can create post with image URL."""
     suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
@@ -297,6 +352,64 @@ def test_create_post_with_image_url_authenticated(app, client):
     assert media_row["media_type"] == "image"
 
 
+def test_create_comment_records_mentions_and_notifications(app, client):
+    """Mentioned users and the post owner are notified about a new comment."""
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    owner = _register_user(client, suffix + "_owner")
+    assert owner["response"].status_code == 302
+    post_id = client.post("/api/posts", json={"content": "Notify me"}).get_json()["post_id"]
+    _logout_user(client)
+
+    mentioned = _register_user(client, suffix + "_mentioned")
+    assert mentioned["response"].status_code == 302
+    _logout_user(client)
+
+    commenter = _register_user(client, suffix + "_commenter")
+    assert commenter["response"].status_code == 302
+    comment_resp = client.post(
+        f"/api/posts/{post_id}/comments",
+        json={"content": f"Hej @{mentioned['username']}, @{mentioned['username']} och @nobody_{suffix}!"},
+    )
+    assert comment_resp.status_code == 201
+    payload = comment_resp.get_json()
+    reply_id = payload["reply_id"]
+    assert payload["author"]["name"] == "Test User"
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(
+            """
+            SELECT u.username
+            FROM Mentions mn
+            JOIN Users u ON u.user_id = mn.mentioned_user_id
+            WHERE mn.reply_id = %s
+            """,
+            (reply_id,),
+        )
+        mentions = [row["username"] for row in cursor.fetchall()]
+        cursor.execute(
+            """
+            SELECT u.username, n.type, n.post_id, tb.username AS triggered_by
+            FROM Notifications n
+            JOIN Users u ON u.user_id = n.user_id
+            JOIN Users tb ON tb.user_id = n.triggered_by_user_id
+            WHERE n.reply_id = %s
+            ORDER BY n.type
+            """,
+            (reply_id,),
+        )
+        notifications = cursor.fetchall()
+        cursor.close()
+
+    assert mentions == [mentioned["username"]]
+    assert [(row["username"], row["type"]) for row in notifications] == [
+        (mentioned["username"], "mention"),
+        (owner["username"], "reply"),
+    ]
+    assert {row["triggered_by"] for row in notifications} == {commenter["username"]}
+    assert {row["post_id"] for row in notifications} == {post_id}
+
+
 def test_create_comment_with_image_url_authenticated(app, client):
     """Authenticated user can create comment with image URL."""
     suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
@@ -481,6 +594,42 @@ def test_split_discussion_selects_commenters(app, client):
     assert comment_a_content.encode("utf-8") in dashboard_resp.data
     assert comment_b_content.encode("utf-8") in dashboard_resp.data
     assert private_after_split_content.encode("utf-8") not in dashboard_resp.data
+    outsider_card = next(post for post in client.get("/api/feed").get_json()["posts"] if post["id"] == post_id)
+    assert outsider_card["comments"] == 2
+
+    not_creator_resp = client.post(
+        f"/api/groups/{group_id}/members",
+        json={"participant_user_ids": [commenter_b_row["user_id"]]},
+    )
+    assert not_creator_resp.status_code == 403
+
+    _logout_user(client)
+    _login_user(client, owner["username"], owner["password"])
+    add_resp = client.post(
+        f"/api/groups/{group_id}/members",
+        json={"participant_user_ids": [commenter_a_row["user_id"], commenter_b_row["user_id"], commenter_b_row["user_id"]]},
+    )
+    assert add_resp.status_code == 200
+    assert add_resp.get_json()["added"] == 1
+    assert add_resp.get_json()["participant_count"] == 3
+
+    repeat_resp = client.post(
+        f"/api/groups/{group_id}/members",
+        json={"participant_user_ids": [commenter_b_row["user_id"]]},
+    )
+    assert repeat_resp.status_code == 200
+    assert repeat_resp.get_json()["added"] == 0
+    assert repeat_resp.get_json()["participant_count"] == 3
+
+    _logout_user(client)
+    _login_user(client, commenter_b["username"], commenter_b["password"])
+    added_member_reply = client.post(
+        f"/api/posts/{post_id}/comments",
+        json={"content": "Now a member of the split discussion"},
+    )
+    assert added_member_reply.status_code == 201
+    member_dashboard_resp = client.get("/dashboard")
+    assert private_after_split_content.encode("utf-8") in member_dashboard_resp.data
 
 
 def test_echo_visible_on_dashboard(client):
@@ -898,3 +1047,866 @@ def test_dashboard_search_matches_partial_and_exact_keywords(app, client):
     assert exact_resp.status_code == 200
     assert post_content.encode("utf-8") in exact_resp.data
     assert f"@{author['username']}".encode("utf-8") in exact_resp.data
+
+
+def test_post_stats_follow_likes_comments_and_rebuild(app, client):
+    """PostStats counters follow likes/comments and can be rebuilt after drift."""
+    from app.stats import rebuild_post_stats
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_stats"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    create_resp = client.post("/api/posts", json={"content": "Post with counters"})
+    assert create_resp.status_code == 201
+    post_id = create_resp.get_json()["post_id"]
+
+    assert client.post(f"/api/posts/{post_id}/comments", json={"content": "First"}).status_code == 201
+    assert client.post(f"/api/posts/{post_id}/comments", json={"content": "Second"}).status_code == 201
+    assert client.post(f"/api/posts/{post_id}/like").status_code == 200
+
+    def _read_stats():
+        with get_db(app) as conn:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute(
+                "SELECT reply_count, like_count FROM PostStats WHERE post_id = %s",
+                (post_id,),
+            )
+            row = cursor.fetchone()
+            cursor.close()
+        return row
+
+    stats_row = _read_stats()
+    assert stats_row is not None
+    assert stats_row["reply_count"] == 2
+    assert stats_row["like_count"] == 1
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE PostStats SET reply_count = 99, like_count = 42 WHERE post_id = %s",
+            (post_id,),
+        )
+        conn.commit()
+        cursor.close()
+
+    assert rebuild_post_stats(app) >= 1
+    stats_row = _read_stats()
+    assert stats_row["reply_count"] == 2
+    assert stats_row["like_count"] == 1
+
+
+def test_feed_api_pages_with_cursor(app, client, monkeypatch):
+    """Feed API should page through followed and other posts without gaps or duplicates."""
+    monkeypatch.setitem(app.config, "FEED_PAGE_SIZE", 2)
+
+    viewer = _register_user(client, datetime.now().isoformat(timespec="seconds").replace(":", "") + "_pviewer")
+    assert viewer["response"].status_code == 302
+    _logout_user(client)
+    followed = _register_user(client, datetime.now().isoformat(timespec="seconds").replace(":", "") + "_pfollowed")
+    assert followed["response"].status_code == 302
+    _logout_user(client)
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SELECT user_id FROM Users WHERE username = %s", (followed["username"],))
+        followed_id = cursor.fetchone()["user_id"]
+        cursor.execute("SELECT user_id FROM Users WHERE username = %s", (viewer["username"],))
+        viewer_id = cursor.fetchone()["user_id"]
+
+        now = datetime.now().replace(microsecond=0)
+        contents = []
+        for index, author_id in enumerate([followed_id, viewer_id, viewer_id, viewer_id]):
+            created_at = (now - timedelta(minutes=10 - index)).isoformat(timespec="seconds")
+            content = f"paged-post-{index}-{now.timestamp()}"
+            contents.append(content)
+            cursor.execute(
+                """
+                INSERT INTO Posts (post_id, user_id, content, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                (str(uuid4()), author_id, content, created_at, created_at),
+            )
+        conn.commit()
+        cursor.close()
+
+    _login_user(client, viewer["username"], viewer["password"])
+    assert client.post(f"/api/profile/{followed['username']}/follow").status_code == 200
+
+    seen = []
+    next_cursor = None
+    for _ in range(5):
+        url = "/api/feed" if next_cursor is None else f"/api/feed?cursor={next_cursor}"
+        resp = client.get(url)
+        assert resp.status_code == 200
+        payload = resp.get_json()
+        assert len(payload["posts"]) <= 2
+        seen.extend(post["content"] for post in payload["posts"])
+        next_cursor = payload["next_cursor"]
+        if not next_cursor:
+            break
+
+    # Followed author's (oldest) post first, then the rest newest-first.
+    assert seen == [contents[0], contents[3], contents[2], contents[1]]
+
+    bad_resp = client.get("/api/feed?cursor=not-a-cursor")
+    assert bad_resp.status_code == 400
+
+
+def test_feed_fanout_timeline_follows_writes(app, client, monkeypatch):
+    """Fan-out timelines should track new posts, follows, unfollows and deletes."""
+    monkeypatch.setitem(app.config, "FEED_FANOUT_ENABLED", True)
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+
+    author = _register_user(client, suffix + "_tlauthor")
+    assert author["response"].status_code == 302
+    old_resp = client.post("/api/posts", json={"content": f"timeline-old-{suffix}"})
+    assert old_resp.status_code == 201
+    old_post_id = old_resp.get_json()["post_id"]
+    _logout_user(client)
+
+    viewer = _register_user(client, suffix + "_tlviewer")
+    assert viewer["response"].status_code == 302
+    assert client.post(f"/api/profile/{author['username']}/follow").status_code == 200
+    _logout_user(client)
+
+    _login_user(client, author["username"], author["password"])
+    new_resp = client.post("/api/posts", json={"content": f"timeline-new-{suffix}"})
+    assert new_resp.status_code == 201
+    new_post_id = new_resp.get_json()["post_id"]
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT t.post_id
+            FROM Timelines t
+            JOIN Users u ON u.user_id = t.user_id
+            WHERE u.username = %s
+            """,
+            (viewer["username"],),
+        )
+        assert {row[0] for row in cursor.fetchall()} == {old_post_id, new_post_id}
+        cursor.close()
+
+    assert client.post(f"/delete_echo/{old_post_id}").status_code == 302
+    _logout_user(client)
+
+    _login_user(client, viewer["username"], viewer["password"])
+    payload = client.get("/api/feed").get_json()
+    post_ids = [post["post_id"] for post in payload["posts"]]
+    assert post_ids[0] == new_post_id
+    assert old_post_id not in post_ids
+
+    assert client.delete(f"/api/profile/{author['username']}/follow").status_code == 200
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Timelines WHERE post_id = %s", (new_post_id,))
+        assert cursor.fetchone()[0] == 0
+        cursor.close()
+
+
+def test_get_db_reuses_connection_within_request(app):
+    """All get_db blocks in a request share one connection; errors roll back the request."""
+    username = f"rollback_{uuid4().hex[:12]}"
+    now = datetime.now().isoformat(timespec="seconds")
+
+    with app.test_request_context("/"):
+        with get_db(app) as first:
+            cursor = first.cursor()
+            cursor.execute("SELECT @@FOREIGN_KEY_CHECKS")
+            assert cursor.fetchone()[0] == 1
+            cursor.close()
+        with get_db(app) as second:
+            assert second is first
+
+        try:
+            with get_db(app) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO Users (user_id, username, email, password_hash, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    (str(uuid4()), username, f"{username}@example.com", "x", now, now),
+                )
+                cursor.close()
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Users WHERE username = %s", (username,))
+        assert cursor.fetchone()[0] == 0
+        cursor.close()
+
+
+def test_after_commit_callbacks_run_only_after_request_commit(app):
+    """Cache invalidations queued in a request wait for the commit and are dropped on rollback."""
+    from app.db import after_commit, commit_request_db
+
+    calls = []
+    with app.test_request_context("/"):
+        with get_db(app):
+            after_commit(lambda: calls.append("committed"))
+        assert calls == []
+        commit_request_db(app.response_class())
+        assert calls == ["committed"]
+
+        try:
+            with get_db(app):
+                after_commit(lambda: calls.append("rolled back"))
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        commit_request_db(app.response_class())
+        assert calls == ["committed"]
+
+
+def test_cached_user_loader_invalidated_on_profile_update(app, client):
+    """The Flask-Login user cache serves repeat lookups and drops entries on profile changes."""
+    from app.auth import load_cached_user
+    from app.profile import update_profile
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_ucache"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM Users WHERE username = %s", (result["username"],))
+        user_id = cursor.fetchone()[0]
+        cursor.close()
+
+    with app.app_context():
+        first = load_cached_user(user_id)
+        assert first is not None
+        assert load_cached_user(user_id) is first
+
+        assert update_profile(user_id, "Cached Name", None)
+        refreshed = load_cached_user(user_id)
+        assert refreshed is not first
+        assert refreshed.display_name == "Cached Name"
+
+
+def test_search_api_ranks_and_pages_with_memory_backend(app, client, monkeypatch):
+    """Search API should require every term, rank by relevance and page with a cursor."""
+    monkeypatch.setitem(app.config, "SEARCH_BACKEND", "memory")
+    monkeypatch.setitem(app.config, "SEARCH_MEMORY_REFRESH_SECONDS", 0)
+    monkeypatch.setitem(app.config, "SEARCH_PAGE_SIZE", 1)
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_search"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    token = f"rankword{uuid4().hex[:8]}"
+    strong = f"{token} {token} grapefruit"
+    weak = f"{token} grapefruit"
+    for content in (weak, strong, f"{token} only"):
+        assert client.post("/api/posts", json={"content": content}).status_code == 201
+
+    first = client.get(f"/api/search?q={token[:7]}+grapef")
+    assert first.status_code == 200
+    first_payload = first.get_json()
+    assert [row["content"] for row in first_payload["results"]] == [strong]
+    assert first_payload["next_cursor"]
+
+    second = client.get(f"/api/search?q={token[:7]}+grapef&cursor={first_payload['next_cursor']}")
+    second_payload = second.get_json()
+    assert [row["content"] for row in second_payload["results"]] == [weak]
+    assert second_payload["next_cursor"] is None
+
+    users = client.get(f"/api/search?q={result['username']}&type=users").get_json()
+    assert users["results"] == []
+
+    assert client.get("/api/search?q=x&type=groups").status_code == 400
+    assert client.get("/api/search?q=x&cursor=bogus").status_code == 400
+
+
+def test_search_matches_word_prefixes_within_one_field(app, client, monkeypatch):
+    """Terms match word prefixes only, and all of them must match the content or all the author's names."""
+    monkeypatch.setitem(app.config, "SEARCH_BACKEND", "memory")
+    monkeypatch.setitem(app.config, "SEARCH_MEMORY_REFRESH_SECONDS", 0)
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_searchscope"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+    token = f"scopeword{uuid4().hex[:8]}"
+    content = f"{token} grapefruit"
+    assert client.post("/api/posts", json={"content": content}).status_code == 201
+
+    def contents(query):
+        return [row["content"] for row in client.get("/api/search", query_string={"q": query}).get_json()["results"]]
+
+    assert contents(f"{token} grape") == [content]
+    assert contents(f"{token} fruit") == []
+    assert contents(f"{token} {result['username']}") == []
+    assert contents(result["username"]) == [content]
+
+
+def test_feed_reply_previews_and_comments_api_paging(app, client, monkeypatch):
+    """Feed cards show only the latest replies; older ones page in through the comments API."""
+    monkeypatch.setitem(app.config, "REPLY_PREVIEW_LIMIT", 2)
+    monkeypatch.setitem(app.config, "COMMENTS_PAGE_SIZE", 1)
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_previews"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    create_resp = client.post("/api/posts", json={"content": f"preview post {suffix}"})
+    assert create_resp.status_code == 201
+    post_id = create_resp.get_json()["post_id"]
+    user_id = create_resp.get_json()["user_id"]
+
+    now = datetime.now().replace(microsecond=0)
+    contents = [f"reply-{index}-{suffix}" for index in range(4)]
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        for index, content in enumerate(contents):
+            created_at = (now - timedelta(minutes=10 - index)).isoformat(timespec="seconds")
+            cursor.execute(
+                """
+                INSERT INTO Replies (reply_id, parent_post_id, user_id, content, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (str(uuid4()), post_id, user_id, content, created_at, created_at),
+            )
+        conn.commit()
+        cursor.close()
+
+    feed = client.get("/api/feed").get_json()
+    card = next(post for post in feed["posts"] if post["id"] == post_id)
+    assert [comment["content"] for comment in card["commentsList"]] == contents[2:]
+    assert card["olderCommentsCursor"]
+
+    older = client.get(f"/api/posts/{post_id}/comments?cursor={card['olderCommentsCursor']}").get_json()
+    assert [comment["content"] for comment in older["comments"]] == [contents[1]]
+    oldest = client.get(f"/api/posts/{post_id}/comments?cursor={older['next_cursor']}").get_json()
+    assert [comment["content"] for comment in oldest["comments"]] == [contents[0]]
+    assert oldest["next_cursor"] is None
+
+    assert client.get(f"/api/posts/{uuid4()}/comments").status_code == 404
+    assert client.get(f"/api/posts/{post_id}/comments?cursor=bogus").status_code == 400
+
+
+def test_post_fragment_cache_refreshes_after_edit(app, client):
+    """Cached post card fragments must not outlive an edit of the post."""
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_fragments"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    original = f"fragment original {suffix}"
+    create_resp = client.post("/api/posts", json={"content": original})
+    assert create_resp.status_code == 201
+    post_id = create_resp.get_json()["post_id"]
+
+    assert original.encode("utf-8") in client.get("/dashboard").data
+    assert original.encode("utf-8") in client.get("/dashboard").data
+
+    edited = f"fragment edited {suffix}"
+    edit_resp = client.post(f"/edit_echo/{post_id}", json={"content": edited})
+    assert edit_resp.get_json()["success"] is True
+
+    body = client.get("/dashboard").data
+    assert edited.encode("utf-8") in body
+    assert original.encode("utf-8") not in body
+
+
+def test_login_returns_503_when_password_hash_pool_is_saturated(app, client, monkeypatch):
+    """A full Argon2 queue should shed login load with 503 instead of blocking."""
+    from app.hashing import PasswordHashPool
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_hashpool"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+    _logout_user(client)
+
+    monkeypatch.setitem(app.extensions, "password_hash_pool", PasswordHashPool(workers=0, queue_depth=0))
+    resp = client.post(
+        "/login",
+        data={"username": result["username"], "password": result["password"]},
+        follow_redirects=False,
+    )
+    assert resp.status_code == 503
+    assert resp.headers.get("Retry-After") == "5"
+
+    monkeypatch.setitem(app.extensions, "password_hash_pool", PasswordHashPool(workers=1, queue_depth=2))
+    resp = client.post(
+        "/login",
+        data={"username": result["username"], "password": result["password"]},
+        follow_redirects=False,
+    )
+    assert resp.status_code == 302
+
+
+def test_login_rehashes_password_made_with_old_argon2_parameters(app, client, monkeypatch):
+    """Raising the configured Argon2 cost should upgrade stored hashes on the next login."""
+    from app.hashing import PasswordHashPool
+
+    weak_params = {"time_cost": 1, "memory_cost": 8192, "parallelism": 1}
+    strong_params = {"time_cost": 2, "memory_cost": 16384, "parallelism": 1}
+
+    monkeypatch.setitem(app.extensions, "password_hash_pool", PasswordHashPool(workers=0, params=weak_params))
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_rehash"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+    _logout_user(client)
+
+    def _stored_hash():
+        with get_db(app) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT password_hash FROM Users WHERE username = %s;", (result["username"],))
+            row = cursor.fetchone()
+            cursor.close()
+        return row[0]
+
+    assert "m=8192,t=1,p=1" in _stored_hash()
+
+    monkeypatch.setitem(app.extensions, "password_hash_pool", PasswordHashPool(workers=0, params=strong_params))
+    _login_user(client, result["username"], result["password"])
+    assert "m=16384,t=2,p=1" in _stored_hash()
+
+    _logout_user(client)
+    resp = client.post(
+        "/login",
+        data={"username": result["username"], "password": result["password"]},
+        follow_redirects=False,
+    )
+    assert resp.status_code == 302
+    assert "m=16384,t=2,p=1" in _stored_hash()
+
+
+def test_profile_picture_is_processed_by_background_pipeline(app, client, monkeypatch, tmp_path):
+    """With workers, the upload returns before the avatar is swapped in by the pipeline."""
+    from pathlib import Path
+    from app.images import ImagePipeline
+
+    pipeline = ImagePipeline(app, tmp_path / "queue", workers=1)
+    monkeypatch.setitem(app.extensions, "image_pipeline", pipeline)
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_imgjob"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    image_io = BytesIO()
+    Image.new("RGB", (1024, 768), color=(10, 200, 80)).save(image_io, format="PNG")
+    image_io.seek(0)
+    resp = client.post(
+        "/profile/picture",
+        data={"profile_picture": (image_io, "avatar.png")},
+        content_type="multipart/form-data",
+        follow_redirects=False,
+    )
+    assert resp.status_code == 302
+
+    pipeline.wait()
+    assert list((tmp_path / "queue").iterdir()) == []
+    assert pipeline._latest_job_by_user == {}
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(
+            """
+            SELECT m.url, m.renditions
+            FROM Users u
+            JOIN Media m ON m.media_id = u.profile_media_id
+            WHERE u.username = %s
+            LIMIT 1
+            """,
+            (result["username"],),
+        )
+        row = cursor.fetchone()
+        cursor.close()
+
+    assert row is not None
+    assert row["url"].endswith(".webp")
+    stored = Path(app.static_folder) / row["url"].split("/static/", 1)[1]
+    with Image.open(stored) as processed:
+        assert max(processed.size) == app.config["PROFILE_IMAGE_MAX_DIMENSION"]
+
+    renditions = json.loads(row["renditions"])
+    assert sorted(item["width"] for item in renditions) == [48, 96, 192, 512]
+    assert row["url"] in [item["url"] for item in renditions]
+    for item in renditions:
+        with Image.open(Path(app.static_folder) / item["url"].split("/static/", 1)[1]) as rendition:
+            assert rendition.width == item["width"]
+
+    page = client.get(f"/profile/{result['username']}")
+    assert b"48w" in page.data and b"512w" in page.data
+
+    media_resp = client.get(row["url"])
+    assert media_resp.status_code == 200
+    assert "immutable" in media_resp.headers["Cache-Control"]
+    assert "max-age=31536000" in media_resp.headers["Cache-Control"]
+    etag = media_resp.headers["ETag"]
+    assert etag.strip('"') == row["url"].rsplit("/", 1)[-1].split(".")[0]
+    assert client.get(row["url"], headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_gc_media_removes_only_unreferenced_uploads(app, client):
+    """Content-addressed uploads are deduplicated and garbage-collected once unreferenced."""
+    from pathlib import Path
+    from app.images import collect_unreferenced_media
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_gcmedia"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    image_io = BytesIO()
+    Image.new("RGB", (300, 300), color=(200, 30, 30)).save(image_io, format="PNG")
+    image_bytes = image_io.getvalue()
+    for _ in range(2):
+        resp = client.post(
+            "/profile/picture",
+            data={"profile_picture": (BytesIO(image_bytes), "avatar.png")},
+            content_type="multipart/form-data",
+            follow_redirects=False,
+        )
+        assert resp.status_code == 302
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(
+            """
+            SELECT m.url
+            FROM Users u
+            JOIN Media m ON m.media_id = u.profile_media_id
+            WHERE u.username = %s
+            """,
+            (result["username"],),
+        )
+        url = cursor.fetchone()["url"]
+        cursor.close()
+
+    upload_dir = Path(app.static_folder) / app.config["PROFILE_IMAGE_UPLOAD_SUBDIR"]
+    referenced = upload_dir / url.rsplit("/", 1)[-1]
+    orphan = upload_dir / ("0" * 32 + ".webp")
+    orphan.write_bytes(b"orphan")
+
+    removed, _ = collect_unreferenced_media(app, min_age_seconds=3600)
+    assert orphan.exists()
+
+    removed, _ = collect_unreferenced_media(app, min_age_seconds=0)
+    assert removed >= 1
+    assert not orphan.exists()
+    assert referenced.exists()
+
+
+def test_update_profile_picture_rejects_oversize_and_oversized_dimensions(app, client, monkeypatch):
+    """Uploads over the byte limit or the pixel limit are refused before any decoding."""
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "") + "_uploadlimit"
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+
+    image_io = BytesIO()
+    Image.new("RGB", (1024, 1024), color=(0, 120, 255)).save(image_io, format="PNG")
+    image_bytes = image_io.getvalue()
+
+    monkeypatch.setitem(app.config, "PROFILE_IMAGE_MAX_BYTES", len(image_bytes) - 1)
+    resp = client.post(
+        "/profile/picture",
+        data={"profile_picture": (BytesIO(image_bytes + b"\0" * (128 * 1024)), "avatar.png")},
+        content_type="multipart/form-data",
+        follow_redirects=False,
+    )
+    assert resp.status_code == 302
+    resp = client.post(
+        "/profile/picture",
+        data={"profile_picture": (BytesIO(image_bytes), "avatar.png")},
+        content_type="multipart/form-data",
+        follow_redirects=False,
+    )
+    assert resp.status_code == 302
+
+    monkeypatch.setitem(app.config, "PROFILE_IMAGE_MAX_BYTES", 5 * 1024 * 1024)
+    monkeypatch.setitem(app.config, "PROFILE_IMAGE_MAX_PIXELS", 512 * 512)
+    resp = client.post(
+        "/profile/picture",
+        data={"profile_picture": (BytesIO(image_bytes), "avatar.png")},
+        content_type="multipart/form-data",
+        follow_redirects=False,
+    )
+    assert resp.status_code == 302
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(
+            "SELECT profile_media_id FROM Users WHERE username = %s LIMIT 1",
+            (result["username"],),
+        )
+        row = cursor.fetchone()
+        cursor.close()
+
+    assert row is not None
+    assert row["profile_media_id"] is None
+
+
+def test_user_stats_follow_posts_and_rebuild(app, client):
+    """UserStats counters follow posts and follows and are repaired after drift."""
+    from app.stats import rebuild_user_stats
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    followed = _register_user(client, suffix + "_ustat_a")
+    assert followed["response"].status_code == 302
+    create_resp = client.post("/api/posts", json={"content": "Counted post"})
+    assert create_resp.status_code == 201
+    assert client.post("/api/posts", json={"content": "Deleted post"}).status_code == 201
+    deleted_id = client.get("/api/feed").get_json()["posts"][0]["id"]
+    assert client.post(f"/delete_echo/{deleted_id}").status_code == 302
+    _logout_user(client)
+
+    follower = _register_user(client, suffix + "_ustat_b")
+    assert follower["response"].status_code == 302
+    assert client.post(f"/api/profile/{followed['username']}/follow").status_code == 200
+    assert client.post(f"/api/profile/{followed['username']}/follow").status_code == 200
+
+    def _counts(username):
+        payload = client.get(f"/api/profile/{username}").get_json()
+        return payload["posts_count"], payload["followers_count"], payload["following_count"]
+
+    assert _counts(followed["username"]) == (1, 1, 0)
+    assert _counts(follower["username"]) == (0, 0, 1)
+
+    assert client.delete(f"/api/profile/{followed['username']}/follow").status_code == 200
+    assert _counts(followed["username"]) == (1, 0, 0)
+    assert _counts(follower["username"]) == (0, 0, 0)
+
+    with get_db(app) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE UserStats us
+            JOIN Users u ON u.user_id = us.user_id
+            SET us.post_count = 7, us.follower_count = 3
+            WHERE u.username = %s
+            """,
+            (followed["username"],),
+        )
+        conn.commit()
+        cursor.close()
+    assert _counts(followed["username"]) == (7, 3, 0)
+
+    assert rebuild_user_stats(app) >= 1
+    assert _counts(followed["username"]) == (1, 0, 0)
+
+
+def test_load_profile_page_matches_individual_queries(app, client):
+    """The combined profile loader returns what the per-section queries return."""
+    from app.profile import (
+        configure_profile_page_cache,
+        get_profile_by_username,
+        is_following,
+        list_followers,
+        list_following,
+        list_recent_posts_for_user,
+        load_profile_page,
+    )
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    author = _register_user(client, suffix + "_page_a")
+    assert author["response"].status_code == 302
+    for content in ("First profile post", "Second profile post"):
+        assert client.post("/api/posts", json={"content": content}).status_code == 201
+    _logout_user(client)
+
+    viewer = _register_user(client, suffix + "_page_b")
+    assert viewer["response"].status_code == 302
+    assert client.post(f"/api/profile/{author['username']}/follow").status_code == 200
+
+    with app.test_request_context():
+        viewer_id = get_profile_by_username(viewer["username"])["user_id"]
+        page = load_profile_page(author["username"], viewer_id)
+        profile = get_profile_by_username(author["username"])
+
+        assert page["profile"] == profile
+        assert page["viewer_is_following"] is is_following(viewer_id, profile["user_id"]) is True
+        assert [post["post_id"] for post in page["recent_posts"]] == [
+            post["post_id"] for post in list_recent_posts_for_user(profile["user_id"])
+        ]
+        assert [user["user_id"] for user in page["followers"]] == [
+            user["user_id"] for user in list_followers(profile["user_id"])
+        ] == [viewer_id]
+        assert [user["user_id"] for user in page["following"]] == [
+            user["user_id"] for user in list_following(profile["user_id"])
+        ] == []
+        assert load_profile_page("no_such_user_" + suffix, viewer_id) is None
+
+    app.config["PROFILE_PAGE_CACHE_TTL_SECONDS"] = 60
+    configure_profile_page_cache(app)
+    try:
+        with app.test_request_context():
+            anonymous_page = load_profile_page(author["username"])
+            assert anonymous_page["viewer_is_following"] is False
+            assert load_profile_page(author["username"]) is anonymous_page
+            assert load_profile_page(author["username"], viewer_id) is not anonymous_page
+    finally:
+        app.config["PROFILE_PAGE_CACHE_TTL_SECONDS"] = 0
+        configure_profile_page_cache(app)
+
+    resp = client.get(f"/profile/{author['username']}")
+    assert resp.status_code == 200
+    assert b"Second profile post" in resp.data
+
+
+def test_follower_list_api_pages_with_cursor(app, client, monkeypatch):
+    """Follower lists page through every follower exactly once."""
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    followed = _register_user(client, suffix + "_fpage_a")
+    assert followed["response"].status_code == 302
+    _logout_user(client)
+
+    follower_names = []
+    for index in range(3):
+        follower = _register_user(client, f"{suffix}_fpage_{index}")
+        assert follower["response"].status_code == 302
+        assert client.post(f"/api/profile/{followed['username']}/follow").status_code == 200
+        follower_names.append(follower["username"])
+        _logout_user(client)
+
+    monkeypatch.setitem(app.config, "FOLLOW_PAGE_SIZE", 2)
+    first = client.get(f"/api/profile/{followed['username']}/followers")
+    assert first.status_code == 200
+    first_page = first.get_json()
+    assert len(first_page["followers"]) == 2
+    assert first_page["next_cursor"]
+
+    second = client.get(
+        f"/api/profile/{followed['username']}/followers",
+        query_string={"cursor": first_page["next_cursor"]},
+    )
+    assert second.status_code == 200
+    second_page = second.get_json()
+    assert second_page["next_cursor"] is None
+
+    listed = [user["username"] for user in first_page["followers"] + second_page["followers"]]
+    assert sorted(listed) == sorted(follower_names)
+
+    following = client.get(f"/api/profile/{follower_names[0]}/following").get_json()
+    assert [user["username"] for user in following["following"]] == [followed["username"]]
+
+    bad = client.get(f"/api/profile/{followed['username']}/followers", query_string={"cursor": "not-a-cursor"})
+    assert bad.status_code == 400
+    assert client.get(f"/api/profile/no_such_user_{suffix}/followers").status_code == 404
+
+
+def test_notification_inbox_polling_and_mark_read(app, client):
+    """The inbox answers unchanged polls with 304 and tracks the unread count."""
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    owner = _register_user(client, suffix + "_inbox_owner")
+    assert owner["response"].status_code == 302
+    post_id = client.post("/api/posts", json={"content": "Inbox post"}).get_json()["post_id"]
+    _logout_user(client)
+
+    commenter = _register_user(client, suffix + "_inbox_commenter")
+    assert commenter["response"].status_code == 302
+    for content in ("First reply", "Second reply"):
+        assert client.post(f"/api/posts/{post_id}/comments", json={"content": content}).status_code == 201
+    _logout_user(client)
+
+    _login_user(client, owner["username"], owner["password"])
+    resp = client.get("/api/notifications")
+    assert resp.status_code == 200
+    payload = resp.get_json()
+    assert payload["unread_count"] == 2
+    assert [item["type"] for item in payload["notifications"]] == ["reply", "reply"]
+    assert payload["notifications"][0]["actor"]["username"] == commenter["username"]
+    etag = resp.headers["ETag"]
+
+    assert client.get("/api/notifications", headers={"If-None-Match": etag}).status_code == 304
+
+    since_resp = client.get("/api/notifications", query_string={"since": payload["since"]})
+    assert since_resp.status_code == 200
+    assert since_resp.get_json()["notifications"] == []
+
+    first_id = payload["notifications"][0]["id"]
+    read_resp = client.post("/api/notifications/read", json={"ids": [first_id]})
+    assert read_resp.get_json() == {"updated": 1, "unread_count": 1}
+    assert client.post("/api/notifications/read", json={"ids": [first_id]}).get_json()["updated"] == 0
+
+    resp = client.get("/api/notifications", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.get_json()["unread_count"] == 1
+    unread = client.get("/api/notifications", query_string={"unread": "1"}).get_json()
+    assert [item["id"] for item in unread["notifications"]] == [payload["notifications"][1]["id"]]
+
+    assert client.post("/api/notifications/read", json={}).get_json() == {"updated": 1, "unread_count": 0}
+    assert client.get("/api/notifications", query_string={"cursor": "bogus"}).status_code == 400
+
+
+def test_event_stream_pushes_likes_and_caps_connections(app, client, monkeypatch):
+    """Likes reach open streams after commit; extra streams get a 503."""
+    from app.events import EventBroker
+
+    monkeypatch.setitem(app.extensions, "event_broker", EventBroker(max_streams=1, queue_size=10))
+    monkeypatch.setitem(app.config, "EVENT_STREAM_MAX_SECONDS", 1)
+    monkeypatch.setitem(app.config, "EVENT_STREAM_HEARTBEAT_SECONDS", 1)
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    result = _register_user(client, suffix)
+    assert result["response"].status_code == 302
+    post_id = client.post("/api/posts", json={"content": "Live post"}).get_json()["post_id"]
+
+    stream = client.get("/api/stream", buffered=False)
+    assert stream.status_code == 200
+    assert stream.mimetype == "text/event-stream"
+    assert client.get("/api/stream").status_code == 503
+
+    assert client.put(f"/api/posts/{post_id}/like").status_code == 200
+    assert client.put(f"/api/posts/{post_id}/like").status_code == 200  # no change, no event
+
+    body = b"".join(stream.response).decode()
+    stream.close()
+    assert body.count("event: like") == 1
+    assert f'"post_id":"{post_id}","likes":1' in body
+    reopened = client.get("/api/stream", buffered=False)
+    assert reopened.status_code == 200
+    reopened.close()
+
+
+def test_event_stream_keeps_split_thread_comments_from_non_members(app, client, monkeypatch):
+    """Comments in a split-off thread reach the owner's stream but not a non-member's."""
+    from app.events import EventBroker
+
+    monkeypatch.setitem(app.extensions, "event_broker", EventBroker(max_streams=2, queue_size=10))
+    monkeypatch.setitem(app.config, "EVENT_STREAM_MAX_SECONDS", 1)
+    monkeypatch.setitem(app.config, "EVENT_STREAM_HEARTBEAT_SECONDS", 1)
+
+    suffix = datetime.now().isoformat(timespec="seconds").replace(":", "")
+    owner = _register_user(client, suffix + "_sse_owner")
+    assert owner["response"].status_code == 302
+    post_id = client.post("/api/posts", json={"content": "Split live thread"}).get_json()["post_id"]
+
+    member_client = app.test_client()
+    member = _register_user(member_client, suffix + "_sse_member")
+    assert member["response"].status_code == 302
+    assert member_client.post(f"/api/posts/{post_id}/comments", json={"content": "Before split"}).status_code == 201
+
+    with get_db(app) as conn:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SELECT user_id FROM Users WHERE username = %s", (member["username"],))
+        member_id = cursor.fetchone()["user_id"]
+        cursor.close()
+    split_resp = client.post(
+        f"/api/posts/{post_id}/discussion-groups",
+        json={"name": "Live split", "participant_user_ids": [member_id]},
+    )
+    assert split_resp.status_code == 201
+
+    outsider_client = app.test_client()
+    assert _register_user(outsider_client, suffix + "_sse_outsider")["response"].status_code == 302
+
+    owner_stream = client.get("/api/stream", buffered=False)
+    outsider_stream = outsider_client.get("/api/stream", buffered=False)
+    assert owner_stream.status_code == 200
+    assert outsider_stream.status_code == 200
+
+    assert member_client.post(f"/api/posts/{post_id}/comments", json={"content": "After split"}).status_code == 201
+
+    owner_body = b"".join(owner_stream.response).decode()
+    outsider_body = b"".join(outsider_stream.response).decode()
+    owner_stream.close()
+    outsider_stream.close()
+    assert "event: comment" in owner_body
+    assert "event: comment" not in outsider_body
+    assert member_id not in outsider_body
@@ -53,6 +53,12 @@ def clean_db(app):
         cursor = conn.cursor()
         # Clean tables in reverse order of foreign key dependencies
         cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        cursor.execute("DELETE FROM Timelines WHERE 1=1")
+        cursor.execute("DELETE FROM Notifications WHERE 1=1")
+        cursor.execute("DELETE FROM Mentions WHERE 1=1")
+        cursor.execute("DELETE FROM PostStats WHERE 1=1")
+        cursor.execute("DELETE FROM ReplyStats WHERE 1=1")
+        cursor.execute("DELETE FROM UserStats WHERE 1=1")
         cursor.execute("DELETE FROM Posts WHERE 1=1")
         cursor.execute("DELETE FROM Media WHERE 1=1")
         cursor.execute("DELETE FROM Users WHERE user_id != '00000000-0000-0000-0000-000000000000'")